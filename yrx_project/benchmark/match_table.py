@@ -0,0 +1,183 @@
+import argparse
+import datetime
+import gc
+import itertools
+import json
+import os
+import subprocess
+import time
+import tracemalloc
+import typing
+
+from yrx_project.benchmark.workload import generate_match_workload
+from yrx_project.const import PROJECT_PATH, FULL_TIME_FORMATTER
+from yrx_project.scene.match_table.cache import match_cache
+from yrx_project.scene.match_table.const import ADD_COL_OPTION, MAKEUP_MAIN_COL, MAKEUP_MAIN_COL_WITH_OVERWRITE
+from yrx_project.scene.match_table.main import match_table, MATCH_FUNC_MAP, STR_EQUAL, STR_CONTAINED, STR_SIMILAR
+from yrx_project.utils.string_util import IGNORE_NOTHING, IGNORE_PUNC, IGNORE_CHINESE_PAREN, IGNORE_ENGLISH_PAREN
+
+# 基准测试的结果：每个用例一行 json，带上代码的版本（git commit），用于对比不同提交之间的性能
+RESULT_PATH = os.path.join(PROJECT_PATH, "benchmark_results.jsonl")
+
+DEFAULT_SIZES = [1000, 10000, 100000]  # 主表行数，最大可以到 1000000
+MATCH_MODES = [STR_EQUAL, STR_CONTAINED, STR_SIMILAR]
+IGNORE_POLICIES = {
+    "不忽略": [IGNORE_NOTHING],
+    "标点": [IGNORE_PUNC],
+    "中文括号": [IGNORE_CHINESE_PAREN],
+    "英文括号": [IGNORE_ENGLISH_PAREN],
+    "全部": [IGNORE_CHINESE_PAREN, IGNORE_ENGLISH_PAREN, IGNORE_PUNC],
+}
+CATCH_MODES = {
+    "不增加列": [],
+    ADD_COL_OPTION: [["出版社", ADD_COL_OPTION], ["作者", ADD_COL_OPTION], ["价格", ADD_COL_OPTION]],
+    MAKEUP_MAIN_COL: [["出版社", MAKEUP_MAIN_COL, "出版社"]],
+    MAKEUP_MAIN_COL_WITH_OVERWRITE: [["出版社", MAKEUP_MAIN_COL_WITH_OVERWRITE, "出版社"]],
+}
+
+
+def get_git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_PATH, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return ""
+
+
+def build_conditions(helper_df, match_mode: str, ignore_policy: str, catch_mode: str, condition_count=1) -> typing.List[dict]:
+    """condition_count 个条件使用同一个辅助表（id 不同），用于测试多个条件的并行"""
+    return [{
+        "id": "辅助表" if condition_count == 1 else f"辅助表{i + 1}",
+        "df": helper_df,
+        "match_cols": [{"main_col": "书名", "match_col": "书名"}],
+        "catch_cols": CATCH_MODES[catch_mode],
+        "match_func": MATCH_FUNC_MAP[match_mode],
+        "match_ignore_policy": IGNORE_POLICIES[ignore_policy],
+        "match_detail_text": "匹配到｜未匹配到｜无内容",
+    } for i in range(condition_count)]
+
+
+def run_case(
+        main_df, helper_df, match_mode: str, ignore_policy: str, catch_mode: str, repeat=1, use_multiprocessing=False, condition_count=1
+) -> dict:
+    """执行一个用例：先计时执行 repeat 次（取最快的一次），再用 tracemalloc 执行一次统计内存峰值
+    辅助表没有 cache_key，每次都完整地预处理、建索引和匹配
+    """
+    conditions = build_conditions(helper_df, match_mode, ignore_policy, catch_mode, condition_count)
+
+    def run():
+        match_cache.clear()
+        gc.collect()
+        start = time.perf_counter()
+        _, overall_match_info, _ = match_table(main_df, conditions, use_multiprocessing=use_multiprocessing)
+        return time.perf_counter() - start, overall_match_info
+
+    time_costs = []
+    overall_match_info = {}
+    for _ in range(repeat):
+        time_cost, overall_match_info = run()
+        time_costs.append(time_cost)
+
+    # tracemalloc 会拖慢执行，内存单独统计（numpy 和 pandas 的内存分配也会被统计到）
+    tracemalloc.start()
+    try:
+        run()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    time_cost = min(time_costs)
+    return {
+        "main_rows": len(main_df),
+        "helper_rows": len(helper_df),
+        "match_mode": match_mode,
+        "ignore_policy": ignore_policy,
+        "catch_mode": catch_mode,
+        "condition_count": condition_count,
+        "use_multiprocessing": use_multiprocessing,
+        "time_cost": round(time_cost, 4),
+        "rows_per_sec": round(len(main_df) / time_cost, 1) if time_cost else None,
+        "peak_memory_mb": round(peak_memory / 1024 / 1024, 2),
+        "matched_rows": overall_match_info.get("union_set_length"),
+    }
+
+
+def get_case_key(result: dict) -> tuple:
+    return result["main_rows"], result["helper_rows"], result["match_mode"], result["ignore_policy"], result["catch_mode"], \
+        result.get("condition_count", 1), result["use_multiprocessing"]
+
+
+def load_results(path=RESULT_PATH) -> typing.List[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def append_results(results: typing.List[dict], path=RESULT_PATH):
+    with open(path, "a", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+def run_benchmark(
+        sizes: typing.List[int] = None, match_modes: typing.List[str] = None, ignore_policies: typing.List[str] = None,
+        catch_modes: typing.List[str] = None, repeat=1, use_multiprocessing=False, seed=0, helper_rows: int = None,
+        result_path=RESULT_PATH, print_func: typing.Callable[[str], None] = print, condition_count=1,
+) -> typing.List[dict]:
+    """按 主表行数 x 匹配方式 x 忽略规则 x 增加列的方式 执行所有用例，结果追加到 result_path
+    和结果文件中其他提交的同一个用例对比（取最近的一次）
+    :param helper_rows: 辅助表的行数，默认随主表的行数变化（见 generate_match_workload）
+    :param condition_count: 每个用例的条件个数
+    """
+    sizes = sizes or DEFAULT_SIZES
+    commit = get_git_commit()
+    previous = {}  # 用例 -> 其他提交最近的一次结果
+    for result in load_results(result_path):
+        if result.get("commit") != commit:
+            previous[get_case_key(result)] = result
+
+    results = []
+    run_at = datetime.datetime.now().strftime(FULL_TIME_FORMATTER)
+    for size in sizes:
+        main_df, helper_df = generate_match_workload(size, helper_rows, seed)
+        size_results = []
+        for match_mode, ignore_policy, catch_mode in itertools.product(
+                match_modes or MATCH_MODES, ignore_policies or list(IGNORE_POLICIES), catch_modes or list(CATCH_MODES)
+        ):
+            result = run_case(main_df, helper_df, match_mode, ignore_policy, catch_mode, repeat, use_multiprocessing, condition_count)
+            result.update({"commit": commit, "run_at": run_at, "seed": seed})
+            size_results.append(result)
+
+            compare = ""
+            last = previous.get(get_case_key(result))
+            if last and last.get("time_cost"):
+                compare = f"  对比 {last.get('commit') or '未知版本'}：{round(last['time_cost'] / result['time_cost'], 2)}x"
+            print_func(
+                f"{size}行 {condition_count}个条件 {match_mode} {ignore_policy} {catch_mode}："
+                f"{result['time_cost']}s，{result['rows_per_sec']}行/s，内存峰值 {result['peak_memory_mb']}MB{compare}"
+            )
+        # 每个行数执行完就写入，大数据量的用例中途中断时，之前的结果不会丢失
+        append_results(size_results, result_path)
+        results.extend(size_results)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="表匹配的基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="主表行数")
+    parser.add_argument("--modes", nargs="+", choices=MATCH_MODES, help="匹配方式，默认全部")
+    parser.add_argument("--policies", nargs="+", choices=list(IGNORE_POLICIES), help="忽略规则，默认全部")
+    parser.add_argument("--catch", nargs="+", choices=list(CATCH_MODES), help="增加列的方式，默认全部")
+    parser.add_argument("--repeat", type=int, default=1, help="每个用例计时的次数（取最快的一次）")
+    parser.add_argument("--multiprocessing", action="store_true", help="是否启用多进程匹配")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--helper-rows", type=int, help="辅助表行数，默认是主表的 1/5")
+    parser.add_argument("--conditions", type=int, default=1, help="每个用例的条件个数")
+    parser.add_argument("--output", default=RESULT_PATH, help="结果文件")
+    args = parser.parse_args()
+    run_benchmark(
+        args.sizes, args.modes, args.policies, args.catch, args.repeat, args.multiprocessing, args.seed, args.helper_rows, args.output,
+        condition_count=args.conditions,
+    )
@@ -0,0 +1,125 @@
+import os
+import typing
+
+import numpy as np
+import pandas as pd
+
+# 合成数据的素材：书名由 主题 + 副标题 + 后缀 组成，再随机加上版次（中英文括号）和标点、空格
+TITLE_SUBJECTS = [
+    "高等数学", "线性代数", "概率论与数理统计", "数据结构", "操作系统", "计算机网络", "编译原理", "宏观经济学", "微观经济学",
+    "国际贸易", "会计学原理", "管理学", "市场营销", "刑法学", "民法总论", "宪法学", "中国近代史", "世界通史", "西方哲学史",
+    "社会学概论", "心理学导论", "有机化学", "无机化学", "分子生物学", "细胞生物学", "大学物理", "量子力学", "材料力学",
+    "机械设计", "电路分析", "信号与系统", "自动控制原理", "数字图像处理", "机器学习", "人工智能", "统计学习方法",
+]
+TITLE_SUFFIXES = ["", "教程", "基础", "导论", "原理与应用", "习题集", "案例分析", "实验指导", "简明教程", "学习指导"]
+TITLE_EDITIONS = ["", "", "", "（第2版）", "（第3版）", "(第4版)", "（英文版）", "(修订版)"]
+TITLE_SEPARATORS = ["", "", "", "：", "，", " ", "——", "·"]
+PUBLISHERS = [
+    "北京大学出版社", "清华大学出版社", "高等教育出版社", "人民出版社", "科学出版社", "机械工业出版社", "电子工业出版社",
+    "中国人民大学出版社", "复旦大学出版社", "上海交通大学出版社", "Springer", "Elsevier", "Wiley", "Pearson",
+]
+SUBTITLE_CHAR_RANGE = (0x4E00, 0x5A00)  # 副标题的汉字范围（常用汉字）
+AUTHORS = ["张伟", "王芳", "李娜", "刘洋", "陈静", "杨磊", "赵敏", "黄强", "周杰", "吴婷", "徐明", "孙丽"]
+
+EMPTY_RATIO = 0.03  # 空单元格的比例
+DISTINCT_RATIO = 0.3  # 书名去重后的个数 / 行数（同一本书在表中重复出现）
+HELPER_OVERLAP_RATIO = 0.7  # 辅助表的书名中，和主表相同（或者只差标点、括号）的比例
+
+
+def generate_titles(count: int, rng: np.random.Generator) -> np.ndarray:
+    """生成 count 个书名：主题 + 分隔符 + 随机的副标题（2~6个汉字）+ 后缀 + 版次
+    不同的书名之间有大量相同的字（主题、后缀），但副标题不同，贴近真实的书目
+    """
+    subjects = rng.choice(TITLE_SUBJECTS, count)
+    suffixes = rng.choice(TITLE_SUFFIXES, count)
+    separators = rng.choice(TITLE_SEPARATORS, count)
+    editions = rng.choice(TITLE_EDITIONS, count)
+    subtitle_lengths = rng.integers(2, 7, count)
+    subtitle_chars = rng.integers(SUBTITLE_CHAR_RANGE[0], SUBTITLE_CHAR_RANGE[1], int(subtitle_lengths.sum()))
+    subtitle_chars = "".join(map(chr, subtitle_chars))
+    subtitle_ends = np.cumsum(subtitle_lengths)
+    titles = np.empty(count, dtype=object)
+    titles[:] = [
+        f"{subject}{separator}{subtitle_chars[end - length:end]}{suffix}{edition}"
+        for subject, separator, suffix, edition, length, end in zip(subjects, separators, suffixes, editions, subtitle_lengths, subtitle_ends)
+    ]
+    return titles
+
+
+def make_variants(titles: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """生成书名的变体：去掉或者替换版次括号、去掉标点，只有在忽略括号或者标点后才能匹配到"""
+    variants = np.empty(len(titles), dtype=object)
+    kinds = rng.integers(0, 4, len(titles))
+    variants[:] = [
+        title if kind == 0 else
+        title.replace("（", "(").replace("）", ")") if kind == 1 else
+        title.replace("：", "").replace("，", "").replace(" ", "") if kind == 2 else
+        title.split("（")[0].split("(")[0]
+        for title, kind in zip(titles, kinds)
+    ]
+    return variants
+
+
+def with_empty_cells(values: np.ndarray, rng: np.random.Generator, ratio: float = EMPTY_RATIO) -> np.ndarray:
+    values = values.astype(object)
+    values[rng.random(len(values)) < ratio] = np.nan
+    return values
+
+
+def generate_match_workload(
+        main_rows: int, helper_rows: int = None, seed: int = 0
+) -> typing.Tuple[pd.DataFrame, pd.DataFrame]:
+    """生成一组用于表匹配的合成数据：(主表, 辅助表)
+
+    主表：书名（有重复值和空值）、出版社（有空值，用于「补充到主表」）、序号
+    辅助表：书名（部分和主表完全相同，部分只差标点或括号，其余是主表中没有的书名）、出版社、作者、价格
+    :param helper_rows: 辅助表的行数，默认是主表的 1/5（至少 100 行）
+    """
+    rng = np.random.default_rng(seed)
+    helper_rows = helper_rows or max(main_rows // 5, 100)
+    title_pool = generate_titles(max(int(main_rows * DISTINCT_RATIO), 1), rng)
+
+    main_df = pd.DataFrame({
+        "序号": np.arange(1, main_rows + 1),
+        "书名": with_empty_cells(rng.choice(title_pool, main_rows), rng),
+        "出版社": with_empty_cells(rng.choice(PUBLISHERS, main_rows), rng, ratio=0.3),
+    })
+
+    overlap_count = int(helper_rows * HELPER_OVERLAP_RATIO)
+    helper_titles = np.concatenate([
+        make_variants(rng.choice(title_pool, overlap_count), rng),
+        generate_titles(helper_rows - overlap_count, rng) + "（补充）",
+    ])
+    rng.shuffle(helper_titles)
+    helper_df = pd.DataFrame({
+        "书名": with_empty_cells(helper_titles, rng),
+        "出版社": with_empty_cells(rng.choice(PUBLISHERS, helper_rows), rng),
+        "作者": with_empty_cells(rng.choice(AUTHORS, helper_rows), rng),
+        "价格": np.round(rng.uniform(10, 200, helper_rows), 2),
+    })
+    return main_df, helper_df
+
+
+def write_match_workload(output_dir: str, main_rows: int, helper_rows: int = None, seed: int = 0) -> typing.Tuple[str, str]:
+    """将合成数据写成 主表、辅助表 两个工作簿，返回 (主表路径, 辅助表路径)，已经存在的文件直接复用"""
+    os.makedirs(output_dir, exist_ok=True)
+    main_path = os.path.join(output_dir, f"主表_{main_rows}_{seed}.xlsx")
+    helper_path = os.path.join(output_dir, f"辅助表_{main_rows}_{seed}.xlsx")
+    if not os.path.exists(main_path) or not os.path.exists(helper_path):
+        main_df, helper_df = generate_match_workload(main_rows, helper_rows, seed)
+        main_df.to_excel(main_path, index=False, engine="xlsxwriter")
+        helper_df.to_excel(helper_path, index=False, engine="xlsxwriter")
+    return main_path, helper_path
+
+
+if __name__ == '__main__':
+    import argparse
+    from yrx_project.const import TEMP_PATH
+
+    parser = argparse.ArgumentParser(description="生成表匹配的合成数据（主表、辅助表两个工作簿）")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000], help="主表行数")
+    parser.add_argument("--output-dir", default=os.path.join(TEMP_PATH, "benchmark"))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for size in args.sizes:
+        print(write_match_workload(args.output_dir, size, seed=args.seed))
@@ -3,6 +3,7 @@ import json
 import shutil
 import traceback
 import typing
+from concurrent.futures import CancelledError
 
 import pandas as pd
 from PyQt5.QtCore import pyqtSignal, QThread, QTimer, QTime, Qt
@@ -15,8 +16,10 @@ from yrx_project.client.utils.code_widget import CodeDialog
 from yrx_project.client.utils.exception import ClientWorkerException
 from yrx_project.client.utils.message_widget import TipWidgetWithCountDown, MyQMessageBox, TipWidgetWithLoading, \
     FormModal
+from yrx_project.utils.df_util import get_read_cache_status_text
 from yrx_project.utils.file import get_file_name_without_extension, copy_file, get_file_name_with_extension, make_zip
 from yrx_project.utils.logger import logger_sys_error
+from yrx_project.utils.process_pool import CancelToken
 from yrx_project.utils.time_obj import TimeObj
 
 
@@ -81,9 +84,12 @@ class BaseWorker(QThread):
 
     # run的wrapper: 开始和结束报错的生命周期
     def run(self):
+        self.cancel_token = CancelToken()  # 每次执行一个新的取消标记，传给读取和匹配的函数，重置时取消
         self.after_start_signal.emit()
         try:
             self.my_run()
+        except CancelledError:  # 重置时取消了进程池中的任务，不需要提示
+            return self.hide_tip_loading_signal.emit()
         except ClientWorkerException as e:
             return self.modal_signal.emit("error", str(e))
         except Exception as e:
@@ -394,6 +400,7 @@ class WindowWithMainWorkerBarely(BaseWindow):
         self.start_time = None
         # 任务状态与显示
         self.status_bar_text = None  # worker中发出来后,绑定到这个变量,被statusbar更新
+        self.cache_status_label = None  # 状态栏右侧，显示读取缓存的统计
         self.__status = None
 
     # 注册一个Worker
@@ -471,9 +478,25 @@ class WindowWithMainWorkerBarely(BaseWindow):
     def before_finished(self):
         self.set_status_success()
 
+    def cancel_worker_tasks(self):
+        """取消正在执行的任务在进程池中还没有完成的部分（读取多个文件、多进程匹配），如重置时"""
+        cancel_token = getattr(self.worker, "cancel_token", None)
+        if self.is_running and cancel_token is not None:
+            cancel_token.cancel()
+            self.set_status_empty()
+
     def set_status_text(self, text):
         if isinstance(text, str):
             self.statusBar.showMessage(text)
+        self.refresh_cache_status()
+
+    def refresh_cache_status(self):
+        if self.cache_status_label is None:
+            self.cache_status_label = QLabel()
+            self.statusBar.addPermanentWidget(self.cache_status_label)
+        text = get_read_cache_status_text()
+        if text != self.cache_status_label.text():  # 计时器每毫秒调用，没有变化时不重绘
+            self.cache_status_label.setText(text)
 
     def hide_tip_loading(self):
         self.tip_loading.hide()
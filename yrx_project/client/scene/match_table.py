@@ -10,13 +10,15 @@ from PyQt5.QtWidgets import QApplication, QTableWidget, QMessageBox
 from yrx_project.client.base import WindowWithMainWorkerBarely, BaseWorker, set_error_wrapper
 from yrx_project.client.const import *
 from yrx_project.client.utils.table_widget import TableWidgetWrapper
+from yrx_project.scene.match_table.cache import match_cache, get_table_source_key
 from yrx_project.scene.match_table.const import *
 from yrx_project.scene.match_table.main import *
-from yrx_project.utils.df_util import read_excel_file_with_multiprocessing
+from yrx_project.scene.match_table.stream import stream_match_table
+from yrx_project.utils.df_util import read_excel_file_with_multiprocessing, get_excel_row_count
 from yrx_project.utils.file import get_file_name_without_extension, make_zip, copy_file, open_file_or_folder
 from yrx_project.utils.iter_util import find_repeat_items
 from yrx_project.utils.string_util import IGNORE_NOTHING, IGNORE_PUNC, IGNORE_CHINESE_PAREN, IGNORE_ENGLISH_PAREN
-from yrx_project.scene.match_table.main import STR_EQUAL, STR_CONTAINED
+from yrx_project.scene.match_table.main import STR_EQUAL, STR_CONTAINED, STR_SIMILAR
 from yrx_project.utils.time_obj import TimeObj
 
 
@@ -67,6 +69,13 @@ def fill_color_v3(odd_index, even_index, last_index, main_col_map, col_index, ro
     return COLOR_WHITE
 
 
+def get_help_usecols(match_cols, catch_cols) -> list:
+    """辅助表需要读取的列：匹配列 + 要增加的列（[列名, 增加方式, 主表列] 或者列名）"""
+    if isinstance(catch_cols, str):
+        catch_cols = [catch_cols]
+    return [*match_cols, *[i[0] if isinstance(i, (list, tuple)) else i for i in catch_cols or []]]
+
+
 class Worker(BaseWorker):
     custom_after_upload_signal = pyqtSignal(dict)  # 自定义信号
     custom_after_add_condition_signal = pyqtSignal(dict)  # 自定义信号
@@ -140,7 +149,7 @@ class Worker(BaseWorker):
 
             df_main_columns, df_help_columns = read_excel_file_with_multiprocessing([
                 df_main_config, df_help_config
-            ], only_column_name=True)
+            ], only_column_name=True, cancel_token=self.cancel_token)
 
             status_msg = f"✅添加一行条件成功，共耗时：{round(time.time() - start_add_condition_time, 2)}s："
             self.custom_after_add_condition_signal.emit({
@@ -159,14 +168,26 @@ class Worker(BaseWorker):
             df_help_configs = self.get_param("df_help_configs")
             conditions_df = self.get_param("conditions_df")
             result_table_wrapper = self.get_param("result_table_wrapper")
+            include_detail_checkbox = self.get_param("include_detail_checkbox")
             condition_length = len(df_help_configs)
 
+            # 辅助表只需要读取匹配列和要增加的列
+            df_help_configs = [dict(df_help_configs[i], usecols=get_help_usecols(
+                conditions_df["辅助表匹配列"][i], conditions_df["列：从辅助表增加"][i]
+            )) for i in range(condition_length)]
+
             # 构造合并条件
             match_cols_and_df = []
 
-            df_main, *df_help_list = read_excel_file_with_multiprocessing(
-                [df_main_config] + df_help_configs
-            )
+            # 主表太大时使用流式匹配：只读入辅助表，主表分块读取、匹配并写入结果文件，结果表只展示前几行
+            main_path, main_sheet_name = df_main_config.get("path"), df_main_config.get("sheet_name")
+            use_stream = main_path.endswith(".xlsx") and get_excel_row_count(main_path, main_sheet_name) > STREAM_MIN_ROWS
+            if use_stream:
+                df_main, df_help_list = None, read_excel_file_with_multiprocessing(df_help_configs, cancel_token=self.cancel_token)
+            else:
+                df_main, *df_help_list = read_excel_file_with_multiprocessing(
+                    [df_main_config] + df_help_configs, cancel_token=self.cancel_token
+                )
             read_table_time = time.time()
 
             # 组装match参数
@@ -183,30 +204,55 @@ class Worker(BaseWorker):
                     {
                         "id": conditions_df["辅助表名"][i],
                         "df": df_help,
-                        "match_cols": [{
-                            "main_col": conditions_df["主表匹配列"][i],
-                            "match_col": conditions_df["辅助表匹配列"][i],
-                        }],
+                        "match_cols": [{  # 多选时按顺序一一对应，组成多列联合条件
+                            "main_col": main_col,
+                            "match_col": match_col,
+                        } for main_col, match_col in zip(conditions_df["主表匹配列"][i], conditions_df["辅助表匹配列"][i])],
                         "catch_cols": final_catch_cols,
                         "match_func": MATCH_FUNC_MAP.get(conditions_df["匹配方式"][i]),
-                        # "match_policy": "first",  # conditions_df["重复值策略"][i],
+                        "match_policy": MATCH_POLICY_OPTIONS.get(conditions_df["重复值策略"][i]),
                         "match_ignore_policy": conditions_df["匹配忽略内容"][i],
+                        "key_type": KEY_TYPE_AUTO,  # 相等匹配时，两边都是数字（或者日期）的列按类型匹配
                         # "delete_policy": conditions_df["删除满足条件的行"][i],
                         "match_detail_text": conditions_df["列：匹配附加信息（文字）可编辑"][i],  # ｜ 分割的内容
+                        "cache_key": get_table_source_key(df_help_configs[i]),  # 跨多次执行的缓存
                     }
                 )
 
             # 构造是否需要额外信息
             # 1. 所有的主表匹配字段都一样
-            is_all_main_col_same = len(set([conditions_df["主表匹配列"][i] for i in range(condition_length)])) == 1
+            is_all_main_col_same = len(set([tuple(conditions_df["主表匹配列"][i]) for i in range(condition_length)])) == 1
             # 2. 辅助表数量大于1
             is_help_table_more_than_one = len(set([conditions_df["辅助表名"][i] for i in range(condition_length)])) > 1
 
-            matched_df, overall_match_info, detail_match_info = match_table(
-                main_df=df_main,
-                match_cols_and_df=match_cols_and_df,
-                add_overall_match_info=is_help_table_more_than_one
+            progress_callback = lambda match_id, done, total: self.refresh_signal.emit(
+                f"表匹配中：{match_id}（{done}/{total}）..."
             )
+            stream_output_path = None
+            if use_stream:
+                os.makedirs(SCENE_TEMP_PATH, exist_ok=True)
+                stream_output_path = os.path.join(SCENE_TEMP_PATH, f"{TimeObj().time_str}_匹配结果.xlsx")
+                matched_df, overall_match_info, detail_match_info = stream_match_table(
+                    main_path, main_sheet_name, df_main_config.get("row_num_for_column"), match_cols_and_df, stream_output_path,
+                    add_overall_match_info=is_help_table_more_than_one,
+                    use_multiprocessing=True,
+                    progress_callback=progress_callback,
+                    cancel_token=self.cancel_token,
+                    exclude_extra_cols=not include_detail_checkbox.isChecked(),  # 结果直接写入文件，执行前确定是否需要详细信息
+                    color_mapping={
+                        COLOR_BLUE.name(): "even", COLOR_GREEN.name(): "odd", COLOR_RED.name(): "overall", COLOR_YELLOW.name(): "main",
+                    },
+                )
+            else:
+                matched_df, overall_match_info, detail_match_info = match_table(
+                    main_df=df_main,
+                    match_cols_and_df=match_cols_and_df,
+                    add_overall_match_info=is_help_table_more_than_one,
+                    main_cache_key=get_table_source_key(df_main_config),
+                    use_multiprocessing=True,  # 主表较大且无法向量化的匹配方式，分块后多进程匹配
+                    progress_callback=progress_callback,
+                    cancel_token=self.cancel_token,  # 重置时取消
+                )
 
             """
             {"id":{
@@ -256,6 +302,8 @@ class Worker(BaseWorker):
                 tip = f"✅执行成功，匹配：{union_set_length}行（{union_set_present}%）"
             else:
                 tip = f"✅执行成功，匹配任一条件：{union_set_length}行（{union_set_present}%）；匹配全部条件：{intersection_set_length}行（{intersection_set_present}%）"
+            if use_stream:
+                tip += f"；主表共{overall_match_info.get('row_count')}行，已分块匹配，结果表只展示前{len(matched_df)}行"
 
             status_msg = \
                 f"✅执行表匹配成功，共耗时：{duration}秒：读取主表+辅助表：{round(read_table_time - start_run_time, 2)}s："\
@@ -273,6 +321,7 @@ class Worker(BaseWorker):
                 "even_cols_index": even_cols_index,
                 "overall_cols_index": overall_cols_index,
                 "match_for_main_col": match_for_main_col,
+                "stream_output_path": stream_output_path,  # 流式匹配时，结果已经写入的文件
             })
         elif stage == "view_result":
             self.refresh_signal.emit(
@@ -313,20 +362,24 @@ class Worker(BaseWorker):
             odd_cols_index = self.get_param("odd_cols_index")
             overall_cols_index = self.get_param("overall_cols_index")
             file_path = self.get_param("file_path")
+            stream_output_path = self.get_param("stream_output_path")
 
             start_download = time.time()
             start_time = time.time()
             exclude_cols = []
-            if not include_detail_checkbox.isChecked():  # 如果不需要详细信息，那么删除额外信息
+            if stream_output_path:  # 流式匹配：结果文件已经生成，直接复制
+                copy_file(stream_output_path, file_path)
+            elif not include_detail_checkbox.isChecked():  # 如果不需要详细信息，那么删除额外信息
                 exclude_cols = overall_match_info.get("match_extra_cols_index_list") or []
                 for i in detail_match_info.values():
                     exclude_cols.extend(i.get("match_extra_cols"))
-            result_table_wrapper.save_with_color_v3(file_path, exclude_cols=exclude_cols, color_mapping={
-                COLOR_BLUE.name(): even_cols_index,
-                COLOR_GREEN.name(): odd_cols_index,
-                COLOR_RED.name(): overall_cols_index,
-                COLOR_YELLOW.name(): overall_match_info.get("match_for_main_col"),  # 是一个map key是主表匹配列的索引，value是行索引
-            })
+            if not stream_output_path:
+                result_table_wrapper.save_with_color_v3(file_path, exclude_cols=exclude_cols, color_mapping={
+                    COLOR_BLUE.name(): even_cols_index,
+                    COLOR_GREEN.name(): odd_cols_index,
+                    COLOR_RED.name(): overall_cols_index,
+                    COLOR_YELLOW.name(): overall_match_info.get("match_for_main_col"),  # 是一个map key是主表匹配列的索引，value是行索引
+                })
             duration = round((time.time() - start_download), 2)
 
             self.custom_after_download_signal.emit({
@@ -539,6 +592,17 @@ v1.0.7
 v1.0.8
 1.「被主表包含」改为「任意包含」，即主表包含辅助表，或者辅助表包含主表，都算匹配上
 2. [修复] 下载结果直接取消时的报错
+
+v1.0.9
+1. 优化「相等」和「任意包含」的匹配速度
+2. 匹配条件支持多列联合：主表匹配列和辅助表匹配列可以多选，按顺序一一对应
+3. 主表较大时，「任意包含」匹配使用多核并行，并显示匹配进度
+4. 修改匹配条件后再次执行，只重新匹配修改过的条件，其他条件直接使用上一次的结果
+5. 增加「重复值策略」：辅助表中有多行匹配到时，可以只保留第一行、最后一行或者前几行
+6. 增加「相似」匹配方式：容忍错别字和版本后缀等差异，并给出匹配到的最高相似度
+7. 「匹配详情」中展示每个条件的执行方式，以及各阶段预估和实际的耗时
+8. 主表超过30万行时分块读取和匹配，结果直接写入文件，结果表只展示前1000行
+9. 「相等」匹配时，两边都是数字（或者日期）的列按数字（日期）匹配：1 和 1.0 相等，不受忽略规则影响
 """
 
     # 第一步：上传文件的帮助信息
@@ -551,11 +615,13 @@ v1.0.8
     # 第二步：添加匹配条件的帮助信息
     step2_help_info_text = """
 1. 添加的条件个数，不能超过辅助表的个数，且和辅助表自动一一对应
-2. 需要在主表中选择一列，在辅助表中选择一列进行匹配
+2. 需要在主表中选择一列，在辅助表中选择一列进行匹配；也可以各选多列（按选择顺序一一对应），需要同时满足
 3. 默认忽略所有标点符合和空格进行匹配，用户可选择
-4. 支持相等和任意包含，任意包含是说 主表包含辅助表的内容 或者 辅助表包含主表的内容
+4. 支持相等、任意包含和相似，任意包含是说 主表包含辅助表的内容 或者 辅助表包含主表的内容；
+   相似是说 两者的相似度（2 * 相同的字符数 / 总字数）不低于80%，适合有错别字、版本后缀等的情况，结果中会增加一列相似度
 5. 列：从辅助表增加：是说将匹配上列从辅助表带到主表中：可选三种，增加一列、补充到主表（覆盖）、补充到主表（不覆盖）
-6. 匹配附加信息（文字）可编辑，可以修改 匹配到｜未匹配到 ｜ 空
+6. 重复值策略：辅助表中有多行匹配到时，可以只保留第一行、最后一行或者前几行，默认保留全部（用换行拼接）
+7. 匹配附加信息（文字）可编辑，可以修改 匹配到｜未匹配到 ｜ 空
 """
     # 第三步：执行与下载的帮助信息
     step3_help_info_text = """
@@ -591,13 +657,14 @@ v1.0.8
 
         # 2. 添加匹配条件
         self.conditions_table_wrapper = TableWidgetWrapper(self.conditions_table)
-        self.conditions_table_wrapper.set_col_width(3, 190).set_col_width(5, 200).set_col_width(6, 260).set_col_width(7, 150).set_col_width(8, 150)
+        self.conditions_table_wrapper.set_col_width(3, 190).set_col_width(5, 200).set_col_width(6, 120).set_col_width(7, 260).set_col_width(8, 150).set_col_width(9, 150)
         self.add_condition_button.clicked.connect(self.add_condition)
 
         # 3. 执行与下载
         self.matched_df, self.overall_match_info, self.detail_match_info = None, None, None  # 用来获取结果
         self.odd_cols_index, self.even_cols_index, self.overall_cols_index = None, None, None  # 用来标记颜色
         self.match_for_main_col = None  # 主表匹配列的映射
+        self.stream_output_path = None  # 流式匹配时，结果已经写入的文件
         self.run_button.clicked.connect(self.run)
         self.result_table_wrapper = TableWidgetWrapper(self.result_table)
         self.result_detail_info_button.clicked.connect(self.show_result_detail_info)
@@ -636,10 +703,12 @@ v1.0.8
 
     @set_error_wrapper
     def reset_all(self, *args, **kwargs):
+        self.cancel_worker_tasks()
         self.main_tables_wrapper.clear()
         self.help_tables_wrapper.clear()
         self.conditions_table_wrapper.clear()
         self.result_table_wrapper.clear()
+        match_cache.clear()
         self.statusBar.showMessage("已重置，请重新上传文件")
         self.detail_match_info = None
         self.overall_match_info = None
@@ -818,7 +887,8 @@ v1.0.8
         # 获取上一个条件的主表匹配列
         default_main_col_index = None
         if self.conditions_table_wrapper.row_length() > 0:
-            default_main_col = self.conditions_table_wrapper.get_cell_value(self.conditions_table_wrapper.row_length() - 1, 0)
+            default_main_cols = self.conditions_table_wrapper.get_cell_value(self.conditions_table_wrapper.row_length() - 1, 0)
+            default_main_col = default_main_cols[0] if default_main_cols else None
             if default_main_col in df_main_columns:
                 default_main_col_index = df_main_columns.index(default_main_col)
 
@@ -839,14 +909,22 @@ v1.0.8
         self.conditions_table_wrapper.add_rich_widget_row([
             {
                 "type": "dropdown",
-                "values": df_main_columns,  # 主表匹配列
+                "values": df_main_columns,  # 主表匹配列（可多选，和辅助表匹配列按顺序对应）
                 "cur_index": default_main_col_index if default_main_col_index is not None else 0,
+                "options": {
+                    "multi": True,
+                    "order": True,
+                }
             }, {
                 "type": "readonly_text",
                 "value": table_name,  # 辅助表
             }, {
                 "type": "dropdown",
-                "values": df_help_columns,  # 辅助表匹配列
+                "values": df_help_columns,  # 辅助表匹配列（可多选）
+                "options": {
+                    "multi": True,
+                    "order": True,
+                }
             }, {
                 "type": "dropdown",
                 "values": [IGNORE_NOTHING, IGNORE_PUNC, IGNORE_CHINESE_PAREN, IGNORE_ENGLISH_PAREN],  # 忽略内容
@@ -858,7 +936,7 @@ v1.0.8
                 }
             }, {
                 "type": "dropdown",
-                "values": [STR_EQUAL, STR_CONTAINED],
+                "values": [STR_EQUAL, STR_CONTAINED, STR_SIMILAR],
                 "cur_index": 0,  # 默认严格匹配
             }, {
                 "type": "dropdown",
@@ -870,6 +948,10 @@ v1.0.8
                     "first_as_none": True,
                 }
 
+            }, {
+                "type": "dropdown",
+                "values": list(MATCH_POLICY_OPTIONS.keys()),  # 重复值策略
+                "cur_index": 0,  # 默认保留全部
             }, {
                 "type": "editable_text",  # 列：匹配情况
                 "value": " ｜ ".join(MATCH_OPTIONS),
@@ -905,6 +987,10 @@ v1.0.8
             return self.modal(level="warn", msg="请先添加匹配条件")
 
         condition_length = self.conditions_table_wrapper.row_length()
+        for i in range(condition_length):
+            main_cols, help_cols = conditions_df["主表匹配列"][i], conditions_df["辅助表匹配列"][i]
+            if not main_cols or len(main_cols) != len(help_cols):
+                return self.modal(level="warn", msg=f"第{i+1}个条件：主表匹配列和辅助表匹配列的个数需要一致")
         df_main_config = self.get_df_config_by_row_index(0, "main")
 
         # 批量读取表
@@ -916,6 +1002,7 @@ v1.0.8
             "df_help_configs": df_help_configs,  # 辅助表的配置
             "conditions_df": conditions_df,  # 条件表
             "result_table_wrapper": self.result_table_wrapper,  # 结果表的wrapper
+            "include_detail_checkbox": self.include_detail_checkbox,  # 流式匹配时，执行前确定是否需要详细信息
         }
         self.worker.add_params(params).start()
         self.tip_loading.set_titles(["表匹配.", "表匹配..", "表匹配..."]).show()
@@ -932,6 +1019,7 @@ v1.0.8
         self.even_cols_index = run_result.get("even_cols_index")
         self.overall_cols_index = run_result.get("overall_cols_index")
         self.match_for_main_col = run_result.get("match_for_main_col")
+        self.stream_output_path = run_result.get("stream_output_path")
 
         # self.result_table_wrapper.fill_data_with_color(
         #     self.matched_df,
@@ -953,17 +1041,30 @@ v1.0.8
             return self.modal(level="warn", msg="请先执行")
         msg_list = []
         data = []
+        # 条件命中矩阵（行：主表的行，列：条件），只被某一个条件匹配到的行数
+        condition_ids = self.overall_match_info.get("condition_ids") or []
+        condition_hit_matrix = self.overall_match_info.get("condition_hit_matrix")
+        only_matched_counts = {}
+        if condition_hit_matrix is not None and condition_hit_matrix.shape[1] == len(condition_ids):
+            only_matched_mask = condition_hit_matrix.sum(axis=1) == 1
+            only_matched_counts = dict(zip(condition_ids, condition_hit_matrix[only_matched_mask].sum(axis=0).tolist()))
         for k, v in self.detail_match_info.items():
             duration = round(v.get("time_cost") * 1000, 2)
-            match_percent = len(v.get('match_index_list')) / (len(v.get('match_index_list')) + len(v.get('unmatch_index_list')))
-            unmatch_percent = len(v.get('unmatch_index_list')) / (len(v.get('match_index_list')) + len(v.get('unmatch_index_list')))
+            # 流式匹配时只有行数
+            match_count = v["match_count"] if "match_count" in v else len(v.get('match_index_list'))
+            unmatch_count = v["unmatch_count"] if "unmatch_count" in v else len(v.get('unmatch_index_list'))
+            match_percent = match_count / (match_count + unmatch_count) if match_count + unmatch_count else 0
+            unmatch_percent = unmatch_count / (match_count + unmatch_count) if match_count + unmatch_count else 0
             data.append({
                 "表名": k,
                 "耗时": f"{duration}s",
-                "匹配行数": f"{len(v.get('match_index_list'))}（{round(match_percent * 100, 2)}%）",
-                "未匹配行数": f"{len(v.get('unmatch_index_list'))}（{round(unmatch_percent * 100, 2)}%）",
+                "匹配行数": f"{match_count}（{round(match_percent * 100, 2)}%）",
+                "未匹配行数": f"{unmatch_count}（{round(unmatch_percent * 100, 2)}%）",
+                "仅此条件匹配行数": only_matched_counts.get(k, ""),
+                # 执行计划：执行方式、主表和辅助表的行数，各阶段 预估 / 实际 的耗时
+                **(v.get("plan").explain() if v.get("plan") else {}),
             })
-        self.table_modal(pd.DataFrame(data), size=(500, 200))
+        self.table_modal(pd.DataFrame(data), size=(1200, 250))
 
     @set_error_wrapper
     def view_result(self, *args, **kwargs):
@@ -1010,7 +1111,7 @@ v1.0.8
             "even_cols_index": self.even_cols_index,
             "odd_cols_index": self.odd_cols_index,
             "overall_cols_index": self.overall_cols_index,
-
+            "stream_output_path": self.stream_output_path,
         }
         self.worker.add_params(params).start()
         self.tip_loading.set_titles(["合成Excel文件并下载.", "合成Excel文件并下载..", "合成Excel文件并下载..."]).show()
@@ -128,6 +128,7 @@ class Worker(BaseWorker):
                 "row_num_for_column": row_num_for_column,
             }
 
+            # 读取整个工作表（只解析一次）：分组只用到拆分列，执行拆分时复用这个 df（raw_df），不再重新读取
             df = read_excel_file_with_multiprocessing([
                 df_config
             ])[0]
@@ -406,6 +407,7 @@ v1.0.9
     def reset_all(self, *args, **kwargs):
         if self.done is False:
             return self.modal(level="warn", msg="正在执行中，请勿操作")
+        self.cancel_worker_tasks()
         self.done = None
         self.tables_wrapper.clear()
         self.split_cols_table_wrapper.clear()
@@ -425,7 +425,7 @@ class TableWidgetWrapper:
                 font_colors = cell_options.get("font_colors") or cell_options.get("colors")
                 bg_colors = cell_options.get("bg_colors")
                 if cell_options.get("multi"):
-                    combo_multi_box = MultiSelectComboBox(values, cur_index=cell.get("cur_index", 0), font_colors=font_colors, bg_colors=bg_colors, first_as_none=cell_options.get("first_as_none"))
+                    combo_multi_box = MultiSelectComboBox(values, cur_index=cell.get("cur_index", 0), order=cell_options.get("order", False), font_colors=font_colors, bg_colors=bg_colors, first_as_none=cell_options.get("first_as_none"))
                     self.table_widget.setCellWidget(nex_row_index, col_index, combo_multi_box)
                 elif cell_options.get("cascader"):
                     cascader_multi_box = CascaderSelectComboBox(values, cur_index=cell.get("cur_index", [0]), first_as_none=cell_options.get("first_as_none"))
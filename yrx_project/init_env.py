@@ -15,7 +15,10 @@ def run_app(width, height):
     import sys
     from PyQt5.QtWidgets import QApplication
     from yrx_project.client.main import MyClient
+    from yrx_project.utils.process_pool import warm_up_process_pool
 
+    # 后台启动常驻的进程池（读取多个文件、多进程匹配），子进程提前导入读取和匹配需要的模块
+    warm_up_process_pool(["pandas", "openpyxl", "yrx_project.utils.df_util", "yrx_project.scene.match_table.engine"])
     app = QApplication(sys.argv)
     demo = MyClient()
     demo.resize(width, height)  # 根据条件调整
@@ -0,0 +1,19 @@
+from yrx_project.scene.match_table.const import MATCH_CACHE_MAX_BYTES
+from yrx_project.utils.cache_util import SizedLRUCache
+from yrx_project.utils.file import get_file_fingerprint
+
+# 跨多次执行的缓存：处理后的匹配列、构建好的匹配索引、匹配结果
+# 只修改了输出相关的选项（携带列、匹配附加信息）时，再次执行可以直接从匹配结果开始拼接列
+match_cache = SizedLRUCache(MATCH_CACHE_MAX_BYTES)
+
+
+def make_cache_key(source_key, *parts):
+    """source_key 是表的来源：(文件指纹, 工作表, 标题行)，为 None 时说明来源未知，不走缓存"""
+    if source_key is None:
+        return None
+    return (source_key, ) + parts
+
+
+def get_table_source_key(df_config: dict) -> tuple:
+    """表的来源：(文件指纹, 工作表, 标题行)，文件被修改后会变化"""
+    return get_file_fingerprint(df_config.get("path")), df_config.get("sheet_name"), df_config.get("row_num_for_column")
@@ -0,0 +1,24 @@
+import pandas as pd
+import pytest
+
+from yrx_project.scene.match_table.const import ADD_COL_OPTION
+from yrx_project.scene.match_table.main import MATCH_FUNC_MAP, STR_EQUAL
+from yrx_project.utils.string_util import IGNORE_NOTHING
+
+
+@pytest.fixture
+def make_conditions():
+    """条件的工厂（参数同 match_table 的 match_cols_and_df）：用辅助表的 key_col 匹配主表的同名列，添加辅助表的 catch_col 列
+    其他的参数（如 cache_key、similarity_threshold）通过 kwargs 覆盖
+    """
+    def factory(df: pd.DataFrame, key_col: str, catch_col: str, match_func_name=STR_EQUAL, **kwargs) -> list:
+        return [dict({
+            "id": "辅助表",
+            "df": df,
+            "match_cols": [{"main_col": key_col, "match_col": key_col}],
+            "catch_cols": [[catch_col, ADD_COL_OPTION]],
+            "match_func": MATCH_FUNC_MAP[match_func_name],
+            "match_ignore_policy": [IGNORE_NOTHING],
+            "match_detail_text": "匹配到｜未匹配到｜无内容",
+        }, **kwargs)]
+    return factory
@@ -1,3 +1,10 @@
+import os
+
+from yrx_project.const import TEMP_PATH
+
+SCENE_NAME = "match_table"
+SCENE_TEMP_PATH = str(os.path.join(TEMP_PATH, SCENE_NAME))
+
 # 总评的默认内容
 MATCH_OPTION = "✅ 匹配到"
 UNMATCH_OPTION = "❌ 未匹配到"
@@ -11,3 +18,34 @@ NO_CATCH_COLS_OPTION = "***不从辅助表增加列***"
 ADD_COL_OPTION = "添加一列"
 MAKEUP_MAIN_COL = "补充到主表（不覆盖)"
 MAKEUP_MAIN_COL_WITH_OVERWRITE = "补充到主表（覆盖）"
+
+# 「相似」匹配的相似度阈值（0~1），相似度 = 2 * 匹配到的字符数 / 两个字符串的总长度
+SIMILARITY_THRESHOLD = 0.8
+
+# 重复值策略：辅助表中有多行匹配到时，保留哪几行（下拉框的选项 -> match_table 的 match_policy）
+MATCH_POLICY_OPTIONS = {
+    "保留全部": "all",
+    "只保留第一行": "first",
+    "只保留最后一行": "last",
+    "保留前3行": "top_n(3)",
+    "保留前5行": "top_n(5)",
+    "保留前10行": "top_n(10)",
+}
+
+# 匹配值的类型（match_table 的 key_type）：相等匹配时，数字和日期可以按原生的类型匹配，而不是转成字符串
+KEY_TYPE_STR = "str"  # 默认：转成字符串后按忽略规则处理
+KEY_TYPE_AUTO = "auto"  # 主表和辅助表的匹配列都是数字（或者都是日期）时按类型匹配，否则按字符串
+KEY_TYPE_NUMBER = "number"  # 按数字匹配：1 和 1.0 相等，无法转成数字的为无内容
+KEY_TYPE_DATE = "date"  # 按日期匹配：2024-01-01、20240101、2024年1月1日 相等，无法解析的为无内容
+
+# 跨多次执行的匹配缓存（处理后的匹配列、匹配索引、匹配结果）的内存上限
+MATCH_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# 多进程匹配：主表按行切分的分块大小，主表行数少于这个值时不启用多进程（启动和传输的开销大于收益）
+MULTIPROCESSING_CHUNK_SIZE = 2000
+MULTIPROCESSING_MIN_ROWS = 10000
+
+# 流式匹配：主表超过这个行数时，按行分块读取、匹配并逐块写入结果文件，内存中只保留一个分块和辅助表的索引
+STREAM_MIN_ROWS = 300000
+STREAM_CHUNK_SIZE = 50000
+STREAM_PREVIEW_ROWS = 1000  # 流式匹配时，结果表只展示前几行
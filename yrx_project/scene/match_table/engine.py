@@ -0,0 +1,599 @@
+import itertools
+import math
+import re
+import sys
+import typing
+
+import numpy as np
+import pandas as pd
+
+from yrx_project.scene.match_table.const import SIMILARITY_THRESHOLD
+from yrx_project.utils.process_pool import SharedObject, CancelToken, load_shared_object, run_in_process_pool
+from yrx_project.utils.string_util import AhoCorasickAutomaton, get_similarity, get_char_tokens
+
+
+def to_key_series(key_cols: typing.List[pd.Series]) -> pd.Series:
+    """将多个匹配列合成一个匹配值序列：单列直接使用，多列合成为 tuple"""
+    if len(key_cols) == 1:
+        return key_cols[0]
+    return pd.Series(list(zip(*key_cols)), index=key_cols[0].index, dtype=object)
+
+
+def get_no_content_mask(key_cols: typing.List[pd.Series]) -> np.ndarray:
+    """主表的匹配值为空（或者经过忽略规则处理后为空），记为无内容；多列联合条件时，任一列为空即为无内容"""
+    no_content = np.zeros(len(key_cols[0]), dtype=bool)
+    for key_col in key_cols:
+        no_content |= key_col.isnull().to_numpy()
+        if key_col.dtype == object:  # 按类型匹配的列（数字、日期）只有空值
+            no_content |= (key_col == "").to_numpy()
+    return no_content
+
+
+def parse_match_policy(match_policy: str) -> typing.Tuple[typing.Optional[int], bool]:
+    """重复值策略 -> (最多保留的行数, 是否保留最后的几行)
+    all：全部；first：第一行；last：最后一行；top_n(k)：前k行
+    """
+    if not match_policy or match_policy == "all":
+        return None, False
+    if match_policy == "first":
+        return 1, False
+    if match_policy == "last":
+        return 1, True
+    top_n = re.fullmatch(r"top_n\((\d+)\)", match_policy.replace(" ", ""))
+    if top_n and int(top_n.group(1)) > 0:
+        return int(top_n.group(1)), False
+    raise ValueError(f"unknown match_policy: {match_policy}")
+
+
+def limit_positions(positions: typing.Sequence[int], limit: int = None, from_end=False) -> typing.Sequence[int]:
+    """按重复值策略，只保留前（或者最后）limit 个行位置"""
+    if limit is None or len(positions) <= limit:
+        return positions
+    return positions[-limit:] if from_end else positions[:limit]
+
+
+def gather_slices(starts: np.ndarray, counts: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """将每一行对应的 [start, start+count) 拼接起来，返回 (offsets, 拼接后的位置)"""
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    gather = np.repeat(starts - offsets[:-1], counts) + np.arange(offsets[-1], dtype=np.int64)
+    return offsets, gather
+
+
+class MatchResult:
+    """匹配结果的压缩表示（CSR），避免在主表中为每一行存一个 list
+
+        offsets: 长度为 主表行数+1，主表第 i 行匹配到的辅助表行位置为 indices[offsets[i]:offsets[i+1]]
+        indices: 所有匹配到的辅助表的行位置，每一行内保持辅助表中的原始顺序
+        no_content: 主表无内容的行（和 未匹配到 区分）
+        scores: 可选，和 indices 一一对应的相似度（「相似」匹配时才有）
+    """
+    def __init__(self, offsets: np.ndarray, indices: np.ndarray, no_content: np.ndarray, scores: np.ndarray = None):
+        self.offsets = offsets
+        self.indices = indices
+        self.no_content = no_content
+        self.scores = scores
+
+    @classmethod
+    def from_position_lists(
+            cls, position_lists: typing.List[typing.Sequence[int]], no_content: np.ndarray,
+            score_lists: typing.List[typing.Sequence[float]] = None
+    ) -> 'MatchResult':
+        counts = np.fromiter((len(i) for i in position_lists), dtype=np.int64, count=len(position_lists))
+        offsets = np.zeros(len(position_lists) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        indices = np.fromiter(itertools.chain.from_iterable(position_lists), dtype=np.int64, count=int(offsets[-1]))
+        scores = None
+        if score_lists is not None:
+            scores = np.fromiter(itertools.chain.from_iterable(score_lists), dtype=np.float64, count=int(offsets[-1]))
+        return cls(offsets, indices, no_content, scores)
+
+    @classmethod
+    def concat(cls, results: typing.List['MatchResult']) -> 'MatchResult':
+        """按顺序拼接主表多个分块的匹配结果"""
+        offsets, base = [np.zeros(1, dtype=np.int64)], 0
+        for result in results:
+            offsets.append(result.offsets[1:] + base)
+            base += int(result.offsets[-1])
+        indices = np.concatenate([np.empty(0, dtype=np.int64)] + [result.indices for result in results])
+        no_content = np.concatenate([np.empty(0, dtype=bool)] + [result.no_content for result in results])
+        scores = None
+        if results and all(result.scores is not None for result in results):
+            scores = np.concatenate([result.scores for result in results])
+        return cls(np.concatenate(offsets), indices, no_content, scores)
+
+    def __len__(self) -> int:
+        return len(self.no_content)
+
+    def limit(self, limit: int = None, from_end=False) -> 'MatchResult':
+        """按重复值策略截取每一行匹配到的行位置（只对 CSR 切片，不逐行处理）"""
+        if limit is None:
+            return self
+        counts = self.counts
+        limited_counts = np.minimum(counts, limit)
+        starts = self.offsets[:-1] + (counts - limited_counts if from_end else 0)
+        offsets, gather = gather_slices(starts, limited_counts)
+        return MatchResult(offsets, self.indices[gather], self.no_content, None if self.scores is None else self.scores[gather])
+
+    def broadcast(self, codes: np.ndarray, no_content: np.ndarray) -> 'MatchResult':
+        """self 是每个去重值的匹配结果，按每一行的编码展开成每一行的结果（编码为 -1 的行没有匹配到）"""
+        starts, counts = np.zeros(len(codes), dtype=np.int64), np.zeros(len(codes), dtype=np.int64)
+        valid_codes = codes[codes >= 0]
+        if len(valid_codes):
+            starts[codes >= 0] = self.offsets[valid_codes]
+            counts[codes >= 0] = self.counts[valid_codes]
+        offsets, gather = gather_slices(starts, counts)
+        return MatchResult(offsets, self.indices[gather], no_content, None if self.scores is None else self.scores[gather])
+
+    def get(self, row_position: int) -> np.ndarray:
+        return self.indices[self.offsets[row_position]:self.offsets[row_position + 1]]
+
+    def get_scores(self, row_position: int) -> np.ndarray:
+        return self.scores[self.offsets[row_position]:self.offsets[row_position + 1]]
+
+    @property
+    def counts(self) -> np.ndarray:
+        """每一行匹配到的行数"""
+        return np.diff(self.offsets)
+
+    @property
+    def matched_mask(self) -> np.ndarray:
+        return self.counts > 0
+
+    @property
+    def unmatched_mask(self) -> np.ndarray:
+        return (self.counts == 0) & ~self.no_content
+
+    @property
+    def row_positions(self) -> np.ndarray:
+        """和 indices 一一对应的主表行位置，即所有的 (主表行, 辅助表行) 匹配对"""
+        return np.repeat(np.arange(len(self), dtype=np.int64), self.counts)
+
+    @property
+    def best_scores(self) -> np.ndarray:
+        """每一行匹配到的最高相似度，未匹配到的行为 nan"""
+        best_scores = np.full(len(self), np.nan)
+        matched_rows = np.flatnonzero(self.counts > 0)
+        if self.scores is not None and len(matched_rows):
+            best_scores[matched_rows] = np.maximum.reduceat(self.scores, self.offsets[matched_rows])
+        return best_scores
+
+    def memory_usage(self) -> int:
+        return int(self.offsets.nbytes + self.indices.nbytes + self.no_content.nbytes) + \
+            (0 if self.scores is None else int(self.scores.nbytes))
+
+    def join_values(self, helper_values: np.ndarray, sep='\n') -> np.ndarray:
+        """按匹配对取出辅助表的值（gather），再按主表的行分组拼接（group），未匹配到的行为 ''
+        绝大多数行只匹配到一行，直接取值；匹配到多行的，才需要拼接
+        """
+        joined = np.full(len(self), '', dtype=object)
+        counts = self.counts
+        single_rows = np.flatnonzero(counts == 1)
+        joined[single_rows] = helper_values[self.indices[self.offsets[single_rows]]]
+        multi_pairs = np.repeat(counts > 1, counts)
+        if multi_pairs.any():
+            grouped = pd.Series(helper_values[self.indices[multi_pairs]]).groupby(
+                self.row_positions[multi_pairs], sort=False
+            ).agg(sep.join)
+            joined[grouped.index.to_numpy()] = grouped.to_numpy()
+        return joined
+
+
+class KeyDictionary:
+    """主表匹配列的字典编码：每一行 -> 去重值的编码（int32），无内容的行为 -1
+
+    匹配列的基数通常很低（部门、出版社），所有的匹配方式只需要在去重值上匹配（去重值 x 辅助表的去重值），
+    再按编码展开（MatchResult.broadcast）到每一行；多列联合条件时，去重的是各列组成的值
+    """
+    def __init__(self, codes: np.ndarray, first_positions: np.ndarray, no_content: np.ndarray):
+        self.codes = codes
+        self.first_positions = first_positions  # 每个去重值第一次出现的行位置
+        self.no_content = no_content
+
+    @classmethod
+    def encode(cls, key_cols: typing.List[pd.Series]) -> 'KeyDictionary':
+        no_content = get_no_content_mask(key_cols)
+        has_content = np.flatnonzero(~no_content)
+        keys = to_key_series(key_cols).iloc[has_content]
+        sub_codes, uniques = pd.factorize(keys)
+        code_dtype = np.int32 if len(uniques) < np.iinfo(np.int32).max else np.int64
+        codes = np.full(len(no_content), -1, dtype=code_dtype)
+        codes[has_content] = sub_codes
+        # 每个去重值第一次出现的位置：按编码 stable 排序后，每一组的第一个
+        order = np.argsort(sub_codes, kind="stable")
+        bounds = np.searchsorted(sub_codes[order], np.arange(len(uniques)))
+        return cls(codes, has_content[order[bounds]], no_content)
+
+    def __len__(self) -> int:
+        return len(self.first_positions)
+
+    def take_uniques(self, key_cols: typing.List[pd.Series]) -> typing.List[pd.Series]:
+        """每个去重值取一行，得到去重后的匹配列"""
+        return [key_col.iloc[self.first_positions] for key_col in key_cols]
+
+    def broadcast(self, unique_result: 'MatchResult') -> 'MatchResult':
+        return unique_result.broadcast(self.codes, self.no_content)
+
+    def memory_usage(self) -> int:
+        return int(self.codes.nbytes + self.first_positions.nbytes + self.no_content.nbytes)
+
+
+class BaseMatchEngine:
+    """匹配引擎：先用辅助表的匹配列构建索引（build），再探测主表的匹配列（match）
+
+    build 和 match 的入参都是匹配列的列表（多列联合条件时有多列，各列已经分别按忽略规则处理过）
+    match 返回 MatchResult，结果和原始的逐行比较保持一致：无内容 / 未匹配到 / 匹配到的辅助表行位置（原始顺序）
+    limit 和 from_end 是重复值策略（见 parse_match_policy）：每一行最多保留前（或者最后）limit 个匹配到的行
+    """
+    def __init__(self, match_func: typing.Callable[[str, str], bool]):
+        self.match_func = match_func
+        self.helper_keys = None
+
+    def build(self, helper_key_cols: typing.List[pd.Series]) -> 'BaseMatchEngine':
+        self.helper_keys = to_key_series(helper_key_cols)
+        return self
+
+    def probe(self, key, limit: int = None, from_end=False) -> typing.Sequence[int]:
+        """返回匹配到的辅助表的行位置（升序）"""
+        raise NotImplementedError
+
+    def memory_usage(self) -> int:
+        """估算索引占用的内存（字节），用于缓存的淘汰"""
+        if self.helper_keys is None:
+            return 0
+        return int(self.helper_keys.memory_usage(index=True, deep=True))
+
+    def check_built(self):
+        if self.helper_keys is None:
+            raise ValueError("engine is not built, call build() first")
+
+    def match(self, main_key_cols: typing.List[pd.Series], limit: int = None, from_end=False) -> MatchResult:
+        self.check_built()
+        main_keys = to_key_series(main_key_cols).to_numpy()
+        no_content = get_no_content_mask(main_key_cols)
+        position_lists = [
+            () if is_no_content else self.probe(key, limit, from_end) for key, is_no_content in zip(main_keys, no_content)
+        ]
+        return MatchResult.from_position_lists(position_lists, no_content)
+
+
+class BruteForceMatchEngine(BaseMatchEngine):
+    """兜底引擎：自定义的 match_func 无法建立索引，只能 主表行数 x 辅助表行数 逐个比较"""
+    def __init__(self, match_func: typing.Callable[[str, str], bool]):
+        super(BruteForceMatchEngine, self).__init__(match_func)
+        self.helper_values = []
+
+    def build(self, helper_key_cols: typing.List[pd.Series]) -> 'BruteForceMatchEngine':
+        super(BruteForceMatchEngine, self).build(helper_key_cols)
+        self.helper_values = self.helper_keys.tolist()
+        return self
+
+    def probe(self, key, limit: int = None, from_end=False) -> typing.Sequence[int]:
+        match_func, helper_values = self.match_func, self.helper_values
+        if limit is None:
+            return [position for position, v in enumerate(helper_values) if match_func(key, v)]
+        # 有重复值策略时，找够 limit 行就停止比较
+        positions = range(len(helper_values) - 1, -1, -1) if from_end else range(len(helper_values))
+        matched = []
+        for position in positions:
+            if match_func(key, helper_values[position]):
+                matched.append(position)
+                if len(matched) >= limit:
+                    break
+        return matched[::-1] if from_end else matched
+
+
+class HashMatchEngine(BaseMatchEngine):
+    """相等匹配：对辅助表建立一次 哈希索引（匹配值 -> 行位置），主表所有行一次向量化查找
+    多列联合条件时，匹配值是各列组成的 tuple，仍然只需要查一次
+    """
+    def __init__(self, match_func: typing.Callable[[str, str], bool]):
+        super(HashMatchEngine, self).__init__(match_func)
+        self.unique_index = pd.Index([], dtype=object)  # 辅助表去重后的值
+        self.positions = np.empty(0, dtype=np.int64)  # 按去重值分组后的行位置，组内升序
+        self.bounds = np.zeros(1, dtype=np.int64)  # 第 i 个去重值的行位置为 positions[bounds[i]:bounds[i+1]]
+
+    def build(self, helper_key_cols: typing.List[pd.Series]) -> 'HashMatchEngine':
+        super(HashMatchEngine, self).build(helper_key_cols)
+        # 空值的 code 为 -1，不会进入索引（空值和任何内容都不相等）
+        codes, uniques = pd.factorize(self.helper_keys)
+        order = np.argsort(codes, kind="stable")  # stable 排序保证组内位置升序
+        sorted_codes = codes[order]
+        missing_count = int(np.searchsorted(sorted_codes, 0))
+        # 按类型匹配的列（数字、日期）保留原生的类型，哈希和比较都在定长的值上进行
+        self.unique_index = pd.Index(uniques, dtype=object, tupleize_cols=False) if uniques.dtype == object else pd.Index(uniques)
+        self.positions = order[missing_count:].astype(np.int64)
+        self.bounds = np.searchsorted(sorted_codes[missing_count:], np.arange(len(uniques) + 1)).astype(np.int64)
+        return self
+
+    def probe(self, key, limit: int = None, from_end=False) -> typing.Sequence[int]:
+        code = self.unique_index.get_indexer(np.array([key], dtype=object))[0]
+        if code < 0:
+            return ()
+        return limit_positions(self.positions[self.bounds[code]:self.bounds[code + 1]], limit, from_end)
+
+    def match(self, main_key_cols: typing.List[pd.Series], limit: int = None, from_end=False) -> MatchResult:
+        self.check_built()
+        no_content = get_no_content_mask(main_key_cols)
+        main_keys = to_key_series(main_key_cols)
+        codes = self.unique_index.get_indexer(main_keys.to_numpy() if main_keys.dtype == object else main_keys.array)
+        codes[no_content] = -1
+        valid = codes >= 0
+        safe_codes = np.where(valid, codes, len(self.bounds) - 2)  # 未匹配的行指向任意一组（辅助表为空时 bounds 只有一个元素）
+        starts = np.where(valid, self.bounds[safe_codes], 0)
+        counts = np.where(valid, self.bounds[safe_codes + 1] - starts, 0)
+        if limit is not None:
+            # 重复值策略：直接截取每一组的行位置，不需要先全部取出来
+            limited_counts = np.minimum(counts, limit)
+            if from_end:
+                starts = starts + counts - limited_counts
+            counts = limited_counts
+        # 将每一行对应的分组 positions[start:start+count] 拼接起来
+        offsets, gather = gather_slices(starts, counts)
+        return MatchResult(offsets, self.positions[gather], no_content)
+
+    def memory_usage(self) -> int:
+        return super(HashMatchEngine, self).memory_usage() + \
+            int(self.unique_index.memory_usage(deep=True)) + self.positions.nbytes + self.bounds.nbytes
+
+
+class ContainMatchEngine(BaseMatchEngine):
+    """任意包含匹配：h in m or m in h
+
+    辅助表的值先去重，然后建立两类索引：
+        1. 辅助表所有值构成的 AC 自动机：扫描一遍主表的值，得到被主表包含的辅助表值（h in m）
+        2. 辅助表值的 单字/双字 倒排索引：取主表值中最稀有的几个双字求交集得到候选，再校验（m in h）
+    最后将匹配到的辅助表值展开成行位置，按辅助表中的原始顺序排列
+    """
+    def __init__(self, match_func: typing.Callable[[str, str], bool]):
+        super(ContainMatchEngine, self).__init__(match_func)
+        self.uniques = []  # 辅助表去重后的值
+        self.unique_positions = []  # 每个去重值在辅助表中的位置（升序）
+        self.empty_unique_ids = []  # 空字符串被任何内容包含
+        self.automaton = None
+        self.char_index = {}  # 单字 -> 包含该字的去重值id
+        self.gram_index = {}  # 双字 -> 包含该双字的去重值id
+
+    def build(self, helper_key_cols: typing.List[pd.Series]) -> 'ContainMatchEngine':
+        super(ContainMatchEngine, self).build(helper_key_cols)
+        codes, uniques = pd.factorize(self.helper_keys)
+        # 按去重值分组的行位置，stable 排序保证组内位置升序
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        self.unique_positions = [order[bounds[i]:bounds[i + 1]] for i in range(len(uniques))]
+        # 非字符串（如空值）无法参与包含判断
+        self.uniques = [u if isinstance(u, str) else None for u in uniques]
+        self.empty_unique_ids = [i for i, u in enumerate(self.uniques) if u == ""]
+
+        self.automaton = AhoCorasickAutomaton([u or "" for u in self.uniques])
+        char_index, gram_index = {}, {}
+        for unique_id, value in enumerate(self.uniques):
+            if not value:
+                continue
+            for char in set(value):
+                char_index.setdefault(char, []).append(unique_id)
+            for gram in {value[i:i + 2] for i in range(len(value) - 1)}:
+                gram_index.setdefault(gram, []).append(unique_id)
+        self.char_index, self.gram_index = char_index, gram_index
+        return self
+
+    def memory_usage(self) -> int:
+        postings_length = sum(len(i) for i in self.char_index.values()) + sum(len(i) for i in self.gram_index.values())
+        return super(ContainMatchEngine, self).memory_usage() + \
+            sum(i.nbytes for i in self.unique_positions) + \
+            64 * len(self.automaton.goto if self.automaton else []) + 8 * postings_length
+
+    def _contained_by_key(self, key: str) -> typing.Iterable[int]:
+        """m in h：返回包含 key 的去重值id"""
+        if len(key) == 1:
+            return self.char_index.get(key, [])
+        postings = []
+        for gram in {key[i:i + 2] for i in range(len(key) - 1)}:
+            posting = self.gram_index.get(gram)
+            if not posting:
+                return []
+            postings.append(posting)
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:3]:  # 和最稀有的几个双字求交集即可，剩余的通过校验排除
+            candidates.intersection_update(posting)
+            if not candidates:
+                return []
+        return [i for i in candidates if key in self.uniques[i]]
+
+    def probe(self, key, limit: int = None, from_end=False) -> typing.Sequence[int]:
+        unique_ids = self.automaton.search(key)
+        unique_ids.update(self.empty_unique_ids)
+        unique_ids.update(self._contained_by_key(key))
+        if not unique_ids:
+            return ()
+        if len(unique_ids) == 1:
+            return limit_positions(self.unique_positions[unique_ids.pop()], limit, from_end)
+        # 有重复值策略时，每个去重值只需要取前（或者最后）limit 行，合并后再截取
+        return limit_positions(
+            np.sort(np.concatenate([limit_positions(self.unique_positions[i], limit, from_end) for i in unique_ids])),
+            limit, from_end
+        )
+
+
+class SimilarMatchEngine(BaseMatchEngine):
+    """相似匹配：相似度 = 2 * 匹配到的字符数 / 两个字符串的总长度（difflib），不小于 threshold 即为匹配到
+
+    逐对计算相似度太慢，先用辅助表的去重值建立 字符 的前缀索引（prefix filtering）生成候选，只对候选计算相似度：
+        1. 匹配到的字符数 <= 两个字符串的共同字符数（按出现次数计），相似度 >= t 时，共同字符数 >= t / (2 - t) * 长度
+        2. 每个字符串的字符按全局的出现频率排序（稀有的在前），共同字符数满足 1 时，两边的前缀必然有交集
+           前缀长度 = 长度 - 需要的共同字符数 + 1
+        3. 长度相差太多的不可能相似：t / (2 - t) <= 长度之比 <= (2 - t) / t
+        4. 候选的共同字符数需要 >= t * (两个字符串的总长度) / 2，最后才用 difflib 计算相似度
+    prefix_filter 为 False 时不建前缀索引，所有的去重值都是候选（辅助表的去重值很少时，建索引反而更慢，见 plan_match）
+    """
+    EPS = 1e-9  # 浮点误差，避免前缀被算短（漏掉候选）
+
+    def __init__(self, match_func: typing.Callable[[str, str], bool], threshold: float = SIMILARITY_THRESHOLD, prefix_filter=True):
+        super(SimilarMatchEngine, self).__init__(match_func)
+        self.threshold = threshold
+        self.prefix_filter = prefix_filter
+        self.uniques = []  # 辅助表去重后的值
+        self.unique_positions = []  # 每个去重值在辅助表中的位置（升序）
+        self.unique_lengths = []
+        self.unique_token_sets = []  # 每个去重值的 (字符, 第几次出现) 集合，用于计算共同字符数
+        self.token_rank = {}  # 字符 -> 出现频率的排名（稀有的在前）
+        self.prefix_index = {}  # 前缀中的字符 -> 去重值id
+
+    def get_prefix(self, tokens: typing.List[tuple]) -> typing.List[tuple]:
+        overlap = math.ceil(self.threshold / (2 - self.threshold) * len(tokens) - self.EPS)  # 需要的共同字符数
+        tokens = sorted(tokens, key=lambda token: (self.token_rank.get(token, -1), token))  # 辅助表中没有的字符最稀有
+        return tokens[:len(tokens) - overlap + 1]
+
+    def build(self, helper_key_cols: typing.List[pd.Series]) -> 'SimilarMatchEngine':
+        super(SimilarMatchEngine, self).build(helper_key_cols)
+        codes, uniques = pd.factorize(self.helper_keys)
+        # 按去重值分组的行位置，stable 排序保证组内位置升序
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        self.unique_positions = [order[bounds[i]:bounds[i + 1]] for i in range(len(uniques))]
+        self.uniques = [u if isinstance(u, str) else "" for u in uniques]
+        self.unique_lengths = [len(u) for u in self.uniques]
+
+        unique_tokens = [get_char_tokens(u) for u in self.uniques]
+        self.unique_token_sets = [frozenset(tokens) for tokens in unique_tokens]
+        if not self.prefix_filter:
+            return self
+        token_count = {}
+        for tokens in unique_tokens:
+            for token in tokens:
+                token_count[token] = token_count.get(token, 0) + 1
+        self.token_rank = {token: rank for rank, token in enumerate(sorted(token_count, key=lambda i: (token_count[i], i)))}
+        prefix_index = {}
+        for unique_id, tokens in enumerate(unique_tokens):
+            for token in self.get_prefix(tokens):
+                prefix_index.setdefault(token, []).append(unique_id)
+        self.prefix_index = prefix_index
+        return self
+
+    def memory_usage(self) -> int:
+        postings_length = sum(len(i) for i in self.prefix_index.values())
+        return super(SimilarMatchEngine, self).memory_usage() + \
+            sum(i.nbytes for i in self.unique_positions) + 64 * len(self.token_rank) + 8 * postings_length + \
+            sum(sys.getsizeof(i) for i in self.unique_token_sets)
+
+    def probe_with_scores(self, key, limit: int = None, from_end=False) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """返回匹配到的辅助表的行位置（升序），以及对应的相似度"""
+        if not isinstance(key, str) or not key:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        key_tokens = get_char_tokens(key)
+        if self.prefix_filter:
+            candidates = set()
+            for token in self.get_prefix(key_tokens):
+                candidates.update(self.prefix_index.get(token, ()))
+        else:
+            candidates = range(len(self.uniques))
+        key_token_set = frozenset(key_tokens)
+        threshold, ratio = self.threshold, self.threshold / (2 - self.threshold)
+        min_length, max_length = len(key) * ratio - self.EPS, len(key) / ratio + self.EPS
+        # 长度和共同字符数都满足的候选，才计算相似度
+        matched = []
+        for unique_id in candidates:
+            length = self.unique_lengths[unique_id]
+            if not min_length <= length <= max_length:
+                continue
+            if len(key_token_set & self.unique_token_sets[unique_id]) < threshold * (len(key) + length) / 2 - self.EPS:
+                continue
+            score = get_similarity(key, self.uniques[unique_id])
+            if score >= threshold:
+                matched.append((unique_id, score))
+        if not matched:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        positions = np.concatenate([self.unique_positions[unique_id] for unique_id, _ in matched])
+        scores = np.concatenate([np.full(len(self.unique_positions[unique_id]), score) for unique_id, score in matched])
+        order = np.argsort(positions, kind="stable")
+        return limit_positions(positions[order], limit, from_end), limit_positions(scores[order], limit, from_end)
+
+    def probe(self, key, limit: int = None, from_end=False) -> typing.Sequence[int]:
+        return self.probe_with_scores(key, limit, from_end)[0]
+
+    def match(self, main_key_cols: typing.List[pd.Series], limit: int = None, from_end=False) -> MatchResult:
+        self.check_built()
+        main_keys = to_key_series(main_key_cols).to_numpy()
+        no_content = get_no_content_mask(main_key_cols)
+        empty = (np.empty(0, dtype=np.int64), np.empty(0))
+        probed = [empty if is_no_content else self.probe_with_scores(key, limit, from_end) for key, is_no_content in zip(main_keys, no_content)]
+        return MatchResult.from_position_lists([i[0] for i in probed], no_content, [i[1] for i in probed])
+
+
+class CompositeMatchEngine(BaseMatchEngine):
+    """多列联合条件（无法合成一个哈希值的匹配方式）：每一列用各自的引擎匹配，辅助表的行需要同时满足所有列"""
+    def __init__(self, engines: typing.List[BaseMatchEngine]):
+        super(CompositeMatchEngine, self).__init__(engines[0].match_func)
+        self.engines = engines
+
+    def build(self, helper_key_cols: typing.List[pd.Series]) -> 'CompositeMatchEngine':
+        super(CompositeMatchEngine, self).build(helper_key_cols)
+        for engine, helper_key_col in zip(self.engines, helper_key_cols):
+            engine.build([helper_key_col])
+        return self
+
+    def memory_usage(self) -> int:
+        return sum(engine.memory_usage() for engine in self.engines)
+
+    def match(self, main_key_cols: typing.List[pd.Series], limit: int = None, from_end=False) -> MatchResult:
+        self.check_built()
+        no_content = get_no_content_mask(main_key_cols)
+        # 无内容的行不需要匹配；每一列需要完整的结果才能求交集，重复值策略在交集之后截取
+        has_content = ~no_content
+        col_results = [
+            engine.match([main_key_col[has_content]]) for engine, main_key_col in zip(self.engines, main_key_cols)
+        ]
+
+        # 每一列都有相似度时（相似匹配），取各列相似度中最低的
+        with_scores = all(col_result.scores is not None for col_result in col_results)
+
+        def intersect(row_position):
+            # 各列的结果都是升序的，交集仍然保持辅助表中的原始顺序
+            positions = col_results[0].get(row_position)
+            scores = col_results[0].get_scores(row_position) if with_scores else positions
+            for col_result in col_results[1:]:
+                if len(positions) == 0:
+                    break
+                positions, left, right = np.intersect1d(positions, col_result.get(row_position), assume_unique=True, return_indices=True)
+                if with_scores:
+                    scores = np.minimum(scores[left], col_result.get_scores(row_position)[right])
+            return limit_positions(positions, limit, from_end), limit_positions(scores, limit, from_end)
+
+        matched = iter([intersect(i) for i in range(int(has_content.sum()))])
+        empty = (np.empty(0, dtype=np.int64), np.empty(0))
+        intersected = [empty if is_no_content else next(matched) for is_no_content in no_content]
+        return MatchResult.from_position_lists(
+            [i[0] for i in intersected], no_content, [i[1] for i in intersected] if with_scores else None
+        )
+
+
+def match_chunk_in_subprocess(
+        shared_name: str, shared_size: int, main_key_cols: typing.List[pd.Series], limit: int = None, from_end=False
+) -> MatchResult:
+    """在子进程中执行：从共享内存中读取构建好的引擎，匹配主表的一个分块"""
+    engine = load_shared_object(shared_name, shared_size)
+    return engine.match(main_key_cols, limit, from_end)
+
+
+def match_with_process_pool(
+        engine: BaseMatchEngine, main_key_cols: typing.List[pd.Series], chunk_size: int,
+        progress_callback: typing.Callable[[int, int], None] = None, limit: int = None, from_end=False,
+        cancel_token: CancelToken = None,
+) -> MatchResult:
+    """将主表按行切分成多个分块，在常驻的进程池中并行匹配，再按原始的行顺序合并
+    构建好的引擎（辅助表的索引）只通过共享内存传递一次，不随每个分块序列化
+    cancel_token 被取消时抛出 CancelledError（见 run_in_process_pool）
+    """
+    engine.check_built()
+    row_count = len(main_key_cols[0])
+    chunks = [
+        [main_key_col.iloc[start:start + chunk_size] for main_key_col in main_key_cols]
+        for start in range(0, row_count, chunk_size)
+    ]
+    with SharedObject(engine) as shared:
+        results = run_in_process_pool(
+            match_chunk_in_subprocess, [(shared.name, shared.size, chunk, limit, from_end) for chunk in chunks],
+            progress_callback, cancel_token
+        )
+    return MatchResult.concat(results)
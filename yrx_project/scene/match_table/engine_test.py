@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from yrx_project.scene.match_table.const import KEY_TYPE_STR
+from yrx_project.scene.match_table.engine import BruteForceMatchEngine, CompositeMatchEngine, parse_match_policy
+from yrx_project.scene.match_table.main import get_match_engine, strip_key_col, MATCH_FUNC_MAP, STR_EQUAL, STR_CONTAINED, \
+    STR_SIMILAR
+from yrx_project.utils.string_util import IGNORE_NOTHING, IGNORE_PUNC, IGNORE_CHINESE_PAREN, IGNORE_ENGLISH_PAREN
+
+# 包含重复值、空值、空字符串、标点和括号，不同的忽略规则处理后，匹配到的行不同
+HELPER_DF = pd.DataFrame({
+    "书名": ["三体", "三体（全集）", "活着", "活着", "a(b)", "a", "", None, "三 体", "围城!", "三体Ⅱ", "活着吧"],
+    "作者": ["刘慈欣", "刘慈欣", "余华", "余华", "x", "x", "", "余华", "刘慈欣", "钱锺书", "刘慈欣", "余华"],
+})
+MAIN_DF = pd.DataFrame({
+    "书名": ["三体", "三体（全集）上", "活着", "a(b)c", "", None, "围城", "三体,", "体", "三体Ⅱ", "活着吧!"],
+    "作者": ["刘慈欣", "刘慈欣", "余华", "x", "", "余华", "钱锺书", "刘慈欣", "刘慈欣", "刘慈欣", "余华"],
+})
+
+
+@pytest.mark.parametrize("match_func_name", [STR_EQUAL, STR_CONTAINED, STR_SIMILAR])
+@pytest.mark.parametrize("key_cols", [["书名"], ["书名", "作者"]])
+@pytest.mark.parametrize("ignore_policy", [
+    [IGNORE_NOTHING], [IGNORE_PUNC], [IGNORE_CHINESE_PAREN], [IGNORE_ENGLISH_PAREN],
+    [IGNORE_PUNC, IGNORE_CHINESE_PAREN, IGNORE_ENGLISH_PAREN],
+])
+@pytest.mark.parametrize("match_policy", ["all", "first", "last", "top_n(2)"])
+def test_engine_same_as_brute_force(match_func_name, key_cols, ignore_policy, match_policy):
+    """建索引的匹配引擎（哈希、AC自动机、前缀过滤）和逐个比较的结果完全一致：无内容、匹配到的辅助表行位置（原始顺序）"""
+    match_func = MATCH_FUNC_MAP[match_func_name]
+    limit, from_end = parse_match_policy(match_policy)
+    main_key_cols = [strip_key_col(MAIN_DF[col], tuple(ignore_policy), KEY_TYPE_STR) for col in key_cols]
+    helper_key_cols = [strip_key_col(HELPER_DF[col], tuple(ignore_policy), KEY_TYPE_STR) for col in key_cols]
+
+    engine = get_match_engine(match_func, len(key_cols))
+    assert not isinstance(engine, BruteForceMatchEngine)
+    brute_force = BruteForceMatchEngine(match_func) if len(key_cols) == 1 else \
+        CompositeMatchEngine([BruteForceMatchEngine(match_func) for _ in key_cols])
+    result = engine.build(helper_key_cols).match(main_key_cols, limit, from_end)
+    expected = brute_force.build(helper_key_cols).match(main_key_cols, limit, from_end)
+    np.testing.assert_array_equal(result.no_content, expected.no_content)
+    np.testing.assert_array_equal(result.offsets, expected.offsets)
+    np.testing.assert_array_equal(result.indices, expected.indices)
+    assert len(expected.indices) > 0
@@ -1,40 +1,338 @@
+import functools
 import time
 import typing
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import cpu_count
 
+import numpy as np
 import pandas as pd
 
-from yrx_project.scene.match_table.const import MATCH_OPTION, MAKEUP_MAIN_COL, ADD_COL_OPTION, MAKEUP_MAIN_COL_WITH_OVERWRITE
-from yrx_project.utils.string_util import remove_by_ignore_policy
+from yrx_project.scene.match_table.cache import match_cache, make_cache_key
+from yrx_project.scene.match_table.const import MATCH_OPTION, MAKEUP_MAIN_COL, ADD_COL_OPTION, MAKEUP_MAIN_COL_WITH_OVERWRITE, \
+    MULTIPROCESSING_CHUNK_SIZE, MULTIPROCESSING_MIN_ROWS, SIMILARITY_THRESHOLD, KEY_TYPE_STR
+from yrx_project.scene.match_table.planner import MatchPlan, plan_match, estimate_helper_stats, PHASE_STRIP, PHASE_BUILD, PHASE_MATCH, \
+    PHASE_ASSEMBLE
+from yrx_project.scene.match_table.engine import BaseMatchEngine, BruteForceMatchEngine, HashMatchEngine, \
+    ContainMatchEngine, SimilarMatchEngine, CompositeMatchEngine, MatchResult, KeyDictionary, match_with_process_pool, \
+    parse_match_policy
+from yrx_project.scene.match_table.typed_key import resolve_key_type, to_typed_key, KEY_TYPE_NAME_MAP
+from yrx_project.utils.cache_util import get_object_size
+from yrx_project.utils.process_pool import is_picklable, CancelToken
+from yrx_project.utils.string_util import remove_by_ignore_policy_for_series, get_similarity
 
 STR_EQUAL = "相等"
 STR_CONTAINED = "任意包含"
+STR_SIMILAR = "相似"
+
+
+
+# 匹配函数定义在模块级（而不是 lambda），才可以传递到子进程中
+def equal_match_func(m, h):
+    return m == h
+
+
+def contained_match_func(m, h):
+    return h in m or m in h
+
+
+def similar_match_func(m, h):
+    return get_similarity(m, h) >= SIMILARITY_THRESHOLD
+
 
 MATCH_FUNC_MAP = {
-    STR_EQUAL: lambda m, h: m == h,
-    STR_CONTAINED: lambda m, h: h in m or m in h,
+    STR_EQUAL: equal_match_func,
+    STR_CONTAINED: contained_match_func,
+    STR_SIMILAR: similar_match_func,
+}
+
+# 可以建立索引的匹配函数，对应的匹配引擎；其他的自定义函数使用兜底的逐个比较
+MATCH_ENGINE_MAP = {
+    MATCH_FUNC_MAP[STR_EQUAL]: HashMatchEngine,
+    MATCH_FUNC_MAP[STR_CONTAINED]: ContainMatchEngine,
+    MATCH_FUNC_MAP[STR_SIMILAR]: SimilarMatchEngine,
 }
 
-def match_table(main_df, match_cols_and_df: typing.List[dict], add_overall_match_info=False) -> (pd.DataFrame, dict, dict):
+
+def get_match_engine(match_func, key_count=1, similarity_threshold=SIMILARITY_THRESHOLD) -> BaseMatchEngine:
+    """
+    :param match_func: 匹配函数
+    :param key_count: 匹配列的个数，多于1个时为多列联合条件
+    :param similarity_threshold: 相似匹配的阈值（相似度不小于阈值即为匹配到），其他匹配方式不使用，
+        取值范围 (0, 1]：阈值为 0 时任意两个字符串都相似，前缀过滤无法生成候选
+    """
+    engine_cls = MATCH_ENGINE_MAP.get(match_func, BruteForceMatchEngine)
+    if engine_cls is SimilarMatchEngine:
+        check_similarity_threshold(similarity_threshold)
+        engine_cls = functools.partial(SimilarMatchEngine, threshold=similarity_threshold)
+    # 相等匹配的多列可以合成一个 tuple 作为哈希值，其他的匹配方式需要逐列匹配后取交集
+    if key_count == 1 or engine_cls is HashMatchEngine:
+        return engine_cls(match_func)
+    return CompositeMatchEngine([engine_cls(match_func) for _ in range(key_count)])
+
+
+def resolve_condition_key_types(main_key_cols: typing.List[pd.Series], helper_key_cols: typing.List[pd.Series], match_dict: dict) -> typing.List[str]:
+    """一个条件每一列的匹配值类型（见 resolve_key_type）：只有相等匹配按类型匹配，其他的匹配方式都是字符串
+    每一列的 key_type 默认和整个条件的一致
+    """
+    if not isinstance(get_match_engine(match_dict["match_func"], len(helper_key_cols)), HashMatchEngine):
+        return [KEY_TYPE_STR] * len(helper_key_cols)
+    return [
+        resolve_key_type(main_col, helper_col, col_dict.get("key_type") or match_dict.get("key_type"))
+        for main_col, helper_col, col_dict in zip(main_key_cols, helper_key_cols, match_dict["match_cols"])
+    ]
+
+
+def check_similarity_threshold(similarity_threshold: float):
+    """相似匹配的阈值需要在 (0, 1] 之间"""
+    if not 0 < similarity_threshold <= 1:
+        raise ValueError(f"similarity_threshold must be in (0, 1]: {similarity_threshold}")
+
+
+def get_similarity_threshold(match_dict: dict) -> float:
+    """一个条件的相似匹配的阈值，没有设置时为 SIMILARITY_THRESHOLD，不在 (0, 1] 之间时抛出 ValueError"""
+    similarity_threshold = match_dict.get("similarity_threshold")  # 只对相似匹配生效
+    similarity_threshold = SIMILARITY_THRESHOLD if similarity_threshold is None else float(similarity_threshold)
+    check_similarity_threshold(similarity_threshold)
+    return similarity_threshold
+
+
+def get_col_ignore_policy_list(match_dict: dict) -> typing.List[tuple]:
+    """一个条件每一列的忽略规则，每一列的 match_ignore_policy 默认和整个条件的一致"""
+    return [tuple(col_dict.get("match_ignore_policy") or match_dict["match_ignore_policy"]) for col_dict in match_dict["match_cols"]]
+
+
+def strip_key_col(col: pd.Series, col_ignore_policy: tuple, key_type: str) -> pd.Series:
+    """按匹配值类型转换一列，字符串的列按忽略规则处理"""
+    if key_type != KEY_TYPE_STR:
+        return to_typed_key(col, key_type)
+    return remove_by_ignore_policy_for_series(col.astype(str), list(col_ignore_policy))
+
+
+class HelperIndex:
+    """一个条件的辅助表一侧：建好索引的匹配引擎 和 辅助表的统计（见 estimate_helper_stats）
+    流式匹配时在读取主表的分块之前建好（见 build_helper_index），每个分块的 match_table 直接使用，只做主表一侧的匹配
+    key 是建索引时每一列的 (忽略规则, 匹配值类型)，和 match_table 中解析出的不一致时不使用
+    """
+    def __init__(self, engine: BaseMatchEngine, helper_stats: dict, key: tuple):
+        self.engine = engine
+        self.helper_stats = helper_stats
+        self.key = key
+
+
+def build_helper_index(match_dict: dict) -> typing.Optional[HelperIndex]:
+    """建立一个条件的辅助表索引（参数同 match_table 中的一个条件）
+    匹配值的类型需要已经决定（见 resolve_key_type），auto、number 需要根据主表决定，和辅助表的列不存在时一样返回 None
+    """
+    match_cols, match_df = match_dict["match_cols"], match_dict["df"]
+    if not match_cols or any(col_dict["match_col"] not in match_df.columns for col_dict in match_cols):
+        return None
+    helper_key_cols = [match_df[col_dict["match_col"]] for col_dict in match_cols]
+    engine = get_match_engine(match_dict["match_func"], len(match_cols), get_similarity_threshold(match_dict))
+    col_key_type_list = [KEY_TYPE_STR] * len(match_cols)
+    if isinstance(engine, HashMatchEngine):
+        col_key_type_list = [col_dict.get("key_type") or match_dict.get("key_type") or KEY_TYPE_STR for col_dict in match_cols]
+        if any(key_type not in KEY_TYPE_NAME_MAP for key_type in col_key_type_list):
+            return None
+    col_ignore_policy_list = get_col_ignore_policy_list(match_dict)
+    helper_stats = estimate_helper_stats(engine, helper_key_cols)
+    engine = engine.build([
+        strip_key_col(col, col_ignore_policy, key_type)
+        for col, col_ignore_policy, key_type in zip(helper_key_cols, col_ignore_policy_list, col_key_type_list)
+    ])
+    return HelperIndex(engine, helper_stats, (tuple(col_ignore_policy_list), tuple(col_key_type_list)))
+
+
+def should_use_process_pool(engine: BaseMatchEngine, row_count: int) -> bool:
+    """相等匹配已经是向量化的，不需要多进程；主表太小或者匹配函数无法传递到子进程时也不启用"""
+    return not isinstance(engine, HashMatchEngine) and \
+        row_count >= MULTIPROCESSING_MIN_ROWS and \
+        cpu_count() > 1 and \
+        is_picklable(engine.match_func)
+
+
+def get_match_result(
+        main_key_cols: typing.List[pd.Series], helper_key_cols: typing.List[pd.Series], col_ignore_policy_list: typing.List[tuple],
+        match_func, main_cache_key=None, helper_cache_key=None, use_multiprocessing=False, progress_callback=None,
+        match_policy="all", plan: MatchPlan = None, col_key_type_list: typing.List[str] = None, cancel_token: CancelToken = None,
+        similarity_threshold=SIMILARITY_THRESHOLD, helper_engine: BaseMatchEngine = None,
+) -> MatchResult:
+    """匹配一个条件：主表和辅助表的匹配列分别按各自的忽略规则处理后，用匹配引擎匹配
+    主表的匹配列先字典编码（KeyDictionary），只匹配去重值，再按编码展开到每一行
+    处理后的匹配列、字典编码、匹配索引、匹配结果 都可以跨多次执行缓存（来源的 cache_key 为 None 时不缓存）
+    plan 不为 None 时，用计划中的匹配引擎（见 MatchPlan.create_engine），并记录各阶段实际的耗时（命中缓存的阶段不计）
+    col_key_type_list 是每一列的匹配值类型（见 resolve_key_type），不是字符串的列转换成原生的类型，不按忽略规则处理
+    cancel_token 是取消标记（见 CancelToken），多进程匹配时被取消抛出 CancelledError
+    similarity_threshold 是相似匹配的阈值，不同的阈值建立的索引不同，和计划选择的执行方式一样，是索引缓存的 key 的一部分
+    helper_engine 是已经建好索引的匹配引擎（见 HelperIndex），不为 None 时直接使用，不再处理辅助表和建索引
+    """
+    limit, from_end = parse_match_policy(match_policy)
+    main_col_list = [col.name for col in main_key_cols]
+    match_col_list = [col.name for col in helper_key_cols]
+    col_key_type_list = col_key_type_list or [KEY_TYPE_STR] * len(helper_key_cols)
+    engine_cache_key = make_cache_key(
+        helper_cache_key, "engine", tuple(match_col_list), tuple(col_ignore_policy_list), match_func, tuple(col_key_type_list),
+        similarity_threshold, plan.strategy if plan is not None else None,
+    )
+    all_match_cache_key = make_cache_key(main_cache_key, "match", tuple(main_col_list), engine_cache_key) if engine_cache_key else None
+    match_cache_key = make_cache_key(all_match_cache_key, limit, from_end) if limit is not None else all_match_cache_key
+
+    def timed(phase, func):
+        if plan is None:
+            return func()
+        start = time.time()
+        try:
+            return func()
+        finally:
+            plan.add_actual(phase, time.time() - start)
+
+    def get_striped_col(col, col_ignore_policy, key_type, source_key):
+        if key_type != KEY_TYPE_STR:
+            cache_key = make_cache_key(source_key, "typed_col", col.name, key_type)
+        else:
+            cache_key = make_cache_key(source_key, "striped_col", col.name, col_ignore_policy)
+        return match_cache.get_or_set(cache_key, lambda: timed(PHASE_STRIP, lambda: strip_key_col(col, col_ignore_policy, key_type)))
+
+    def get_striped_cols(key_cols, source_key):
+        return [
+            get_striped_col(col, col_ignore_policy, key_type, source_key)
+            for col, col_ignore_policy, key_type in zip(key_cols, col_ignore_policy_list, col_key_type_list)
+        ]
+
+    def build_engine():
+        striped_match_cols = get_striped_cols(helper_key_cols, helper_cache_key)
+        engine = plan.create_engine() if plan is not None else get_match_engine(match_func, len(helper_key_cols), similarity_threshold)
+        return timed(PHASE_BUILD, lambda: engine.build(striped_match_cols))
+
+    def run_match():
+        # 已经有全部的匹配结果时，按重复值策略截取即可
+        all_match_result = match_cache.get(all_match_cache_key) if limit is not None and all_match_cache_key else None
+        if all_match_result is not None:
+            return all_match_result.limit(limit, from_end)
+        engine = helper_engine if helper_engine is not None else match_cache.get_or_set(engine_cache_key, build_engine)
+        striped_main_cols = get_striped_cols(main_key_cols, main_cache_key)
+        # 字典编码只和主表的匹配列有关，同一个主表匹配列的多个条件（不同的辅助表）共用
+        dictionary = match_cache.get_or_set(
+            make_cache_key(main_cache_key, "dictionary", tuple(main_col_list), tuple(col_ignore_policy_list), tuple(col_key_type_list)),
+            lambda: timed(PHASE_STRIP, lambda: KeyDictionary.encode(striped_main_cols))
+        )
+        unique_main_cols = dictionary.take_uniques(striped_main_cols)
+        if use_multiprocessing and should_use_process_pool(engine, len(dictionary)):
+            unique_result = timed(PHASE_MATCH, lambda: match_with_process_pool(
+                engine, unique_main_cols, MULTIPROCESSING_CHUNK_SIZE, progress_callback, limit=limit, from_end=from_end,
+                cancel_token=cancel_token,
+            ))
+        else:
+            unique_result = timed(PHASE_MATCH, lambda: engine.match(unique_main_cols, limit, from_end))
+        return timed(PHASE_MATCH, lambda: dictionary.broadcast(unique_result))
+
+    return match_cache.get_or_set(match_cache_key, run_match)
+
+
+class ConditionOutput:
+    """一个条件需要拼接到主表的列，按拼接的顺序记录：[(列名, 值, 类型)]
+    类型：extra 匹配附加信息，catch 从辅助表增加的列，makeup 补充后的主表列
+    plan 是生成这些列时的执行计划，直接使用这些列时复用（见 MatchPlan.reuse）
+    """
+    def __init__(self, match_result: MatchResult, columns: typing.List[tuple], plan: MatchPlan = None):
+        self.match_result = match_result
+        self.columns = columns
+        self.plan = plan
+
+    def memory_usage(self) -> int:
+        return self.match_result.memory_usage() + sum(get_object_size(values) for _, values, _ in self.columns)
+
+
+def build_condition_output(
+        main_df, task: dict, match_result: MatchResult, match_detail_text: typing.List[str], updated_cols: dict = None
+) -> ConditionOutput:
+    """根据匹配结果生成需要拼接的列（不修改主表，updated_cols 是主表中已经被前面的条件补充过的列）
+    1. 增加「匹配情况（文字）」列 和 「匹配情况（行数）」列（相似匹配时还有「匹配情况（相似度）」列）
+    2. 将标记为需要 「添加一列」的列，根据 找到的行 ，从match_df中取出来（\n分割）
+    3. 将标记为需要 「补充到主表」的列，根据找到的行，补充到主表对应列中（\n分割）
+    """
+    match_id, match_df = task["match_id"], task["match_df"]
+    match_tip = match_detail_text[0] if len(match_detail_text) > 0 else ""
+    unmatch_tip = match_detail_text[1] if len(match_detail_text) > 1 else ""
+    no_content_tip = match_detail_text[2] if len(match_detail_text) > 2 else ""
+
+    matched_mask, unmatched_mask = match_result.matched_mask, match_result.unmatched_mask
+    columns = [
+        (f"{match_id}%%匹配附加信息（文字）", np.select([matched_mask, unmatched_mask], [match_tip, unmatch_tip], default=no_content_tip).astype(object), "extra"),
+        (f"{match_id}%%匹配附加信息（行数）", match_result.counts, "extra"),
+    ]
+    if match_result.scores is not None:  # 相似匹配：匹配到的最高相似度
+        best_scores = match_result.best_scores
+        columns.append((
+            f"{match_id}%%匹配附加信息（相似度）",
+            np.where(np.isnan(best_scores), '', np.round(best_scores, 4).astype(object)).astype(object),
+            "extra",
+        ))
+
+    # 携带列或者补充到主表：每一列只需要一次 取值+分组拼接，再按匹配情况整列选择
+    makeup_cols = dict(updated_cols or {})  # 同一个条件中多次补充同一列时，后面的基于前面补充后的结果
+    for catch_col_with_policy in task["catch_cols_with_policy"]:
+        catch_col_name = catch_col_with_policy[0]
+        catch_values = match_df[catch_col_name].astype(str).replace('nan', '').to_numpy()  # 处理 NaN
+        joined_values = match_result.join_values(catch_values)
+        if catch_col_with_policy[1] == ADD_COL_OPTION:  # 说明需要添加一列
+            columns.append((f'{match_id}%%{catch_col_name}', joined_values, "catch"))
+
+        elif catch_col_with_policy[1] in (MAKEUP_MAIN_COL_WITH_OVERWRITE, MAKEUP_MAIN_COL):
+            main_col_name = catch_col_with_policy[2]
+            main_col = makeup_cols[main_col_name] if main_col_name in makeup_cols else main_df[main_col_name]
+            main_values = main_col.to_numpy(dtype=object)
+            # 匹配到时用辅助表的值，未匹配时保留原值，主表内容为空时设为空字符串
+            makeup_values = np.where(matched_mask, joined_values, np.where(unmatched_mask, main_values, ''))
+            if catch_col_with_policy[1] == MAKEUP_MAIN_COL:
+                # 不覆盖：主表有值时保留原值（和 bool(value) 的判断一致，nan 也算有值）
+                makeup_values = np.where(main_values.astype(bool), main_values, makeup_values)
+            makeup_cols[main_col_name] = pd.Series(makeup_values, index=main_df.index, dtype=object).infer_objects()
+            columns.append((main_col_name, makeup_cols[main_col_name], "makeup"))
+    return ConditionOutput(match_result, columns, task["plan"])
+
+
+def match_table(
+        main_df, match_cols_and_df: typing.List[dict], add_overall_match_info=False, main_cache_key=None,
+        use_multiprocessing=False, progress_callback=None, inplace=False, cancel_token: CancelToken = None
+) -> (pd.DataFrame, dict, dict):
     """
     :param main_df:
+        主表，默认不修改（拼接的列最后一次性拼接到一个新的df中）
+    :param inplace:
+        是否直接将结果拼接到 main_df 中
     :param add_overall_match_info:
         是否需要添加总体匹配信息
+    :param main_cache_key:
+        主表的来源：(文件指纹, 工作表, 标题行)，和辅助表的 cache_key 一起用于跨多次执行的缓存，为None时不缓存
+    :param use_multiprocessing:
+        是否将主表分块后在进程池中并行匹配（只对 任意包含 等无法向量化的匹配方式，且主表足够大时生效）
+    :param progress_callback:
+        多进程匹配时，每完成一个分块回调一次：progress_callback(match_id, 已完成的分块数, 总分块数)
+    :param cancel_token:
+        取消标记（见 CancelToken），由调用方创建，取消后（如重置时）不再匹配剩下的条件，进程池中没有完成的分块也不再执行，抛出 CancelledError
     :param match_cols_and_df:
         [
             {
                 “id”: "",  #展示信息时，用这个id作为key
                 "df": pd.DataFrame,
-                "match_cols": [
+                "match_cols": [  # 多个时为多列联合条件，需要同时满足
                     {
                         "main_col": "a",
                         "match_col": "a",
+                        "match_ignore_policy": [],  # 可选，这一列单独的忽略规则，默认和整个条件的一致
+                        "key_type": "str",  # 可选，这一列单独的匹配值类型，默认和整个条件的一致
                     },
                 ],
                 "catch_cols": [],  # 匹配到后，在辅助表中需要保留的列
                 "match_func": lambda x, y: x == y,  # 匹配函数
+                "similarity_threshold": 0.8,  # 可选，相似匹配的阈值，取值范围 (0, 1]（不含0），默认 SIMILARITY_THRESHOLD
+                "match_policy": "all",  # 可选，重复值策略：all 全部 / first 第一行 / last 最后一行 / top_n(k) 前k行
                 "match_ignore_policy":  # ["不忽略任何内容“]  或者  ["忽略所有中英文标点符号", "中文括号及内容"]
+                "key_type": "str",  # 可选，匹配值的类型（只对相等匹配生效）：str 字符串 / auto 自动 / number 数字 / date 日期，或者 resolve_key_type 的结果
                 "match_detail_text": lambda x, y: x == y,  # 匹配函数
                 "match_detail_text":  # ｜ 分割的匹配到的，为匹配到的，为空的，额外展示的列
+                "cache_key": (文件指纹, 工作表, 标题行),  # 可选，辅助表的来源，用于跨多次执行的缓存
+                "helper_index": HelperIndex,  # 可选，已经建好的辅助表索引（见 build_helper_index），流式匹配时每个分块复用
             }
         ]
     :return:
@@ -46,12 +344,14 @@ def match_table(main_df, match_cols_and_df: typing.List[dict], add_overall_match
                 “unmatch_index_list”: 未匹配到的行索引,
                 "no_content_index_list": 无内容的行索引,
             }
+            其中 explain 是每个条件的执行计划（见 MatchPlan.explain），condition_hit_matrix 是每个条件的匹配情况组成的矩阵（行：主表的行，列：condition_ids 中的条件）
         detail_match_info：分辅助表的匹配详情
 
     匹配结果增加
         match_id%%{col}
         match_id%%匹配附加信息（文字）
         match_id%%匹配附加信息（行数）
+        match_id%%匹配附加信息（相似度）  # 只有相似匹配时才有
 
     举例
         主表
@@ -87,172 +387,247 @@ def match_table(main_df, match_cols_and_df: typing.List[dict], add_overall_match
     # 全局的额外信息
     match_detail_text = []  # ["匹配到", "未匹配到"]
     no_content_indices = []
-    match_mapping = {}  # {1: [1,3]}  主表的第一列，的第1和3cell 匹配到了
+    main_col_conditions = {}  # {1: [match_id, ...]}  主表的第1列，是哪些条件的匹配列
+    condition_matched_masks = {}  # {match_id: [False, True, ...]}  每个条件，主表的每一行是否匹配到了
+    no_content_mask = np.zeros(len(main_df), dtype=bool)
     first_match_text = []
 
-    for match_dict in match_cols_and_df:  # 对应不同辅助表的多个条件
-        start_for_one_df = time.time()
+    # 需要拼接的列先记录下来，最后一次性拼接，不在匹配过程中修改主表（每次修改主表都可能复制整个df）
+    output_cols = {}  # {列名: 值}  主表中已有的列（补充到主表）会被替换，其他的列按顺序拼接在最后
+    added_col_locs = {}  # {列名: 在结果中的位置}  新增的列
+
+    def get_current_col(col_name):
+        """主表的列，被前面的条件补充过时返回补充后的列"""
+        return output_cols[col_name] if col_name in output_cols else main_df[col_name]
+
+    def set_output_col(col_name, values):
+        output_cols[col_name] = values
+        if col_name not in main_df.columns and col_name not in added_col_locs:
+            added_col_locs[col_name] = len(main_df.columns) + len(added_col_locs)
+
+    def get_col_loc(col_name):
+        return added_col_locs[col_name] if col_name in added_col_locs else main_df.columns.get_loc(col_name)
 
+    # 一、解析和校验所有的条件
+    match_tasks = []
+    makeup_main_cols = set()  # 会被「补充到主表」修改的主表列
+    upstream_makeup_keys = ()  # 前面所有「补充到主表」的条件，它们的参数变化时，后面的条件读到的主表也会变化
+    for match_dict in match_cols_and_df:  # 对应不同辅助表的多个条件
         # 1.获取变量
         match_id = match_dict["id"]  # 一般是辅助表的文件名
         match_df = match_dict['df']
         match_cols = match_dict['match_cols']  # [{"main_col": "", "match_col"}]
         catch_cols_with_policy = match_dict['catch_cols']  # [["a", "添加一列"], ["b", "补充到主表", "c"]]
-        match_ignore_policy = match_dict['match_ignore_policy']  # ["不忽略任何内容“]  或者  ["忽略所有中英文标点符号", "中文括号及内容"]
-        match_detail_text = match_dict['match_detail_text']  # 匹配到 ｜ 未匹配到 ｜ 无内容
         match_func = match_dict['match_func']  # lambda x, y: x == y
+        similarity_threshold = get_similarity_threshold(match_dict)  # 只对相似匹配生效
 
         # 2.变量校验
-        ## 目前只支持单条件匹配
-        col_dict = match_cols[0]  # [{"main_col": "", "match_col"}, ...]
-        main_col = col_dict['main_col']
-        match_col = col_dict['match_col']
-        if main_col not in main_df.columns or match_col not in match_df.columns:
+        ## 多列联合条件：所有的列都需要存在
+        main_col_list = [col_dict['main_col'] for col_dict in match_cols]  # [{"main_col": "", "match_col"}, ...]
+        match_col_list = [col_dict['match_col'] for col_dict in match_cols]
+        if not match_cols or \
+                any(main_col not in main_df.columns for main_col in main_col_list) or \
+                any(match_col not in match_df.columns for match_col in match_col_list):
             continue
 
         ## catch cols 只获取存在的列
         catch_cols_with_policy = [i for i in catch_cols_with_policy if i[0] in match_df.columns]
 
-        # 3. 核心逻辑
-        ## 1. 根据match func 在match_df中找到匹配的行，可能有多行（可以先记录在main_df）中
-        ## 2. 将标记为需要 「添加一列」的列，根据 找到的行 ，从match_df中取出来，拼接到main_df中（\n分割）
-        ## 3. 将标记为需要 「补充到主表」的列，根据找到的行，补充到主表对应列中（\n分割）
-        ##    .replace('', np.nan) 然后 再 fillna
-        ## 4. 增加「匹配情况（文字）」列 和 「匹配情况（行数）」列
-        striped_main_col = main_df[main_col].astype(str).apply(remove_by_ignore_policy, args=(match_ignore_policy,))
-        striped_match_col = match_df[match_col].astype(str).apply(remove_by_ignore_policy, args=(match_ignore_policy,))
-
-
-        match_detail_text = [i.strip() for i in match_detail_text.split("｜")]
-        if not first_match_text:
-            first_match_text = match_detail_text
-        match_tip = match_detail_text[0] if len(match_detail_text) > 0 else ""
-        unmatch_tip = match_detail_text[1] if len(match_detail_text) > 1 else ""
-        no_content_tip = match_detail_text[2] if len(match_detail_text) > 2 else ""
-
-        # None记录为main_df无内容，用于和未匹配到的[]区分
-        # match_func 是一个自定义的纯函数，无法直接用merge（并非简单的等值判断）
-        def match_text(row):
-            if isinstance(row, list):
-                if len(row) > 0:
-                    return match_tip
-                return unmatch_tip
-            return no_content_tip
-
-        # 插入新列到第一列位置
-        main_for_match = striped_main_col.apply(lambda row: [index for index, v in striped_match_col.items() if match_func(row, v)] if not pd.isnull(row) and row else None)
-        # 放到第一列的位置，因为后面需要根据列名取列的索引，放到第一个，可以将后面取的列索引都 -1
-        main_df.insert(0, "%匹配行索引%", main_for_match)
-        main_df[f"{match_id}%%匹配附加信息（文字）"] = main_df["%匹配行索引%"].apply(match_text)
-        main_df[f"{match_id}%%匹配附加信息（行数）"] = main_df["%匹配行索引%"].apply(len)
-        match_extra_cols_index_list = [main_df.columns.get_loc(i) -1 for i in [f"{match_id}%%匹配附加信息（文字）", f"{match_id}%%匹配附加信息（行数）"]]
-
-        # 携带列或者补充到主表
-        catch_cols_index_list = []
-        for catch_col_with_policy in catch_cols_with_policy:
-            catch_col_name = catch_col_with_policy[0]
-            if catch_col_with_policy[1] == ADD_COL_OPTION:  # 说明需要添加一列
-                main_df[f'{match_id}%%{catch_col_name}'] = main_df['%匹配行索引%'].apply(
-                    lambda indices: '\n'.join(
-                        match_df.loc[indices, catch_col_name].astype(str).replace('nan', '')  # 处理 NaN
-                    ) if (isinstance(indices, list) and indices) else ''
-                )
-                catch_cols_index_list.append(main_df.columns.get_loc(f'{match_id}%%{catch_col_name}') -1)
-
-            elif catch_col_with_policy[1] == MAKEUP_MAIN_COL_WITH_OVERWRITE:
-                main_col_name = catch_col_with_policy[2]
-                main_df[main_col_name] = main_df.apply(
-                    lambda row: '\n'.join(
-                        match_df.loc[row['%匹配行索引%'], catch_col_name]
-                        .astype(str)
-                        .replace('nan', '')  # 处理 NaN
-                    ) if (isinstance(row['%匹配行索引%'], list) and row['%匹配行索引%'])
-                    else row[main_col_name] if row['%匹配行索引%'] == []  # 未匹配时保留原值
-                    else '',  # 主表内容为空时设为空字符串
-                    axis=1
-                )
-            elif catch_col_with_policy[1] == MAKEUP_MAIN_COL:
-                main_col_name = catch_col_with_policy[2]
-                main_df[main_col_name] = main_df.apply(
-                    lambda row:
-                    row[main_col_name] if row[main_col_name]
-                    else '\n'.join(
-                        match_df.loc[row['%匹配行索引%'], catch_col_name]
-                        .astype(str)
-                        .replace('nan', '')
-                    ) if (
-                            isinstance(row['%匹配行索引%'], list)
-                            and row['%匹配行索引%']
-                    )
-                    else row[main_col_name] if (
-                            isinstance(row['%匹配行索引%'], list)
-                            and len(row['%匹配行索引%']) == 0
-                    )
-                    else '',
-                    axis=1
-                )
+        ## 主表的匹配列会被前面的条件「补充到主表」修改时，需要等前面的条件拼接完成后再匹配，且不能使用主表的缓存
+        depends_on_previous = any(main_col in makeup_main_cols for main_col in main_col_list)
+        makeup_main_cols.update(i[2] for i in catch_cols_with_policy if i[1] in (MAKEUP_MAIN_COL_WITH_OVERWRITE, MAKEUP_MAIN_COL))
 
+        ## 相等匹配时，数字和日期列可以按原生的类型匹配（每一列分别根据两边的内容决定）
+        engine_factory = functools.partial(get_match_engine, match_func, len(match_col_list), similarity_threshold)
+        engine = engine_factory()
+        col_key_type_list = resolve_condition_key_types(
+            [main_df[col] for col in main_col_list], [match_df[col] for col in match_col_list], match_dict
+        )
 
-        # 拼接返回信息
-        # 内容为空的行索引列表（原列值为 None）
-        no_content_indices = main_df[main_df["%匹配行索引%"].isnull()].index
-        # 匹配到的行索引列表（非空列表且长度>0）
-        matched_mask = main_df["%匹配行索引%"].apply(
-            lambda x: isinstance(x, list) and len(x) > 0
+        ## 条件的所有参数（辅助表的来源、匹配列、忽略规则、匹配方式、携带列、附加信息），用于跨多次执行复用这个条件拼接好的列
+        col_ignore_policy_list = get_col_ignore_policy_list(match_dict)
+        condition_key = make_cache_key(
+            match_dict.get("cache_key"), match_id, tuple(main_col_list), tuple(match_col_list), tuple(col_ignore_policy_list),
+            tuple(col_key_type_list), match_func, match_dict.get("match_policy") or "all", tuple(tuple(i) for i in catch_cols_with_policy),
+            match_dict['match_detail_text'], similarity_threshold,
         )
-        matched_indices = main_df[matched_mask].index
-        # 未匹配到的行索引列表（非空列表但长度=0）
-        unmatched_mask = main_df["%匹配行索引%"].apply(
-            lambda x: isinstance(x, list) and len(x) == 0
+        output_cache_key = make_cache_key(main_cache_key, "output", condition_key, upstream_makeup_keys) \
+            if condition_key and not depends_on_previous else None
+        if any(i[1] in (MAKEUP_MAIN_COL_WITH_OVERWRITE, MAKEUP_MAIN_COL) for i in catch_cols_with_policy):
+            upstream_makeup_keys += (condition_key, )
+
+        ## 参数没有变化的条件，直接使用上一次执行拼接好的列，不需要重新匹配
+        cached_output = match_cache.get(output_cache_key) if output_cache_key else None
+
+        ## 辅助表的索引已经建好时（流式匹配的分块），直接使用，不再统计辅助表和建索引
+        helper_index = match_dict.get("helper_index")
+        if helper_index is not None and helper_index.key != (tuple(col_ignore_policy_list), tuple(col_key_type_list)):
+            helper_index = None
+
+        ## 执行计划：根据行数、基数、匹配方式、忽略规则选择执行方式并估算耗时（需要统计基数，只在需要匹配时生成）
+        if cached_output is not None:
+            plan = cached_output.plan.reuse()
+        else:
+            plan = plan_match(
+                match_id, engine_factory, [main_df[col] for col in main_col_list], [match_df[col] for col in match_col_list],
+                col_ignore_policy_list, use_multiprocessing and should_use_process_pool(engine, len(main_df)),
+                output_col_count=2 + len(catch_cols_with_policy), col_key_type_list=col_key_type_list,
+                helper_stats=helper_index.helper_stats if helper_index is not None else None,
+            )
+
+        match_tasks.append({
+            "match_id": match_id,
+            "match_df": match_df,
+            "main_col_list": main_col_list,
+            "match_col_list": match_col_list,
+            "catch_cols_with_policy": catch_cols_with_policy,
+            ## 每一列分别按照各自的忽略规则处理
+            "col_ignore_policy_list": col_ignore_policy_list,
+            "col_key_type_list": col_key_type_list,  # 每一列的匹配值类型
+            "match_func": match_func,
+            "similarity_threshold": similarity_threshold,
+            "match_policy": match_dict.get("match_policy") or "all",  # 重复值策略
+            "match_detail_text": match_dict['match_detail_text'],  # 匹配到 ｜ 未匹配到 ｜ 无内容
+            "helper_cache_key": match_dict.get("cache_key"),
+            "depends_on_previous": depends_on_previous,
+            "output_cache_key": output_cache_key,
+            "cached_output": cached_output,
+            "plan": plan,
+            "helper_index": helper_index,
+            # 相等匹配（包括按类型匹配）主要是 pandas/numpy 的向量化操作，多进程匹配时线程只是等待子进程，这两种可以在线程中并行
+            # 任意包含、相似 等在当前进程中逐个比较时一直持有 GIL，放到线程中不会更快，在主线程中依次执行
+            "run_in_thread": cached_output is None and not depends_on_previous and (isinstance(engine, HashMatchEngine) or plan.use_process_pool),
+        })
+
+    def match_one_task(task, main_key_cols, cache_key):
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        start_for_match = time.time()
+        match_result = get_match_result(
+            main_key_cols, [task["match_df"][col] for col in task["match_col_list"]], task["col_ignore_policy_list"],
+            task["match_func"], main_cache_key=cache_key, helper_cache_key=task["helper_cache_key"],
+            use_multiprocessing=task["plan"].use_process_pool, match_policy=task["match_policy"], plan=task["plan"],
+            col_key_type_list=task["col_key_type_list"], cancel_token=cancel_token, similarity_threshold=task["similarity_threshold"],
+            helper_engine=task["helper_index"].engine if task["helper_index"] is not None else None,
+            progress_callback=progress_callback and (lambda done, total: progress_callback(task["match_id"], done, total)),
         )
-        unmatched_indices = main_df[unmatched_mask].index
-
-        detail_match_info[match_id] = {
-            "time_cost": time.time() - start_for_one_df,
-            "match_index_list": matched_indices,
-            "unmatch_index_list": unmatched_indices,
-            "no_content_index_list": no_content_indices,
-            "catch_cols_index_list": catch_cols_index_list,
-            "match_extra_cols_index_list": match_extra_cols_index_list,
-        }
-        # 已经匹配的索引
-        main_col_index = main_df.columns.get_loc(main_col) -1
-        match_rows = match_mapping.get(main_col_index) or []
-        # 加入新索引
-        match_rows.extend(matched_indices)
-        match_mapping[main_col_index] = match_rows
-        # 清理临时列
-        main_df.drop(columns=['%匹配行索引%'], inplace=True)
+        return match_result, time.time() - start_for_match
+
+    # 二、各个辅助表的匹配互不影响，可以在线程中并行的条件（见 run_in_thread）先提交（主表的匹配列在拼接开始前取出，不受后续拼接的影响）
+    thread_count = sum(task["run_in_thread"] for task in match_tasks)
+    with ThreadPoolExecutor(max_workers=max(min(thread_count, cpu_count()), 1)) as executor:
+        futures = [
+            executor.submit(match_one_task, task, [main_df[col] for col in task["main_col_list"]], main_cache_key)
+            if task["run_in_thread"] else None
+            for task in match_tasks
+        ]
 
+        # 三、按条件的原始顺序拼接，保证列的顺序不变
+        for task, future in zip(match_tasks, futures):
+            condition_output = task["cached_output"]
+            match_id = task["match_id"]
+            main_col_list = task["main_col_list"]
+
+            match_detail_text = [i.strip() for i in task["match_detail_text"].split("｜")]
+            if not first_match_text:
+                first_match_text = match_detail_text
+
+            match_result, match_time_cost = None, 0
+            if condition_output is None:
+                # 匹配结果是压缩表示（CSR）：每一行匹配到的辅助表行位置 + 无内容的行，不在主表中存放临时列
+                # match_func 是一个自定义的纯函数，无法直接用merge（并非简单的等值判断）
+                if future is None:  # 依赖前面的条件补充后的主表时，不能使用主表的缓存
+                    match_result, match_time_cost = match_one_task(
+                        task, [get_current_col(col) for col in main_col_list], None if task["depends_on_previous"] else main_cache_key
+                    )
+                else:
+                    match_result, match_time_cost = future.result()
+            start_for_one_df = time.time()
+            task["plan"].from_cache = condition_output is not None
+            if condition_output is None:
+                condition_output = build_condition_output(main_df, task, match_result, match_detail_text, output_cols)
+                if task["output_cache_key"]:
+                    match_cache.set(task["output_cache_key"], condition_output)
+
+            # 按顺序记录需要拼接的列
+            for col_name, values, _ in condition_output.columns:
+                set_output_col(col_name, values)
+            match_extra_cols_index_list = [get_col_loc(col_name) for col_name, _, kind in condition_output.columns if kind == "extra"]
+            catch_cols_index_list = [get_col_loc(col_name) for col_name, _, kind in condition_output.columns if kind == "catch"]
+            task["plan"].add_actual(PHASE_ASSEMBLE, time.time() - start_for_one_df)
+
+            # 拼接返回信息
+            match_result = condition_output.match_result
+            no_content_mask = match_result.no_content
+            condition_matched_masks[match_id] = match_result.matched_mask
+            no_content_indices = main_df.index[no_content_mask]  # 内容为空的行索引列表
+            matched_indices = main_df.index[match_result.matched_mask]  # 匹配到的行索引列表
+            unmatched_indices = main_df.index[match_result.unmatched_mask]  # 未匹配到的行索引列表
+
+            detail_match_info[match_id] = {
+                "time_cost": match_time_cost + time.time() - start_for_one_df,
+                "match_index_list": matched_indices,
+                "unmatch_index_list": unmatched_indices,
+                "no_content_index_list": no_content_indices,
+                "catch_cols_index_list": catch_cols_index_list,
+                "match_extra_cols_index_list": match_extra_cols_index_list,
+                "plan": task["plan"],  # 执行计划：执行方式、各阶段预估和实际的耗时
+            }
+            # 主表匹配列对应的条件（多列联合条件时，每一个主表匹配列都记录）
+            for main_col in dict.fromkeys(main_col_list):
+                main_col_conditions.setdefault(main_df.columns.get_loc(main_col), []).append(match_id)
 
-    # 组装总体信息
+    # 组装总体信息：每个条件的匹配情况组成矩阵（行：主表的行，列：条件），任一/全部匹配 都是按行的向量化统计
     total_length = len(main_df)
-    sets = [set(value.get("match_index_list")) for value in detail_match_info.values()]
-    union_set = set.union(*sets)
-    intersection_set = set.intersection(*sets)
-
-    union_set_present = round(len(union_set) / total_length * 100, 2)  # 任一匹配
-    intersection_set_present = round(len(intersection_set) / total_length * 100, 2)  # 全部匹配
-    overall_match_info["union_set_length"] = len(union_set)
-    overall_match_info["intersection_set_length"] = len(intersection_set)
+    condition_hit_matrix = np.column_stack(list(condition_matched_masks.values())) \
+        if condition_matched_masks else np.zeros((total_length, 0), dtype=bool)
+    any_matched_mask = condition_hit_matrix.any(axis=1)
+    all_matched_mask = condition_hit_matrix.all(axis=1) & any_matched_mask  # 没有条件时为全部未匹配
+    union_set_length, intersection_set_length = int(any_matched_mask.sum()), int(all_matched_mask.sum())
+
+    union_set_present = round(union_set_length / total_length * 100, 2)  # 任一匹配
+    intersection_set_present = round(intersection_set_length / total_length * 100, 2)  # 全部匹配
+    overall_match_info["union_set_length"] = union_set_length
+    overall_match_info["intersection_set_length"] = intersection_set_length
     overall_match_info["union_set_present"] = union_set_present
     overall_match_info["intersection_set_present"] = intersection_set_present
-    overall_match_info["match_for_main_col"] = match_mapping  # key是主表的第几列，value是都有第几行匹配到了
+    # key是主表的第几列，value是都有哪些行匹配到了
+    # 主表匹配列中需要上色的单元格：这一列对应的条件中，任一条件匹配到的行（取矩阵中这些条件的列）
+    condition_ids = list(condition_matched_masks.keys())
+    overall_match_info["match_for_main_col"] = {
+        k: main_df.index[condition_hit_matrix[:, [condition_ids.index(i) for i in dict.fromkeys(v)]].any(axis=1)]
+        for k, v in main_col_conditions.items()
+    }
+    overall_match_info["condition_ids"] = condition_ids
+    overall_match_info["condition_hit_matrix"] = condition_hit_matrix  # 第 i 行第 j 列：主表第 i 行是否匹配到了第 j 个条件
+    overall_match_info["explain"] = {k: v["plan"].explain() for k, v in detail_match_info.items()}
 
     if add_overall_match_info:
-        main_df["%任一条件匹配%"] = match_detail_text[1] if len(match_detail_text) > 1 else ""  # 默认设置为匹配不到
-        main_df["%全部条件匹配%"] = match_detail_text[1] if len(match_detail_text) > 1 else ""  # 默认设置为匹配不到
-
-        main_df.loc[list(union_set), "%任一条件匹配%"] = first_match_text[0] if len(first_match_text) > 0 else ""  # 匹配到
-        main_df.loc[no_content_indices, "%任一条件匹配%"] = first_match_text[2] if len(first_match_text) > 2 else ""  # 空
-
-        main_df.loc[list(intersection_set), "%全部条件匹配%"] = first_match_text[0] if len(first_match_text) > 0 else ""  # 匹配到
-        main_df.loc[no_content_indices, "%全部条件匹配%"] = first_match_text[2] if len(first_match_text) > 2 else ""  # 空
-
-        overall_match_info["match_extra_cols"] = [main_df.columns[-1], main_df.columns[-2]]
-        overall_match_info["match_extra_cols_index_list"] = [len(main_df.columns)-1, len(main_df.columns)-2]
-
-    return main_df, overall_match_info, detail_match_info
+        match_text = first_match_text[0] if len(first_match_text) > 0 else ""  # 匹配到
+        unmatch_text = match_detail_text[1] if len(match_detail_text) > 1 else ""  # 默认设置为匹配不到
+        no_content_text = first_match_text[2] if len(first_match_text) > 2 else ""  # 空（以最后一个条件的无内容为准）
+        for col_name, matched_mask in [("%任一条件匹配%", any_matched_mask), ("%全部条件匹配%", all_matched_mask)]:
+            set_output_col(col_name, np.select(
+                [no_content_mask, matched_mask], [no_content_text, match_text], default=unmatch_text
+            ).astype(object))
+
+        overall_match_info["match_extra_cols"] = ["%全部条件匹配%", "%任一条件匹配%"]
+        overall_match_info["match_extra_cols_index_list"] = [get_col_loc("%全部条件匹配%"), get_col_loc("%任一条件匹配%")]
+
+    # 四、一次性拼接：新增的列整体concat，补充到主表的列替换原来的列
+    replaced_cols = {k: v for k, v in output_cols.items() if k not in added_col_locs}
+    added_df = pd.DataFrame({k: output_cols[k] for k in added_col_locs}, index=main_df.index)
+    if inplace:
+        result_df = main_df
+        for col_name, values in replaced_cols.items():
+            result_df[col_name] = values
+        if added_col_locs:
+            result_df[added_df.columns] = added_df
+    else:
+        result_df = pd.concat([main_df, added_df], axis=1)
+        for col_name, values in replaced_cols.items():
+            result_df[col_name] = values
+    return result_df, overall_match_info, detail_match_info
 
 
 if __name__ == '__main__':
@@ -0,0 +1,107 @@
+import pandas as pd
+import pytest
+
+from yrx_project.scene.match_table import main, planner
+from yrx_project.scene.match_table.cache import match_cache
+from yrx_project.scene.match_table.main import match_table, get_match_engine, MATCH_FUNC_MAP, STR_CONTAINED, STR_SIMILAR
+
+
+@pytest.fixture
+def book_condition(make_conditions):
+    """辅助表：书名（任意包含） -> 作者"""
+    return make_conditions(
+        pd.DataFrame({"书名": ["三体", "活着"], "作者": ["刘慈欣", "余华"]}), "书名", "作者", STR_CONTAINED, cache_key=("辅助表", ),
+    )[0]
+
+
+def test_cached_condition_reuses_plan(monkeypatch, book_condition):
+    """参数没有变化的条件直接使用上一次拼接好的列，不重新生成执行计划（不再统计基数）"""
+    match_cache.clear()
+    main_df = pd.DataFrame({"书名": ["三体（全集）", "活着", "围城"]})
+    plan_calls = []
+    plan_match = main.plan_match
+    monkeypatch.setattr(main, "plan_match", lambda *args, **kwargs: plan_calls.append(args[0]) or plan_match(*args, **kwargs))
+
+    expected, _, detail_match_info = match_table(main_df, [book_condition], main_cache_key=("主表", ))
+    assert plan_calls == ["辅助表"]
+    assert not detail_match_info["辅助表"]["plan"].from_cache
+
+    result, _, detail_match_info = match_table(main_df, [book_condition], main_cache_key=("主表", ))
+    assert plan_calls == ["辅助表"]
+    plan = detail_match_info["辅助表"]["plan"]
+    assert plan.from_cache and plan.main_rows == 3
+    assert plan.explain()["执行方式"].endswith("（缓存）")
+    pd.testing.assert_frame_equal(result, expected)
+    assert result["辅助表%%作者"].tolist() == ["刘慈欣", "余华", ""]
+
+
+def test_match_for_main_col_from_condition_hit_matrix(book_condition):
+    """主表匹配列上色的行，是这一列对应的条件在 condition_hit_matrix 中任一匹配到的行"""
+    match_cache.clear()
+    main_df = pd.DataFrame({"书名": ["三体", "活着", "围城", "边城"], "作者": ["刘慈欣", "", "钱锺书", "沈从文"]})
+    conditions = [
+        dict(book_condition, id="书名1", cache_key=None),
+        dict(book_condition, id="书名2", df=pd.DataFrame({"书名": ["围城"], "作者": ["钱锺书"]}), cache_key=None),
+        dict(book_condition, id="作者", match_cols=[{"main_col": "作者", "match_col": "作者"}], catch_cols=[], cache_key=None),
+    ]
+    _, overall_match_info, _ = match_table(main_df, conditions)
+    matrix = overall_match_info["condition_hit_matrix"]
+    assert overall_match_info["condition_ids"] == ["书名1", "书名2", "作者"]
+    assert matrix.tolist() == [[True, False, True], [True, False, False], [False, True, False], [False, False, False]]
+    match_for_main_col = overall_match_info["match_for_main_col"]
+    assert match_for_main_col[0].tolist() == [0, 1, 2]
+    assert match_for_main_col[1].tolist() == [0]
+
+
+def test_similarity_threshold_per_condition(book_condition):
+    """相似匹配的阈值按条件设置，不同阈值的条件使用各自的索引（同一个辅助表来源也不共用缓存）"""
+    match_cache.clear()
+    main_df = pd.DataFrame({"书名": ["三体全集", "活着"]})
+    conditions = [
+        dict(book_condition, id=f"阈值{threshold}", match_func=MATCH_FUNC_MAP[STR_SIMILAR], similarity_threshold=threshold)
+        for threshold in [0.6, 0.9]
+    ]
+    _, overall_match_info, detail_match_info = match_table(main_df, conditions, main_cache_key=("主表", ))
+    # 三体 和 三体全集 的相似度是 2 * 2 / 6 ≈ 0.67
+    assert overall_match_info["condition_hit_matrix"].tolist() == [[True, False], [True, True]]
+    assert list(detail_match_info) == ["阈值0.6", "阈值0.9"]
+
+
+@pytest.mark.parametrize("threshold", [0, -0.1, 1.1])
+def test_similarity_threshold_out_of_range(threshold, book_condition):
+    """相似匹配的阈值需要在 (0, 1] 之间，阈值为 0 时前缀过滤无法生成候选"""
+    with pytest.raises(ValueError, match="similarity_threshold"):
+        get_match_engine(MATCH_FUNC_MAP[STR_SIMILAR], similarity_threshold=threshold)
+    conditions = [dict(book_condition, match_func=MATCH_FUNC_MAP[STR_SIMILAR], similarity_threshold=threshold)]
+    with pytest.raises(ValueError, match="similarity_threshold"):
+        match_table(pd.DataFrame({"书名": ["三体"]}), conditions)
+
+
+def test_similarity_threshold_one(book_condition):
+    """阈值为 1 时只有完全相同的值相似"""
+    conditions = [dict(book_condition, match_func=MATCH_FUNC_MAP[STR_SIMILAR], similarity_threshold=1)]
+    _, overall_match_info, _ = match_table(pd.DataFrame({"书名": ["三体", "三体全集"]}), conditions)
+    assert overall_match_info["condition_hit_matrix"].tolist() == [[True], [False]]
+
+
+@pytest.mark.parametrize("match_func_name, helper_rows, strategy", [
+    (STR_CONTAINED, 2, "逐个比较"),
+    (STR_CONTAINED, 2000, "AC自动机+倒排索引"),
+    (STR_SIMILAR, 2, "逐个计算相似度"),
+    (STR_SIMILAR, 2000, "前缀过滤的分块相似"),
+])
+def test_plan_chooses_engine_by_estimate(monkeypatch, match_func_name, helper_rows, strategy, book_condition):
+    """执行计划按预估耗时选择执行方式：辅助表很小时不建索引，结果和建索引时完全一致"""
+    match_cache.clear()
+    books = ["三体", "活着"] + [chr(0x4e00 + 2 * i) + chr(0x4e01 + 2 * i) for i in range(helper_rows - 2)]  # 不同的字符足够多
+    conditions = [dict(
+        book_condition, df=pd.DataFrame({"书名": books, "作者": books}), match_func=MATCH_FUNC_MAP[match_func_name],
+        similarity_threshold=0.6, cache_key=None,
+    )]
+    main_df = pd.DataFrame({"书名": ["三体全集", "活着", "围城", ""] + [book + "上" for book in books]})
+    result, _, detail_match_info = match_table(main_df, conditions)
+    assert detail_match_info["辅助表"]["plan"].strategy == strategy
+
+    monkeypatch.setattr(planner, "get_engine_choices", lambda engine: [engine])
+    expected, _, _ = match_table(main_df, conditions)
+    pd.testing.assert_frame_equal(result, expected)
@@ -0,0 +1,221 @@
+import copy
+import functools
+import typing
+from multiprocessing import cpu_count
+
+import pandas as pd
+
+from yrx_project.scene.match_table.const import MULTIPROCESSING_CHUNK_SIZE, MULTIPROCESSING_MIN_ROWS, SIMILARITY_THRESHOLD, \
+    KEY_TYPE_STR
+from yrx_project.scene.match_table.engine import BaseMatchEngine, BruteForceMatchEngine, HashMatchEngine, \
+    ContainMatchEngine, SimilarMatchEngine, CompositeMatchEngine, to_key_series
+from yrx_project.scene.match_table.typed_key import KEY_TYPE_NAME_MAP
+from yrx_project.utils.time_util import format_duration
+
+# 执行计划的各个阶段：预处理（按忽略规则处理匹配列）、建索引（辅助表）、匹配（主表）、拼接（生成结果列）
+PHASE_STRIP = "预处理"
+PHASE_BUILD = "建索引"
+PHASE_MATCH = "匹配"
+PHASE_ASSEMBLE = "拼接"
+PHASES = [PHASE_STRIP, PHASE_BUILD, PHASE_MATCH, PHASE_ASSEMBLE]
+
+# 各执行方式的展示名称
+STRATEGY_NAME_MAP = {
+    HashMatchEngine: "哈希索引",
+    ContainMatchEngine: "AC自动机+倒排索引",
+    SimilarMatchEngine: "前缀过滤的分块相似",
+    BruteForceMatchEngine: "逐个比较",
+}
+SIMILAR_WITHOUT_PREFIX_FILTER_NAME = "逐个计算相似度"  # 不建前缀索引的相似匹配
+
+# 估算耗时用的单位耗时（秒），是经验值，只用于判断量级
+STRIP_COST_PER_CELL = 4e-7  # 处理一个单元格（每条忽略规则）
+ASSEMBLE_COST_PER_CELL = 7e-8  # 拼接一个单元格
+PROCESS_POOL_STARTUP_COST = 0.5  # 进程池启动和传递索引
+ENCODE_COST_PER_ROW = 1e-7  # 主表字典编码和展开匹配结果（每一行）
+SAMPLE_SIZE = 1000  # 估算平均长度时的抽样行数
+
+
+def estimate_engine_cost(
+        engine_cls: type, main_rows: int, helper_rows: int, helper_unique: int, main_avg_length: float, helper_avg_length: float,
+        helper_char_count: int = 0, similarity_threshold: float = SIMILARITY_THRESHOLD, prefix_filter=True,
+) -> typing.Tuple[float, float]:
+    """估算一个匹配引擎的 (建索引, 匹配) 耗时
+
+    :param helper_char_count: 辅助表中不同字符的个数（相似匹配时，字符越多，前缀过滤后的候选越少）
+    :param similarity_threshold: 相似匹配的阈值，阈值越低前缀越长，候选越多
+    :param prefix_filter: 相似匹配是否建前缀索引，不建时所有的去重值都是候选
+    """
+    if engine_cls is HashMatchEngine:
+        return helper_rows * 3e-7, main_rows * 3e-7
+    if engine_cls is ContainMatchEngine:
+        # 自动机按字符构建，主表的每一行扫描一遍，再查双字倒排索引
+        return helper_unique * helper_avg_length * 1.2e-6, main_rows * (main_avg_length * 4e-7 + 4e-6)
+    if engine_cls is SimilarMatchEngine and not prefix_filter:
+        return helper_unique * helper_avg_length * 2e-7, main_rows * (helper_unique * 8e-7 + 2e-5)
+    if engine_cls is SimilarMatchEngine:
+        # 前缀过滤后的候选数 ≈ 前缀长度 x 每个前缀字符的倒排表长度（前缀长度 x 去重值个数 / 字符个数）
+        prefix_length = helper_avg_length * (1 - similarity_threshold / (2 - similarity_threshold)) + 1
+        candidate_count = min(prefix_length ** 2 * helper_unique / max(helper_char_count, 1), helper_unique)
+        return helper_unique * helper_avg_length * 1e-6, main_rows * (candidate_count * 8e-7 + 2e-5)
+    # 逐个比较：主表行数 x 辅助表行数 次调用匹配函数
+    return helper_rows * 1e-7, main_rows * helper_rows * 4e-8
+
+
+def get_strategy_name(engine: BaseMatchEngine) -> str:
+    if isinstance(engine, SimilarMatchEngine) and not engine.prefix_filter:
+        return SIMILAR_WITHOUT_PREFIX_FILTER_NAME
+    return STRATEGY_NAME_MAP.get(type(engine), STRATEGY_NAME_MAP[BruteForceMatchEngine])
+
+
+def get_engine_choices(engine: BaseMatchEngine) -> typing.List[BaseMatchEngine]:
+    """一个匹配引擎（未构建）和结果完全相同的可选执行方式，第一个是默认的（建索引的）
+    任意包含可以逐个比较，相似匹配可以不建前缀索引（保留相似度）；相等匹配的哈希索引总是最快的，没有其他选择
+    """
+    if isinstance(engine, ContainMatchEngine):
+        return [engine, BruteForceMatchEngine(engine.match_func)]
+    if isinstance(engine, SimilarMatchEngine) and engine.prefix_filter:
+        return [engine, SimilarMatchEngine(engine.match_func, engine.threshold, prefix_filter=False)]
+    return [engine]
+
+
+def estimate_avg_length(key_cols: typing.List[pd.Series]) -> float:
+    """抽样估算匹配列的平均长度（多列时为各列之和）"""
+    lengths = [col.head(SAMPLE_SIZE).astype(str).str.len().mean() for col in key_cols]
+    return sum(float(i) for i in lengths if pd.notna(i))
+
+
+class MatchPlan:
+    """一个条件的执行计划：执行前选择执行方式并估算各阶段耗时，执行后记录实际耗时"""
+    def __init__(
+            self, match_id: str, strategy: str, main_rows: int, helper_rows: int, main_unique: int, helper_unique: int,
+            use_process_pool: bool, estimated: typing.Dict[str, float], key_types: typing.List[str] = None,
+            engine_factory: typing.Callable[[], BaseMatchEngine] = None,
+    ):
+        self.match_id = match_id
+        self.strategy = strategy
+        self.main_rows, self.helper_rows = main_rows, helper_rows
+        self.main_unique, self.helper_unique = main_unique, helper_unique
+        self.use_process_pool = use_process_pool
+        self.key_types = key_types or []  # 每一列的匹配值类型
+        self.estimated = estimated  # {阶段: 预估耗时}
+        self.actual = {phase: 0.0 for phase in PHASES}  # {阶段: 实际耗时}，命中缓存的阶段为 0
+        self.from_cache = False  # 是否直接使用了上一次执行拼接好的列
+        self.engine_factory = engine_factory  # 创建匹配引擎（未构建），执行时用它创建引擎，和计划的执行方式一致
+
+    def create_engine(self) -> BaseMatchEngine:
+        return self.engine_factory()
+
+    def reuse(self) -> 'MatchPlan':
+        """直接使用上一次执行拼接好的列时，复用上一次的计划（不重新统计行数和基数），实际耗时重新记录"""
+        plan = copy.copy(self)
+        plan.actual = {phase: 0.0 for phase in PHASES}
+        plan.from_cache = True
+        return plan
+
+    @property
+    def estimated_total(self) -> float:
+        return sum(self.estimated.values())
+
+    @property
+    def actual_total(self) -> float:
+        return sum(self.actual.values())
+
+    def add_actual(self, phase: str, time_cost: float):
+        self.actual[phase] = self.actual.get(phase, 0.0) + time_cost
+
+    def explain(self) -> dict:
+        """展示用的执行计划：{列名: 值}"""
+        strategy = self.strategy + ("（多进程）" if self.use_process_pool else "") + ("（缓存）" if self.from_cache else "")
+        explain = {
+            "执行方式": strategy,
+            "主表行数（去重）": f"{self.main_rows}（{self.main_unique}）",
+            "辅助表行数（去重）": f"{self.helper_rows}（{self.helper_unique}）",
+            "匹配值类型": "、".join(KEY_TYPE_NAME_MAP.get(i, i) for i in self.key_types or [KEY_TYPE_STR]),
+            "预估耗时": format_duration(self.estimated_total, only_sec=True),
+            "实际耗时": format_duration(self.actual_total, only_sec=True),
+        }
+        for phase in PHASES:  # 各阶段：预估 / 实际
+            explain[phase] = f"{format_duration(self.estimated.get(phase, 0), only_sec=True)} / " \
+                             f"{format_duration(self.actual.get(phase, 0), only_sec=True)}"
+        return explain
+
+
+def estimate_helper_stats(engine: BaseMatchEngine, helper_key_cols: typing.List[pd.Series]) -> dict:
+    """辅助表的统计：行数、去重后的行数、平均长度、不同字符的个数（只有相似匹配需要），只和辅助表有关，流式匹配时只统计一次"""
+    engines = engine.engines if isinstance(engine, CompositeMatchEngine) else [engine]
+    char_count = 0
+    if any(isinstance(i, SimilarMatchEngine) for i in engines):
+        char_count = len(set().union(*(set("".join(col.astype(str))) for col in helper_key_cols)))
+    return {
+        "rows": len(helper_key_cols[0]),
+        "unique": int(to_key_series(helper_key_cols).nunique()),
+        "avg_length": estimate_avg_length(helper_key_cols),
+        "char_count": char_count,
+    }
+
+
+def plan_match(
+        match_id: str, engine_factory: typing.Callable[[], BaseMatchEngine], main_key_cols: typing.List[pd.Series], helper_key_cols: typing.List[pd.Series],
+        col_ignore_policy_list: typing.List[tuple], use_process_pool: bool, output_col_count: int,
+        col_key_type_list: typing.List[str] = None, helper_stats: dict = None,
+) -> MatchPlan:
+    """根据 行数、去重后的行数（基数）、匹配方式、忽略规则 生成执行计划
+
+    :param engine_factory: 创建匹配方式对应的匹配引擎（未构建）的函数，每一列在它和结果相同的执行方式中（见 get_engine_choices）
+        选择预估耗时最少的，执行时按选择的执行方式创建引擎（见 MatchPlan.create_engine）
+    :param use_process_pool: 是否会分块后在进程池中匹配（只匹配去重值，去重值太少时不会启用）
+    :param output_col_count: 需要拼接的列数
+    :param col_key_type_list: 每一列的匹配值类型，按类型匹配的列只需要转换一次类型，不按忽略规则处理
+    :param helper_stats: 辅助表的统计（见 estimate_helper_stats），辅助表的索引已经建好时传入（见 HelperIndex），
+        不再重新统计，也不再估算辅助表的预处理和建索引的耗时，直接使用建好的索引（不再选择执行方式）
+    """
+    col_key_type_list = col_key_type_list or [KEY_TYPE_STR] * len(helper_key_cols)
+    engine = engine_factory()
+    helper_prepared = helper_stats is not None
+    helper_stats = helper_stats if helper_prepared else estimate_helper_stats(engine, helper_key_cols)
+    main_rows, helper_rows = len(main_key_cols[0]), helper_stats["rows"]
+    main_unique, helper_unique = int(to_key_series(main_key_cols).nunique()), helper_stats["unique"]
+    main_avg_length, helper_avg_length = estimate_avg_length(main_key_cols), helper_stats["avg_length"]
+
+    # 主表只匹配去重值（字典编码），再展开到每一行；多列联合条件（非相等匹配）时，每一列分别建索引和匹配
+    engines = engine.engines if isinstance(engine, CompositeMatchEngine) else [engine]
+    build_cost, match_cost = 0.0, 0.0
+    chosen_engines = []
+    for sub_engine in engines:
+        choices = get_engine_choices(sub_engine) if not helper_prepared else [sub_engine]
+        costs = [
+            estimate_engine_cost(
+                type(choice), main_unique, helper_rows, helper_unique,
+                main_avg_length / len(engines), helper_avg_length / len(engines), helper_stats["char_count"],
+                getattr(choice, "threshold", SIMILARITY_THRESHOLD), getattr(choice, "prefix_filter", True),
+            )
+            for choice in choices
+        ]
+        chosen = min(range(len(choices)), key=lambda i: sum(costs[i]))  # 相同时用默认的
+        chosen_engines.append(choices[chosen])
+        build_cost, match_cost = build_cost + costs[chosen][0], match_cost + costs[chosen][1]
+    if chosen_engines != engines:  # 选择了其他的执行方式，执行时创建和选择的一样的引擎
+        engine = CompositeMatchEngine(chosen_engines) if isinstance(engine, CompositeMatchEngine) else chosen_engines[0]
+        engine_factory = functools.partial(copy.deepcopy, engine)
+        engines = chosen_engines
+    use_process_pool = use_process_pool and main_unique >= MULTIPROCESSING_MIN_ROWS
+    if use_process_pool:
+        chunk_count = -(-main_unique // MULTIPROCESSING_CHUNK_SIZE)
+        match_cost = match_cost / max(min(cpu_count(), chunk_count), 1) + PROCESS_POOL_STARTUP_COST
+    match_cost += main_rows * ENCODE_COST_PER_ROW
+    if helper_prepared:
+        build_cost = 0.0
+
+    strip_cells = sum(
+        (len(policy) or 1) if key_type == KEY_TYPE_STR else 1 for policy, key_type in zip(col_ignore_policy_list, col_key_type_list)
+    ) * (main_rows + (0 if helper_prepared else helper_rows))
+    strategy = " + ".join(dict.fromkeys(get_strategy_name(i) for i in engines))
+    return MatchPlan(
+        match_id, strategy, main_rows, helper_rows, main_unique, helper_unique, use_process_pool, {
+            PHASE_STRIP: strip_cells * STRIP_COST_PER_CELL,
+            PHASE_BUILD: build_cost,
+            PHASE_MATCH: match_cost,
+            PHASE_ASSEMBLE: main_rows * output_col_count * ASSEMBLE_COST_PER_CELL,
+        }, col_key_type_list, engine_factory
+    )
@@ -0,0 +1,181 @@
+import math
+import typing
+
+import pandas as pd
+import xlsxwriter
+
+from yrx_project.scene.match_table.const import STREAM_CHUNK_SIZE, STREAM_PREVIEW_ROWS, KEY_TYPE_STR
+from yrx_project.scene.match_table.main import match_table, resolve_condition_key_types, build_helper_index
+from yrx_project.utils.df_util import ExcelChunkReader, get_excel_row_count
+from yrx_project.utils.process_pool import CancelToken
+
+
+def to_excel_rows(df: pd.DataFrame) -> typing.Iterator[tuple]:
+    """逐行取出单元格的值，空值（NaN、NaT、None）写为空单元格"""
+    return df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+
+def get_typed_uniques(col: pd.Series) -> pd.Series:
+    """不重复的值，object 列中类型不同的值（如 1 和 1.0、True）不算重复，推断出的类型和整列一致"""
+    if col.dtype != object:
+        return col.drop_duplicates()
+    return col[~pd.DataFrame({"value": col, "type": col.map(type)}).duplicated()]
+
+
+def resolve_stream_key_types(reader: ExcelChunkReader, match_cols_and_df: typing.List[dict]) -> typing.List[dict]:
+    """按整个主表（而不是每个分块）决定每个条件每一列的匹配值类型，写入每一列的 key_type，每个分块的 match_table 直接使用
+    否则同一个值在不同的分块中可能按不同的类型匹配（如 auto 时，分块中恰好都是数字才按数字匹配）
+    主表的匹配列只在内存中保留不重复的值（见 get_typed_uniques）
+    """
+    def need_resolve(match_dict):
+        return any((col_dict.get("key_type") or match_dict.get("key_type") or KEY_TYPE_STR) != KEY_TYPE_STR for col_dict in match_dict["match_cols"])
+
+    main_cols = {
+        col_dict["main_col"] for match_dict in match_cols_and_df if need_resolve(match_dict)
+        for col_dict in match_dict["match_cols"] if col_dict["main_col"] in reader.columns
+    }
+    if not main_cols:
+        return match_cols_and_df
+    chunk_uniques = {col: [] for col in main_cols}
+    for chunk in reader.iter_chunks(usecols=main_cols):
+        for col in main_cols:
+            chunk_uniques[col].append(get_typed_uniques(chunk[col]))
+    main_uniques = {col: get_typed_uniques(pd.concat(values)) for col, values in chunk_uniques.items()}
+
+    resolved = []
+    for match_dict in match_cols_and_df:
+        match_cols, match_df = match_dict["match_cols"], match_dict["df"]
+        if not match_cols or not need_resolve(match_dict) or \
+                any(col_dict["main_col"] not in main_uniques or col_dict["match_col"] not in match_df.columns for col_dict in match_cols):
+            resolved.append(match_dict)  # 无效的条件由 match_table 跳过
+            continue
+        key_types = resolve_condition_key_types(
+            [main_uniques[col_dict["main_col"]] for col_dict in match_cols], [match_df[col_dict["match_col"]] for col_dict in match_cols], match_dict
+        )
+        resolved.append(dict(match_dict, match_cols=[dict(col_dict, key_type=key_type) for col_dict, key_type in zip(match_cols, key_types)]))
+    return resolved
+
+
+def stream_match_table(
+        main_path: str, sheet_name: str, row_num_for_column: int, match_cols_and_df: typing.List[dict], output_path: str,
+        add_overall_match_info=False, chunk_size=STREAM_CHUNK_SIZE, use_multiprocessing=False, progress_callback=None,
+        exclude_extra_cols=False, color_mapping: typing.Dict[str, str] = None, preview_rows=STREAM_PREVIEW_ROWS,
+        cancel_token: CancelToken = None,
+) -> (pd.DataFrame, dict, dict):
+    """流式匹配：主表太大无法一次读入内存时使用
+    辅助表照常读入，在读取分块之前统计并建立索引（见 build_helper_index，跨分块复用），
+    主表按行分块读取，每个分块调用 match_table 匹配后，
+    逐行写入结果文件（xlsxwriter 的 constant_memory 模式，写完一行就落盘），内存中只有一个分块和辅助表的索引
+    匹配值的类型在匹配前按整个主表决定（见 resolve_stream_key_types），和整表匹配一致
+
+    :param main_path, sheet_name, row_num_for_column: 主表的路径、工作表、标题行
+    :param match_cols_and_df: 同 match_table
+    :param output_path: 结果文件的路径
+    :param progress_callback: 同 match_table，每匹配完一个分块额外回调一次：progress_callback("主表分块", 已完成的分块数, 总分块数)
+    :param exclude_extra_cols: 是否不写入匹配附加信息的列
+    :param color_mapping: 结果文件的颜色 {颜色: 列的类型}，列的类型：
+        even 偶数个条件的列，odd 奇数个条件的列，overall 总体匹配信息的列，main 主表匹配列中匹配到的单元格
+    :param preview_rows: 返回的结果只保留前几行，用于预览
+    :param cancel_token: 同 match_table，取消后不再读取和匹配后面的分块
+    :return:
+        pd.DataFrame: 结果的前 preview_rows 行
+        overall_match_info: 同 match_table，只有统计信息（不包含逐行的信息），match_for_main_col 只包含预览的行
+        detail_match_info: 每个条件的耗时和 匹配到/未匹配到/无内容 的行数
+        其中列的位置都是结果文件中的位置
+    """
+    color_mapping = color_mapping or {}
+    chunk_count = max(math.ceil((get_excel_row_count(main_path, sheet_name) - int(row_num_for_column or 1)) / chunk_size), 1)
+
+    workbook = xlsxwriter.Workbook(output_path, {"constant_memory": True, "default_date_format": "yyyy-mm-dd hh:mm:ss"})
+    worksheet = workbook.add_worksheet("Sheet1")
+    formats = {color: workbook.add_format({"bg_color": color}) for color in color_mapping}
+    main_format = next((formats[color] for color, kind in color_mapping.items() if kind == "main"), None)
+
+    preview_dfs, preview_matched = [], {}
+    overall_match_info, detail_match_info = {}, {}
+    total_length, union_set_length, intersection_set_length = 0, 0, 0
+    kept_cols, row_number = None, 1  # 第0行是标题行
+    try:
+        with ExcelChunkReader(main_path, sheet_name, row_num_for_column, chunk_size) as reader:
+            match_cols_and_df = resolve_stream_key_types(reader, match_cols_and_df)
+            # 辅助表的统计和索引在读取分块之前建立一次，每个分块只匹配主表一侧
+            match_cols_and_df = [dict(match_dict, helper_index=build_helper_index(match_dict)) for match_dict in match_cols_and_df]
+            for chunk_index, chunk in enumerate(reader.iter_chunks()):
+                matched_df, chunk_overall, chunk_detail = match_table(
+                    chunk, match_cols_and_df, add_overall_match_info=add_overall_match_info,
+                    use_multiprocessing=use_multiprocessing, progress_callback=progress_callback, cancel_token=cancel_token,
+                )
+
+                if kept_cols is None:  # 第一个分块：确定结果的列和颜色，写入标题行（之后每个分块的列都一样）
+                    extra_cols = set(chunk_overall.get("match_extra_cols_index_list") or [])
+                    for v in chunk_detail.values():
+                        extra_cols.update(v.get("match_extra_cols_index_list"))
+                    kept_cols = [i for i in range(len(matched_df.columns)) if not (exclude_extra_cols and i in extra_cols)]
+                    new_col_index = {col: i for i, col in enumerate(kept_cols)}
+                    col_kinds = {i: "overall" for i in chunk_overall.get("match_extra_cols_index_list") or []}
+                    for condition_index, v in enumerate(chunk_detail.values()):
+                        for i in v.get("catch_cols_index_list") + v.get("match_extra_cols_index_list"):
+                            col_kinds[i] = "odd" if condition_index % 2 != 0 else "even"
+                    for color, kind in color_mapping.items():
+                        for i, col_kind in col_kinds.items():
+                            if col_kind == kind and i in new_col_index:
+                                worksheet.set_column(new_col_index[i], new_col_index[i], None, formats[color])
+                    worksheet.write_row(0, 0, [str(matched_df.columns[i]) for i in kept_cols])
+
+                # 逐行写入，主表匹配列中匹配到的单元格单独设置颜色
+                match_for_main_col = chunk_overall.get("match_for_main_col") or {}
+                matched_cells = {}  # {行位置: [列]}
+                if main_format is not None:
+                    for col_index, matched_index in match_for_main_col.items():
+                        for row_position in matched_df.index.get_indexer(matched_index):
+                            matched_cells.setdefault(row_position, []).append(col_index)
+                output_df = matched_df.iloc[:, kept_cols]
+                for row_position, values in enumerate(to_excel_rows(output_df)):
+                    worksheet.write_row(row_number, 0, values)
+                    for col_index in matched_cells.get(row_position, []):
+                        worksheet.write(row_number, new_col_index[col_index], values[new_col_index[col_index]], main_format)
+                    row_number += 1
+
+                # 汇总统计信息
+                total_length += len(chunk)
+                union_set_length += chunk_overall["union_set_length"]
+                intersection_set_length += chunk_overall["intersection_set_length"]
+                for match_id, v in chunk_detail.items():
+                    detail = detail_match_info.setdefault(match_id, {
+                        "time_cost": 0, "match_count": 0, "unmatch_count": 0, "no_content_count": 0,
+                        # 列的位置是结果文件中的位置（不写入匹配附加信息时，后面的列会前移）
+                        "catch_cols_index_list": [new_col_index[i] for i in v["catch_cols_index_list"] if i in new_col_index],
+                        "match_extra_cols_index_list": [new_col_index[i] for i in v["match_extra_cols_index_list"] if i in new_col_index],
+                    })
+                    detail["time_cost"] += v["time_cost"]
+                    detail["match_count"] += len(v["match_index_list"])
+                    detail["unmatch_count"] += len(v["unmatch_index_list"])
+                    detail["no_content_count"] += len(v["no_content_index_list"])
+                if "match_extra_cols_index_list" in chunk_overall and not exclude_extra_cols:
+                    overall_match_info["match_extra_cols"] = chunk_overall["match_extra_cols"]
+                    overall_match_info["match_extra_cols_index_list"] = [new_col_index[i] for i in chunk_overall["match_extra_cols_index_list"]]
+
+                # 预览只保留前几行
+                preview_length = sum(len(i) for i in preview_dfs)
+                if preview_length < preview_rows:
+                    preview_dfs.append(output_df.iloc[:preview_rows - preview_length])
+                    for col_index, matched_index in match_for_main_col.items():
+                        preview_index = matched_index[matched_index < preview_rows]  # 行索引在整个主表中连续，即行号
+                        col_index = new_col_index[col_index]
+                        preview_matched[col_index] = preview_matched[col_index].append(preview_index) \
+                            if col_index in preview_matched else preview_index
+                del matched_df, output_df, chunk
+                if progress_callback:
+                    progress_callback("主表分块", chunk_index + 1, max(chunk_count, chunk_index + 1))
+    finally:
+        workbook.close()
+
+    overall_match_info["union_set_length"] = union_set_length
+    overall_match_info["intersection_set_length"] = intersection_set_length
+    overall_match_info["union_set_present"] = round(union_set_length / total_length * 100, 2) if total_length else 0
+    overall_match_info["intersection_set_present"] = round(intersection_set_length / total_length * 100, 2) if total_length else 0
+    overall_match_info["match_for_main_col"] = preview_matched
+    overall_match_info["row_count"] = total_length
+    overall_match_info["output_path"] = output_path
+    preview_df = pd.concat(preview_dfs) if preview_dfs else pd.DataFrame()
+    return preview_df, overall_match_info, detail_match_info
@@ -0,0 +1,113 @@
+import os
+import tempfile
+
+import openpyxl
+import pandas as pd
+import pytest
+
+from yrx_project.scene.match_table import main, planner
+from yrx_project.scene.match_table.cache import match_cache
+from yrx_project.scene.match_table.const import KEY_TYPE_AUTO
+from yrx_project.scene.match_table.engine import HashMatchEngine
+from yrx_project.scene.match_table.main import match_table
+from yrx_project.scene.match_table.stream import stream_match_table
+from yrx_project.utils.df_util import iter_excel_file_chunks, ExcelChunkReader
+
+
+@pytest.fixture
+def number_conditions(make_conditions):
+    # 辅助表的匹配列是文字："1.0" 和 "1" 是不同的值，主表的数字转为字符串的方式不同时会匹配到不同的行
+    help_df = pd.DataFrame({"编号": ["1.0", "1", "2.0", "2", "3.0", "3"], "名称": ["b", "a", "d", "c", "f", "e"]})
+    return make_conditions(help_df, "编号", "名称")
+
+
+def test_stream_same_as_match_table_with_blank_cell(number_conditions):
+    """整数列中有空单元格时（整表读取为 float），没有空单元格的分块也要和整表匹配的结果一致"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        main_path = os.path.join(temp_dir, "主表.xlsx")
+        wb = openpyxl.Workbook()
+        for row in [["编号", "序号"], [1, 1], [2, 2], [3, 3], [None, 4], [1, 5]]:
+            wb.active.append(row)
+        wb.save(main_path)
+
+        match_cache.clear()
+        expected, _, _ = match_table(pd.read_excel(main_path), number_conditions)
+        match_cache.clear()
+        streamed, overall_match_info, _ = stream_match_table(
+            main_path, "Sheet", 1, number_conditions, os.path.join(temp_dir, "结果.xlsx"), chunk_size=2,
+        )
+        assert streamed["辅助表%%名称"].tolist()[:3] == ["b", "d", "f"]
+        pd.testing.assert_frame_equal(streamed, expected, check_dtype=False)
+        assert overall_match_info["row_count"] == len(expected)
+
+
+def test_stream_key_type_resolved_for_whole_sheet(number_conditions):
+    """auto 的匹配值类型按整个主表决定：主表有文字时整列按字符串匹配，不因为某个分块中恰好都是数字而按数字匹配"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        main_path = os.path.join(temp_dir, "主表.xlsx")
+        wb = openpyxl.Workbook()
+        for row in [["编号"], [1], [2], ["x"], [1]]:
+            wb.active.append(row)
+        wb.save(main_path)
+        conditions = [dict(
+            number_conditions[0], df=pd.DataFrame({"编号": [1.5, 1.0], "名称": ["a", "b"]}), key_type=KEY_TYPE_AUTO,
+        )]
+
+        match_cache.clear()
+        expected, _, _ = match_table(pd.read_excel(main_path), conditions)
+        match_cache.clear()
+        streamed, _, _ = stream_match_table(main_path, "Sheet", 1, conditions, os.path.join(temp_dir, "结果.xlsx"), chunk_size=2)
+        assert streamed["辅助表%%匹配附加信息（文字）"].tolist() == ["未匹配到"] * 4
+        pd.testing.assert_frame_equal(streamed, expected, check_dtype=False)
+
+
+def test_stream_builds_helper_index_once(monkeypatch, number_conditions):
+    """辅助表的统计和索引在读取分块之前建立一次，每个分块不再重新统计辅助表和建索引"""
+    calls = {"stats": 0, "build": 0}
+
+    def count(name, func):
+        def wrapper(*args, **kwargs):
+            calls[name] += 1
+            return func(*args, **kwargs)
+        return wrapper
+
+    monkeypatch.setattr(main, "estimate_helper_stats", count("stats", planner.estimate_helper_stats))
+    monkeypatch.setattr(planner, "estimate_helper_stats", main.estimate_helper_stats)
+    monkeypatch.setattr(HashMatchEngine, "build", count("build", HashMatchEngine.build))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        main_path = os.path.join(temp_dir, "主表.xlsx")
+        wb = openpyxl.Workbook()
+        for row in [["编号"], ["1"], ["2"], ["3"], ["4"], ["1"]]:
+            wb.active.append(row)
+        wb.save(main_path)
+
+        match_cache.clear()
+        streamed, _, detail_match_info = stream_match_table(
+            main_path, "Sheet", 1, number_conditions, os.path.join(temp_dir, "结果.xlsx"), chunk_size=2,
+        )
+        assert streamed["辅助表%%名称"].tolist() == ["a", "c", "e", "", "a"]
+        assert detail_match_info["辅助表"]["match_count"] == 4
+        assert calls == {"stats": 1, "build": 1}
+
+
+@pytest.mark.parametrize("rows", [
+    [["a", "b"], [1, 2, 3], [4, 5]],  # 标题行之外的单元格：pd.read_excel 保留为 Unnamed: 2 列
+    [["name"], ["a"], [None], ["b"], ["c"]],  # 只有一列时中间的空行
+    [["a", None, "c"], [1, None, None], [None, None, None], [None, 2, None, None, "x"]],
+    [["a"], [None], [None, None, 1], [None]],  # 只有空行的分块
+])
+@pytest.mark.parametrize("chunk_size", [1, 2, 100])
+def test_iter_excel_file_chunks_same_as_read_excel(rows, chunk_size):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "主表.xlsx")
+        wb = openpyxl.Workbook()
+        for row in rows:
+            wb.active.append(row)
+        wb.save(path)
+
+        expected = pd.read_excel(path)
+        chunks = pd.concat(iter_excel_file_chunks(path, "Sheet", 1, chunk_size))
+        pd.testing.assert_frame_equal(chunks, expected)
+        with ExcelChunkReader(path, "Sheet", 1, chunk_size) as reader:
+            usecols = expected.columns[-1:]
+            pd.testing.assert_frame_equal(pd.concat(reader.iter_chunks(usecols=usecols)), expected[usecols])
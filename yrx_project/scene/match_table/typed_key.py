@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+from yrx_project.scene.match_table.const import KEY_TYPE_STR, KEY_TYPE_AUTO, KEY_TYPE_NUMBER, KEY_TYPE_DATE
+from yrx_project.utils.time_obj import parse_date_series
+
+# 解析后的匹配值类型：主表和辅助表的同一个匹配列一起决定，两边转换成同一个类型
+TYPED_INT = "int"  # Int64：所有的数字都是整数（1.0 也算）
+TYPED_FLOAT = "float"  # float64
+TYPED_DATE = "date"  # datetime64，只保留日期
+KEY_TYPE_NAME_MAP = {KEY_TYPE_STR: "字符串", TYPED_INT: "整数", TYPED_FLOAT: "小数", TYPED_DATE: "日期"}  # 展示名称
+
+NUMBER_INFERRED_TYPES = {"integer", "floating", "mixed-integer-float", "decimal"}
+DATE_INFERRED_TYPES = {"datetime", "datetime64", "date"}
+
+
+def is_number_col(col: pd.Series) -> bool:
+    """数字列：数字类型（不含布尔），或者所有非空值都是数字的 object 列（从 excel 读取的混合列）"""
+    if pd.api.types.is_bool_dtype(col):
+        return False
+    if pd.api.types.is_numeric_dtype(col):
+        return True
+    return col.dtype == object and col.notna().any() and pd.api.types.infer_dtype(col, skipna=True) in NUMBER_INFERRED_TYPES
+
+
+def is_date_col(col: pd.Series) -> bool:
+    """日期列：日期类型，或者所有非空值都是日期对象的 object 列"""
+    if pd.api.types.is_datetime64_any_dtype(col):
+        return True
+    return col.dtype == object and col.notna().any() and pd.api.types.infer_dtype(col, skipna=True) in DATE_INFERRED_TYPES
+
+
+def is_date_str_col(col: pd.Series) -> bool:
+    """所有非空值都是 TimeObj 可以解析的日期字符串"""
+    if col.dtype != object or not col.notna().any() or pd.api.types.infer_dtype(col, skipna=True) != "string":
+        return False
+    return not parse_date_series(col)[col.notna()].isna().any()
+
+
+def to_number_series(col: pd.Series) -> pd.Series:
+    """转成 float64，无法转换的为 NaN"""
+    if pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col):
+        return col.astype(np.float64)
+    return pd.to_numeric(col, errors="coerce").astype(np.float64)
+
+
+def resolve_key_type(main_col: pd.Series, helper_col: pd.Series, key_type: str = KEY_TYPE_STR) -> str:
+    """根据选项和两边匹配列的内容，决定一个匹配列按什么类型匹配：KEY_TYPE_STR / TYPED_INT / TYPED_FLOAT / TYPED_DATE
+    auto 只在两边都是原生的数字（或者日期）时按类型匹配；一边是日期，另一边全部是日期字符串时也按日期匹配
+    已经决定的类型（TYPED_INT / TYPED_FLOAT / TYPED_DATE，如流式匹配时按整个主表决定的）直接使用
+    """
+    if not key_type or key_type == KEY_TYPE_STR:
+        return KEY_TYPE_STR
+    if key_type in (TYPED_INT, TYPED_FLOAT, TYPED_DATE):
+        return key_type
+    if key_type == KEY_TYPE_AUTO:
+        main_is_date, helper_is_date = is_date_col(main_col), is_date_col(helper_col)
+        if is_number_col(main_col) and is_number_col(helper_col):
+            key_type = KEY_TYPE_NUMBER
+        elif (main_is_date or helper_is_date) and \
+                (main_is_date or is_date_str_col(main_col)) and (helper_is_date or is_date_str_col(helper_col)):
+            key_type = KEY_TYPE_DATE
+        else:
+            return KEY_TYPE_STR
+    if key_type == KEY_TYPE_DATE:
+        return TYPED_DATE
+    if key_type != KEY_TYPE_NUMBER:
+        raise ValueError(f"unknown key_type: {key_type}")
+    # 两边所有的数字都是整数时用 Int64（避免浮点数的误差，超过 int64 范围的用 float64）
+    values = np.concatenate([to_number_series(main_col).to_numpy(), to_number_series(helper_col).to_numpy()])
+    values = values[~np.isnan(values)]
+    if np.all(np.isfinite(values)) and np.all(values == np.round(values)) and np.all(np.abs(values) < 2 ** 63):
+        return TYPED_INT
+    return TYPED_FLOAT
+
+
+def to_typed_key(col: pd.Series, typed: str) -> pd.Series:
+    """按 resolve_key_type 的结果转换匹配列，空值和无法转换的值为 NA（无内容）"""
+    if typed == TYPED_INT:
+        return to_number_series(col).astype("Int64")
+    if typed == TYPED_FLOAT:
+        return to_number_series(col)
+    if typed == TYPED_DATE:
+        return parse_date_series(col)
+    raise ValueError(f"unknown typed key: {typed}")
@@ -0,0 +1,145 @@
+import collections
+import sys
+import threading
+import typing
+
+import numpy as np
+import pandas as pd
+
+from yrx_project.utils.file import get_file_fingerprint
+
+
+def get_object_size(obj) -> int:
+    """估算对象占用的内存（字节）"""
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(index=True, deep=True))
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if hasattr(obj, "memory_usage"):
+        return int(obj.memory_usage())
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(get_object_size(i) for i in obj)
+    return sys.getsizeof(obj)
+
+
+class SizedLRUCache:
+    """按内存大小淘汰的 LRU 缓存：总大小超过 max_bytes 时，淘汰最久没有使用的内容
+
+    单个超过 max_bytes 的内容不会被缓存
+    """
+    def __init__(self, max_bytes: int, sizeof: typing.Callable[[typing.Any], int] = get_object_size):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.cur_bytes = 0
+        self.data = collections.OrderedDict()  # key -> (value, size)
+        self.lock = threading.RLock()
+        # 统计：命中、未命中、因为超过 max_bytes 被淘汰的次数
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key) -> bool:
+        with self.lock:
+            return key in self.data
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def keys(self) -> list:
+        with self.lock:
+            return list(self.data)
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.data:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.data.move_to_end(key)
+            return self.data[key][0]
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        with self.lock:
+            self.pop(key)
+            if size > self.max_bytes:
+                return value
+            self.data[key] = (value, size)
+            self.cur_bytes += size
+            while self.cur_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.data.popitem(last=False)
+                self.cur_bytes -= evicted_size
+                self.evictions += 1
+        return value
+
+    def get_or_set(self, key, func: typing.Callable[[], typing.Any]):
+        """有缓存时直接返回，否则调用 func 计算并缓存；key 为 None 时不走缓存"""
+        if key is None:
+            return func()
+        with self.lock:
+            if key in self.data:
+                return self.get(key)
+            self.misses += 1
+        return self.set(key, func())
+
+    def pop(self, key, default=None):
+        with self.lock:
+            if key not in self.data:
+                return default
+            value, size = self.data.pop(key)
+            self.cur_bytes -= size
+            return value
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.cur_bytes = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "entries": len(self.data), "cur_bytes": self.cur_bytes, "max_bytes": self.max_bytes,
+            }
+
+
+class FileCache(SizedLRUCache):
+    """按文件缓存读取的结果：key 是 (文件的绝对路径, 读取参数...)
+
+    每次访问时检查文件的指纹（大小 + 修改时间），文件被修改后，这个文件的所有缓存都失效并立即释放
+    """
+    def __init__(self, max_bytes: int, sizeof: typing.Callable[[typing.Any], int] = get_object_size):
+        super(FileCache, self).__init__(max_bytes, sizeof)
+        self.fingerprints = {}  # 文件的绝对路径 -> 缓存时的文件指纹
+        self.invalidations = 0
+
+    def make_key(self, path: str, *parts) -> typing.Optional[tuple]:
+        """检查文件是否被修改，返回缓存的key；文件不存在时返回 None（不走缓存）"""
+        try:
+            fingerprint = get_file_fingerprint(path)
+        except (OSError, TypeError, ValueError):
+            return None
+        abs_path = fingerprint[0]
+        with self.lock:
+            if self.fingerprints.get(abs_path) != fingerprint:
+                self.invalidate(abs_path)
+                self.fingerprints[abs_path] = fingerprint
+        return (abs_path, ) + parts
+
+    def invalidate(self, abs_path: str):
+        with self.lock:
+            for key in [key for key in self.data if key[0] == abs_path]:
+                self.pop(key)
+                self.invalidations += 1
+            self.fingerprints.pop(abs_path, None)
+
+    def clear(self):
+        with self.lock:
+            super(FileCache, self).clear()
+            self.fingerprints.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(super(FileCache, self).stats(), invalidations=self.invalidations)
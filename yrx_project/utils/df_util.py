@@ -1,14 +1,29 @@
+import functools
 import os
+import pickle
+import tempfile
 import typing
-import uuid
-from functools import lru_cache
-from multiprocessing import Pool, cpu_count, Manager
+import zipfile
+from xml.etree import ElementTree
+from multiprocessing import Manager
 
+import numpy as np
 import pandas as pd
 import xlrd
+from pandas.io.parsers import TextParser
+from openpyxl.cell.cell import ERROR_CODES
 from openpyxl.reader.excel import load_workbook
 from openpyxl.worksheet.merge import MergedCellRange
 
+from yrx_project.utils import excel_disk_cache
+from yrx_project.utils.cache_util import FileCache
+from yrx_project.utils.file import file_size_format
+from yrx_project.utils.process_pool import run_in_process_pool, CancelToken
+
+# 读取结果（df、工作表名、列名）的内存缓存，按 memory_usage(deep=True) 计算大小，文件被修改后自动失效
+EXCEL_READ_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+excel_read_cache = FileCache(EXCEL_READ_CACHE_MAX_BYTES)
+
 
 # d = Manager().dict()  # 创建一个可以在多个进程之间共享的字典
 
@@ -37,20 +52,21 @@ def all_empty(*values):
     return True
 
 
-@lru_cache(maxsize=None)
-def read_excel_file(path, sheet_name, row_num_for_column, nrows, with_merged_cells, *args, **kwargs) -> pd.DataFrame:
+def read_excel_file(path, sheet_name, row_num_for_column, nrows, with_merged_cells, usecols=None, *args, **kwargs) -> pd.DataFrame:
     """
     :param path:
     :param sheet_name:
     :param row_num_for_column:
     :param nrows:
     :param with_merged_cells:
+    :param usecols: 只读取这些列（列名，见 normalize_usecols），None 表示所有列
     :return: [{
         "path": "",
         "sheet_name": "",
         "row_num_for_column": 0,
         "nrows": 1,
-        "with_merged_cells": False
+        "with_merged_cells": False,
+        "usecols": None,
     }]
     """
     # if str((path, sheet_name, row_num_for_column, nrows)) in d:
@@ -62,57 +78,358 @@ def read_excel_file(path, sheet_name, row_num_for_column, nrows, with_merged_cel
     header = None
     if row_num_for_column is not None:
         header = int(row_num_for_column) - 1
+    usecols = None if with_merged_cells else normalize_usecols(usecols)  # 合并单元格的位置按所有列计算，不能只读部分列
+    # 先读磁盘缓存（按文件内容和读取参数），程序重启后或者 use_cache=False 时也不需要重新解析
+    cache_key = excel_disk_cache.make_sheet_cache_key(path, sheet_name, row_num_for_column, nrows, with_merged_cells, usecols)
+    df = load_cached_excel_file(cache_key, with_merged_cells)
+    if df is None and usecols is not None:
+        # 磁盘缓存中有整个工作表时，只加载需要的列
+        full_cache_key = excel_disk_cache.make_sheet_cache_key(path, sheet_name, row_num_for_column, nrows, with_merged_cells)
+        df = load_cached_excel_file(full_cache_key, with_merged_cells, usecols)
+    if df is not None:
+        return df
     try:
-        df = pd.read_excel(path, sheet_name=sheet_name, header=header, nrows=nrows)
+        df = pd.read_excel(
+            path, sheet_name=sheet_name, header=header, nrows=nrows,
+            usecols=None if usecols is None else functools.partial(is_col_in, usecols=frozenset(usecols)),
+        )
     except Exception as e:
         return pd.DataFrame()
+    merged_cells = None
     if with_merged_cells:
         wb = load_workbook(filename=path)
         # 选择要操作的sheet
         sheet = wb[sheet_name]
         # 获取所有合并单元格的信息
-        merged_cells = sheet.merged_cells.ranges
+        merged_cells = [(i.min_row, i.min_col, i.max_row, i.max_col) for i in sheet.merged_cells.ranges]
         df.merged_cells = MergedCells(merged_cells)
+    excel_disk_cache.save_sheet(cache_key, df, merged_cells)
     # d[str(("df", path, sheet_name, row_num_for_column, nrows))] = df
     return df
 
 
-@lru_cache(maxsize=None)
+def normalize_usecols(usecols) -> typing.Optional[tuple]:
+    """需要读取的列：排好序、去重后的列名（字符串），用作缓存的key；None 或者空表示所有列"""
+    if not usecols:
+        return None
+    return tuple(sorted({str(col) for col in usecols}))
+
+
+def is_col_in(col, usecols: frozenset) -> bool:
+    return str(col) in usecols
+
+
+def project_columns(df: pd.DataFrame, usecols: typing.Collection[str]) -> pd.DataFrame:
+    """从读取了更多列的 df 中取出需要的列（保持工作表中的顺序）"""
+    return df.loc[:, [str(col) in usecols for col in df.columns]]
+
+
+def load_cached_excel_file(cache_key, with_merged_cells, usecols=None) -> typing.Optional[pd.DataFrame]:
+    cached = excel_disk_cache.load_sheet(cache_key, usecols)
+    if cached is None:
+        return None
+    df, merged_cells = cached
+    if with_merged_cells:
+        df.merged_cells = MergedCells(merged_cells)
+    return df
+
+
+def read_excel_file_in_worker(path, sheet_name, row_num_for_column, nrows, with_merged_cells, usecols=None) -> tuple:
+    """在子进程中读取工作表，返回 (磁盘缓存的key, 需要加载的列, df)
+    结果已经在磁盘缓存（Arrow IPC 文件）中时只返回key，主进程内存映射读取，不需要序列化整个 df 传回主进程
+    """
+    df = read_excel_file(path, sheet_name, row_num_for_column, nrows, with_merged_cells, usecols)
+    usecols = None if with_merged_cells else normalize_usecols(usecols)
+    cache_key = excel_disk_cache.make_sheet_cache_key(path, sheet_name, row_num_for_column, nrows, with_merged_cells, usecols)
+    if excel_disk_cache.has_sheet(cache_key):
+        return cache_key, None, None
+    full_cache_key = excel_disk_cache.make_sheet_cache_key(path, sheet_name, row_num_for_column, nrows, with_merged_cells)
+    if usecols is not None and excel_disk_cache.has_sheet(full_cache_key):
+        return full_cache_key, usecols, None
+    return None, None, df
+
+
+def load_worker_result(result: tuple, args: tuple) -> pd.DataFrame:
+    cache_key, usecols, df = result
+    if cache_key is None:
+        return df
+    df = load_cached_excel_file(cache_key, with_merged_cells=args[4], usecols=usecols)
+    if df is None:  # 缓存文件在读取前被淘汰了（很少见），在主进程重新读取
+        df = read_excel_file(*args)
+    return df
+
+
 def read_excel_sheets(path, *args, **kwargs) -> typing.List[str]:
-    # path = file_config.get("path")
-    # if str(("sheets", path, sheet_name, row_num_for_column, nrows)) in d:
-    #     return d[str(("sheets", path, sheet_name, row_num_for_column, nrows))]
-    sheet_names = pd.ExcelFile(path).sheet_names
-    # d[str(("sheets", path, sheet_name, row_num_for_column, nrows))] = sheet_names
+    """工作簿中的工作表名，不解析工作表的内容，耗时和工作表的大小无关
+    xlsx：只解析压缩包中的 xl/workbook.xml
+    xls：xlrd 按需加载（on_demand），只读取工作簿的目录
+    """
+    try:
+        if zipfile.is_zipfile(path):
+            return read_xlsx_sheet_names(path)
+        wb = xlrd.open_workbook(path, on_demand=True)
+        try:
+            return wb.sheet_names()
+        finally:
+            wb.release_resources()
+    except Exception:  # 格式不标准的文件，用完整的引擎读取
+        return pd.ExcelFile(path).sheet_names
+
+
+def read_xlsx_sheet_names(path) -> typing.List[str]:
+    """按 xl/workbook.xml 中 <sheets> 的顺序返回工作表名（和 Excel 中标签的顺序一致）"""
+    with zipfile.ZipFile(path) as zf:
+        with zf.open("xl/workbook.xml") as f:
+            sheet_names = []
+            for _, element in ElementTree.iterparse(f):
+                tag = element.tag.rsplit("}", 1)[-1]  # 去掉命名空间
+                if tag == "sheet":
+                    sheet_names.append(element.get("name"))
+                elif tag == "sheets":  # <sheets> 之后的内容（定义的名称、计算属性等）不需要解析
+                    break
+    if not sheet_names:
+        raise ValueError(f"no sheets found in workbook.xml: {path}")
     return sheet_names
 
 
-@lru_cache(maxsize=None)
 def read_excel_columns(path, sheet_name, row_num_for_column, *args, **kwargs) -> typing.List[str]:
-    # path = file_config.get("path")
-    # sheet_name = file_config.get("sheet_name")
-    # row_num_for_column = file_config.get("row_num_for_column")
-    # if str(("columns", path, sheet_name, row_num_for_column, nrows)) in d:
-    #     return d[str(("columns", path, sheet_name, row_num_for_column, nrows))]
+    """标题行中所有非空的列名（字符串，用于下拉选项），和 pd.read_excel 的列名一致（重复的列名加上 .1 .2 后缀）"""
+    header = read_excel_header(path, sheet_name, row_num_for_column)
+    columns = make_unique_columns([value for _, value in header])
+    return [str(col) for (_, value), col in zip(header, columns) if is_not_empty(value)]
+
+
+def read_excel_header(path, sheet_name, row_num_for_column) -> typing.List[typing.Tuple[int, typing.Any]]:
+    """读取标题行的所有单元格：[(列号（从1开始）, 值)]，到最后一个非空的单元格为止
+    xlsx：只读模式从前往后解析工作表，读到标题行就停止，不随机访问单元格（只读模式下每次随机访问都会重新解析）
+    xls：xlrd 按需加载，只加载这一个工作表
+    """
+    row_num_for_column = int(row_num_for_column or 1)
+    if zipfile.is_zipfile(path):
+        wb = load_workbook(filename=path, read_only=True, data_only=True)
+        try:
+            ws = wb[sheet_name]
+            ws.reset_dimensions()  # 不依赖文件中记录的工作表范围（可能不准确），读取整行
+            row = next(ws.iter_rows(min_row=row_num_for_column, max_row=row_num_for_column, values_only=True), ())
+        finally:
+            wb.close()
+    else:
+        wb = xlrd.open_workbook(path, on_demand=True)
+        try:
+            sheet = wb.sheet_by_name(sheet_name)
+            row = sheet.row_values(row_num_for_column - 1) if row_num_for_column <= sheet.nrows else []
+            row = [None if value == "" else value for value in row]  # xlrd 的空单元格是空字符串
+        finally:
+            wb.release_resources()
+    row = list(row)
+    while row and is_empty(row[-1]):  # 和 pd.read_excel 一样去掉右侧的空列
+        row.pop()
+    return [(col, value) for col, value in enumerate(row, start=1)]
+
+
+def get_excel_row_count(path, sheet_name) -> int:
+    """工作表的行数（含标题行），xlsx 只读取工作表的 dimension，不加载数据"""
     if path.endswith(".xlsx"):
-        # 加载工作簿
         wb = load_workbook(filename=path, read_only=True)
-        # 获取第一个工作表
-        ws = wb[sheet_name]
-        # 读取特定的行
-        row_data = [ws.cell(int(row_num_for_column), col).value for col in range(1, 100) if ws.cell(int(row_num_for_column), col).value]
-    else:
-        # 打开工作簿
-        wb = xlrd.open_workbook(path)
-        # 获取第一个工作表
-        sheet = wb.sheet_by_name(sheet_name)
-        # 读取特定的行
-        row_data = sheet.row_values(int(row_num_for_column) - 1)
-    # d[str(("columns", path, sheet_name, row_num_for_column, nrows))] = row_data
-    return [str(i) for i in row_data]
+        try:
+            return wb[sheet_name].max_row or 0
+        finally:
+            wb.close()
+    return xlrd.open_workbook(path, on_demand=True).sheet_by_name(sheet_name).nrows
+
+
+def convert_excel_cell(value):
+    """和 pd.read_excel（openpyxl）一致地转换单元格的值：空单元格为空字符串，错误值为 NaN，整数的小数转为整数"""
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else value
+    if isinstance(value, str) and value in ERROR_CODES:
+        return np.nan
+    return value
+
+
+def make_unique_columns(header: typing.Iterable) -> typing.List:
+    """和 pd.read_excel 的标题一致（使用 pandas 解析标题的逻辑）：
+    空标题为 Unnamed: i，重复的标题加上 .1 .2 后缀（跳过已经存在的列名），数字等非字符串的标题保持原值
+    """
+    header = [convert_excel_cell(value) for value in header]
+    if not header:
+        return []
+    return TextParser([header], header=0).read().columns.tolist()
+
 
+def iter_excel_file_chunks(path, sheet_name, row_num_for_column, chunk_size) -> typing.Iterator[pd.DataFrame]:
+    """按行分块读取工作表，每次只有一个分块在内存中（行索引在整个工作表中连续），见 ExcelChunkReader"""
+    with ExcelChunkReader(path, sheet_name, row_num_for_column, chunk_size) as reader:
+        yield from reader.iter_chunks()
+
+
+class ExcelChunkReader:
+    """按行分块读取工作表，每次只有一个分块在内存中（行索引在整个工作表中连续），可以多次遍历
+    xlsx 使用 openpyxl 的只读模式逐行读取；xls 最多 65536 行，整表读取后再分块
+
+    每一列的类型和 pd.read_excel 整表读取时一致（如整数列在其他分块中有空值时，所有分块都是 float），
+    否则同一个值在不同的分块中转为字符串的结果不同（1 和 1.0），匹配结果和整表匹配不一致：
+    进入 with 时读取工作表（只读取一次），用 pandas 的解析器解析每个分块，记录每列的类型，原始的行暂存到临时文件；
+    遍历时从临时文件中重新解析，转为整表的类型
+
+    with ExcelChunkReader(path, sheet_name, 1, 10000) as reader:
+        for chunk in reader.iter_chunks():
+            ...
+    """
+    def __init__(self, path, sheet_name, row_num_for_column, chunk_size):
+        self.path, self.sheet_name, self.chunk_size = path, sheet_name, chunk_size
+        self.header_row = int(row_num_for_column or 1)
+        self.columns = []
+        self.df = None  # xls：整表
+        self.temp_dir = None
+        self.chunk_paths = []
+        self.targets = []  # 每一列整表的类型，None 表示整列都是空值
+
+    def __enter__(self) -> 'ExcelChunkReader':
+        if not self.path.endswith(".xlsx"):
+            self.df = pd.read_excel(self.path, sheet_name=self.sheet_name, header=self.header_row - 1)
+            self.columns = self.df.columns.tolist()
+            return self
+        self.temp_dir = tempfile.TemporaryDirectory()
+        try:
+            self.spool()
+        except Exception:
+            self.temp_dir.cleanup()
+            raise
+        return self
 
-def read_excel_file_with_multiprocessing(file_configs, only_sheet_name=False, only_column_name=False, use_cache=True):
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.temp_dir is not None:
+            self.temp_dir.cleanup()
+            self.temp_dir = None
+
+    def spool(self):
+        chunk_dtypes, has_null = [], []
+        wb = load_workbook(filename=self.path, read_only=True, data_only=True)
+        try:
+            ws = wb[self.sheet_name]
+            ws.reset_dimensions()  # 和 pd.read_excel 一样不依赖文件中记录的工作表范围
+            rows = ws.iter_rows(min_row=self.header_row, values_only=True)
+            header = trim_excel_row(list(next(rows, ())), None)
+            # 和 pd.read_excel 一样：列数是标题行和所有数据行中最宽的（每行末尾的空单元格不算），标题行之外的列是 Unnamed: N
+            width, chunk = len(header), []
+
+            def spool_chunk():
+                chunk_path = os.path.join(self.temp_dir.name, f"{len(self.chunk_paths)}.pkl")
+                with open(chunk_path, "wb") as f:
+                    pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+                # 这个分块中没有值的列（在更后面的行中才出现的列）类型为 None，都是空值
+                chunk_width = max([len(row) for row in chunk] + [1])
+                df = parse_excel_rows([pad_excel_row(row, chunk_width) for row in chunk], list(range(chunk_width)))
+                self.chunk_paths.append(chunk_path)
+                null_counts = df.isna().sum().tolist()
+                chunk_dtypes.append([None if null_count == len(df) else dtype for dtype, null_count in zip(df.dtypes, null_counts)])
+                has_null.extend([len(self.chunk_paths) > 1] * (chunk_width - len(has_null)))  # 新出现的列在前面的分块中都是空值
+                for i in range(len(has_null)):
+                    has_null[i] = has_null[i] or (null_counts[i] > 0 if i < chunk_width else len(df) > 0)
+
+            blank_rows = 0  # 和 pd.read_excel 一样：中间的空行保留（全部为空值），末尾的空行去掉
+            for row in rows:
+                row = trim_excel_row([convert_excel_cell(value) for value in row], "")
+                if not row:
+                    blank_rows += 1
+                    continue
+                width = max(width, len(row))
+                for converted_row in [[]] * blank_rows + [row]:
+                    chunk.append(converted_row)
+                    if len(chunk) >= self.chunk_size:
+                        spool_chunk()
+                        chunk = []
+                blank_rows = 0
+            if chunk or not self.chunk_paths:
+                spool_chunk()
+        finally:
+            wb.close()
+
+        self.columns = make_unique_columns(header + [None] * (width - len(header)))
+        self.targets = [
+            unify_chunk_dtypes([dtypes[i] if i < len(dtypes) else None for dtypes in chunk_dtypes], has_null[i] if i < len(has_null) else True)
+            for i in range(width)
+        ]
+
+    def iter_chunks(self, usecols: typing.Collection = None) -> typing.Iterator[pd.DataFrame]:
+        """
+        :param usecols: 只解析这些列（列名），默认所有列
+        """
+        positions = list(range(len(self.columns)))
+        if usecols is not None:
+            positions = [i for i, col in enumerate(self.columns) if col in set(usecols)]
+        if self.df is not None:
+            for start in range(0, len(self.df), self.chunk_size):
+                yield self.df.iloc[start:start + self.chunk_size, positions]
+            return
+
+        width = len(self.columns)
+        object_cols = {i for i in positions if self.targets[i] == object}
+        start = 0
+        for chunk_path in self.chunk_paths:
+            with open(chunk_path, "rb") as f:
+                chunk = pickle.load(f)
+            # 整表是 object 的列不做类型转换（和整表解析一样，保留原始的值），其他列转为整表的类型
+            df = parse_excel_rows(
+                [pad_excel_row(row, width) for row in chunk], self.columns, dtype={i: object for i in object_cols}, usecols=positions
+            )
+            for df_position, i in enumerate(positions):
+                target = self.targets[i]
+                if target is not None and i not in object_cols and df.dtypes.iloc[df_position] != target:
+                    df.isetitem(df_position, df.iloc[:, df_position].astype(target))
+            df.index = pd.RangeIndex(start, start + len(chunk))
+            start += len(chunk)
+            yield df
+
+
+def trim_excel_row(row: list, empty_value) -> list:
+    """去掉行末尾的空单元格"""
+    while row and row[-1] == empty_value:
+        row.pop()
+    return row
+
+
+def pad_excel_row(row: list, width: int) -> list:
+    return row + [""] * (width - len(row))
+
+
+def parse_excel_rows(rows: list, columns: list, dtype: dict = None, usecols: typing.List[int] = None) -> pd.DataFrame:
+    """用 pd.read_excel 的解析器解析行（空字符串为空值，数字形式的文字转为数字等）
+    :param usecols: 只解析这些位置的列，默认所有列
+    """
+    usecols = list(range(len(columns))) if usecols is None else usecols
+    if not rows:
+        return pd.DataFrame(columns=[columns[i] for i in usecols])
+    # 只有一列时，空行（[""]）也是一行，不能跳过
+    return TextParser(
+        rows, header=None, names=list(range(len(columns))), dtype=dtype, usecols=usecols, skip_blank_lines=False
+    ).read().set_axis([columns[i] for i in usecols], axis=1)
+
+
+def unify_chunk_dtypes(dtypes: list, has_null: bool):
+    """一列在所有分块中的类型 -> 整表解析时的类型（和 pandas 的推断一致），None 表示不需要转换（所有分块都是空值）
+    :param dtypes: 每个分块中的类型，这个分块全部是空值时为 None
+    :param has_null: 这一列是否有空值
+    """
+    dtypes = [dtype for dtype in dtypes if dtype is not None]
+    if not dtypes:
+        return None
+    kinds = {dtype.kind for dtype in dtypes}
+    if kinds == {"M"}:
+        return dtypes[0]
+    if kinds == {"i"} and not has_null:
+        return np.dtype("int64")
+    if kinds == {"b"} and not has_null:
+        return np.dtype("bool")
+    if kinds <= {"i", "f"} or kinds == {"b"} or kinds == {"b", "f"}:  # 整数或者布尔有空值时为 float（和 pd.read_excel 一致）
+        return np.dtype("float64")
+    return object
+
+
+def read_excel_file_with_multiprocessing(file_configs, only_sheet_name=False, only_column_name=False, use_cache=True, cancel_token: CancelToken = None):
     """
     :param file_configs:
         [{
@@ -121,36 +438,82 @@ def read_excel_file_with_multiprocessing(file_configs, only_sheet_name=False, on
             "row_num_for_column": 0,  # 标题行
             "nrows": 1,
             "with_merged_cells": False,
+            "usecols": ["a", "b"],  # 只读取这些列，默认所有列
         }]
     :param only_sheet_name:
     :param only_column_name:
-    :param use_cache: 是否读缓存，默认是
+    :param use_cache: 是否使用内存缓存，默认是；文件被修改后缓存自动失效
+    :param cancel_token: 取消标记（见 CancelToken），读取多个文件时取消后抛出 CancelledError
     :return:
     """
-    seed = None
-    if not use_cache:
-        seed = uuid.uuid4().hex
-    func = read_excel_file
+    func, kind = read_excel_file, "df"
     if only_sheet_name:
-        func = read_excel_sheets
+        func, kind = read_excel_sheets, "sheets"
     elif only_column_name:
-        func = read_excel_columns
-
-    if len(file_configs) == 1:
-        config = file_configs[0]
-        return [func(config.get("path"), config.get("sheet_name"), config.get("row_num_for_column") or 1, config.get("nrows"), config.get("with_merged_cells"), seed)]
+        func, kind = read_excel_columns, "columns"
 
     file_configs_list = [
-        (config.get("path"), config.get("sheet_name"), config.get("row_num_for_column") or 1, config.get("nrows"), config.get("with_merged_cells"), seed) for config
-        in file_configs]
-
-    # 多于1个用多进程
-    num_cores = cpu_count()  # 获取CPU的核心数
-    with Pool(processes=min(num_cores, len(file_configs))) as pool:  # 创建一个包含4个进程的进程池
-        results = pool.starmap(func, file_configs_list)  # 将函数和参数列表传递给进程池
+        (config.get("path"), config.get("sheet_name"), config.get("row_num_for_column") or 1, config.get("nrows"), config.get("with_merged_cells"),
+         None if config.get("with_merged_cells") else normalize_usecols(config.get("usecols")))
+        for config in file_configs
+    ]
+    # use_cache=False 时既不读缓存也不写缓存，读取的结果不会留在内存中
+    cache_keys = [None] * len(file_configs_list)
+    if use_cache:
+        cache_keys = [make_read_cache_key(kind, *args) for args in file_configs_list]
+    results = [get_read_cache(key) if key is not None else None for key in cache_keys]
+    missing = [i for i, (key, result) in enumerate(zip(cache_keys, results)) if key is None or result is None]
+    if not missing:
+        return results
+
+    if len(missing) == 1 or only_sheet_name:  # 读取工作表名只需要几毫秒，不用启动进程
+        missing_results = [func(*file_configs_list[i]) for i in missing]
+    elif kind == "df":
+        # 多于1个用常驻的进程池，df 通过 Arrow IPC 文件传回主进程
+        missing_args = [file_configs_list[i] for i in missing]
+        worker_results = run_in_process_pool(read_excel_file_in_worker, missing_args, cancel_token=cancel_token)
+        missing_results = [load_worker_result(result, args) for result, args in zip(worker_results, missing_args)]
+    else:
+        missing_results = run_in_process_pool(func, [file_configs_list[i] for i in missing], cancel_token=cancel_token)
+    for i, result in zip(missing, missing_results):
+        if cache_keys[i] is not None:
+            excel_read_cache.set(cache_keys[i], result)
+        results[i] = result
     return results
 
 
+def make_read_cache_key(kind, path, sheet_name=None, row_num_for_column=None, nrows=None, with_merged_cells=None, usecols=None) -> typing.Optional[tuple]:
+    """读取缓存的key：(文件的绝对路径, 读取的内容, 读取参数)，工作表名和文件的其他参数无关
+    df 的最后一个参数是读取的列（见 normalize_usecols），None 表示所有列
+    """
+    if kind == "sheets":
+        return excel_read_cache.make_key(path, kind)
+    if kind == "columns":
+        return excel_read_cache.make_key(path, kind, sheet_name, row_num_for_column)
+    return excel_read_cache.make_key(path, kind, sheet_name, row_num_for_column, nrows, bool(with_merged_cells), usecols)
+
+
+def get_read_cache(cache_key: tuple):
+    """读取内存缓存；只读取部分列的 df 没有缓存时，用同一个工作表读取了更多列（或者所有列）的缓存"""
+    result = excel_read_cache.get(cache_key)
+    if result is not None or cache_key[1] != "df" or cache_key[-1] is None:
+        return result
+    usecols = set(cache_key[-1])
+    for key in excel_read_cache.keys():
+        if key[:-1] == cache_key[:-1] and (key[-1] is None or usecols.issubset(key[-1])):
+            wider = excel_read_cache.get(key)
+            if wider is not None:
+                return project_columns(wider, usecols)
+    return None
+
+
+def get_read_cache_status_text() -> str:
+    """读取缓存的统计，显示在状态栏"""
+    stats = excel_read_cache.stats()
+    return f"读取缓存：命中{stats['hits']}次，未命中{stats['misses']}次，淘汰{stats['evictions']}次，失效{stats['invalidations']}次，" \
+           f"占用{file_size_format(stats['cur_bytes'])}"
+
+
 MERGED_CELLS_TYPE = typing.Union[typing.List[MergedCellRange], typing.List[tuple]]
 
 
@@ -0,0 +1,38 @@
+import os
+import tempfile
+
+import openpyxl
+import pandas as pd
+
+from yrx_project.utils.df_util import make_unique_columns, read_excel_columns, read_excel_header
+
+# 标题中有空的单元格、重复的列名，以及和去重后缀冲突的列名（a.1）
+HEADER = [None, "a", None, "a", 3, "a.1"]
+
+
+def write_workbook(path, rows):
+    wb = openpyxl.Workbook()
+    for row in rows:
+        wb.active.append(row)
+    wb.save(path)
+
+
+def test_make_unique_columns_same_as_read_excel():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "header.xlsx")
+        write_workbook(path, [HEADER, [1, 2, 3, 4, 5, 6]])
+        expected = pd.read_excel(path).columns.tolist()
+        assert expected == ["Unnamed: 0", "a", "Unnamed: 2", "a.2", 3, "a.1"]
+        assert make_unique_columns(HEADER) == expected
+        assert make_unique_columns([value for _, value in read_excel_header(path, "Sheet", 1)]) == expected
+
+
+def test_read_excel_columns_maps_to_read_excel_columns():
+    """下拉选项中的每个列名，都能对应到 pd.read_excel 读出来的同一列"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "header.xlsx")
+        write_workbook(path, [HEADER, [1, 2, 3, 4, 5, 6]])
+        df = pd.read_excel(path)
+        columns = read_excel_columns(path, "Sheet", 1)
+        assert columns == ["a", "a.2", "3", "a.1"]
+        assert [df.iloc[0, [str(col) for col in df.columns].index(col)] for col in columns] == [2, 4, 5, 6]
@@ -0,0 +1,197 @@
+import hashlib
+import os
+import pickle
+import threading
+import typing
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from yrx_project.const import TEMP_PATH
+from yrx_project.utils.file import get_file_fingerprint
+from yrx_project.utils.logger import logger
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # 没有安装 pyarrow 时不使用磁盘缓存，每次都重新解析
+    pa = None
+else:
+    ARROW_ERRORS = (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError)
+
+# 解析后的工作表缓存到磁盘（Arrow IPC 格式，可以内存映射读取），程序重启后再次打开同一个文件时不需要重新解析 xlsx
+EXCEL_CACHE_PATH = os.path.join(TEMP_PATH, "excel_cache")
+EXCEL_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 超过后淘汰最久没有使用的
+EXCEL_CACHE_SUFFIX = ".arrow"
+EXCEL_CACHE_VERSION = 1  # 缓存的格式变化时修改，旧的缓存自然失效
+
+COLUMNS_META_KEY = b"yrx_columns"  # 原始的列名（可能是数字、日期，arrow 的列名只能是字符串）
+MERGED_CELLS_META_KEY = b"yrx_merged_cells"
+# 无法转换为 arrow 的列（如一列中同时有数字和文字）：整列 pickle 后放在元数据中（key 是前缀 + arrow 的列名），arrow 中只是一个空列
+PICKLED_COLUMN_META_PREFIX = b"yrx_pickled:"
+
+_content_hashes = {}  # 文件指纹 -> 内容的哈希，同一个文件在一次运行中只计算一次
+_lock = threading.Lock()
+
+
+def is_enabled() -> bool:
+    return pa is not None
+
+
+def get_file_content_hash(path: str) -> str:
+    fingerprint = get_file_fingerprint(path)
+    with _lock:
+        if fingerprint in _content_hashes:
+            return _content_hashes[fingerprint]
+    content_hash = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            content_hash.update(block)
+    with _lock:
+        _content_hashes[fingerprint] = content_hash.hexdigest()
+    return _content_hashes[fingerprint]
+
+
+def make_sheet_cache_key(path: str, sheet_name, row_num_for_column, nrows, with_merged_cells=False, usecols=None) -> typing.Optional[str]:
+    """缓存的key：文件的路径、大小、修改时间、内容的哈希 + 工作表、标题行、读取的行数、读取的列；无法缓存时返回 None
+    :param usecols: 只读取了部分列时，排好序的列名（tuple），None 表示所有列
+    """
+    if not is_enabled() or not path or not os.path.isfile(path):
+        return None
+    abs_path, size, mtime = get_file_fingerprint(path)
+    parts = (EXCEL_CACHE_VERSION, abs_path, size, mtime, get_file_content_hash(path), sheet_name, row_num_for_column, nrows,
+             bool(with_merged_cells))
+    if usecols is not None:
+        parts += (tuple(usecols), )
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+
+def get_cache_file_path(cache_key: str) -> str:
+    return os.path.join(EXCEL_CACHE_PATH, cache_key + EXCEL_CACHE_SUFFIX)
+
+
+def has_sheet(cache_key: typing.Optional[str]) -> bool:
+    return cache_key is not None and os.path.exists(get_cache_file_path(cache_key))
+
+
+def load_sheet(cache_key: typing.Optional[str], usecols=None) -> typing.Optional[typing.Tuple[pd.DataFrame, typing.Optional[list]]]:
+    """读取缓存的工作表：(df, 合并单元格)，没有缓存时返回 None
+    通过内存映射读取，数值列不需要复制
+    :param usecols: 只读取这些列（按列名的字符串匹配），其他列不会被加载到内存
+    """
+    if cache_key is None:
+        return None
+    cache_file_path = get_cache_file_path(cache_key)
+    if not os.path.exists(cache_file_path):
+        return None
+    try:
+        with pa.memory_map(cache_file_path) as source:
+            table = pa.ipc.open_file(source).read_all()
+        metadata = table.schema.metadata or {}
+        columns = pickle.loads(metadata[COLUMNS_META_KEY])
+        if usecols is not None:
+            positions = [i for i, col in enumerate(columns) if str(col) in set(usecols)]
+            table, columns = table.select(positions), [columns[i] for i in positions]
+        df = table.to_pandas()
+        for i, name in enumerate(table.column_names):
+            pickled_key = PICKLED_COLUMN_META_PREFIX + name.encode("utf-8")
+            if pickled_key in metadata:
+                df.isetitem(i, pd.Series(pickle.loads(metadata[pickled_key]), index=df.index, dtype=object))
+        df.columns = columns
+        merged_cells = pickle.loads(metadata[MERGED_CELLS_META_KEY]) if MERGED_CELLS_META_KEY in metadata else None
+    except Exception:  # 缓存文件损坏时删掉，重新解析
+        remove_file(cache_file_path)
+        return None
+    try:
+        os.utime(cache_file_path)  # 修改时间作为最近使用的时间，用于淘汰
+    except OSError:
+        pass
+    # 和 pd.read_excel 一致：object 列的空值是 NaN（arrow 读出来是 None）
+    for i in [i for i, dtype in enumerate(df.dtypes) if dtype == object]:
+        df.isetitem(i, df.iloc[:, i].where(df.iloc[:, i].notna(), np.nan))
+    return df, merged_cells
+
+
+def to_arrow_table(df: pd.DataFrame) -> typing.Tuple['pa.Table', typing.Dict[bytes, bytes]]:
+    """df 转换为 arrow 的表，列名为 c0, c1, ...
+    无法转换的 object 列（如同时有数字和文字）单独 pickle，返回 {元数据的key: pickle 后的列}，其他的列照常转换
+    """
+    df = df.set_axis([f"c{i}" for i in range(len(df.columns))], axis=1)
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False), {}
+    except ARROW_ERRORS:
+        pass
+    pickled_cols = {}
+    for name, dtype in df.dtypes.items():
+        if dtype != object:
+            continue
+        try:
+            pa.array(df[name], from_pandas=True)
+        except ARROW_ERRORS:
+            pickled_cols[name] = pickle.dumps(df[name].to_numpy(), protocol=pickle.HIGHEST_PROTOCOL)
+    table = pa.Table.from_pandas(df.assign(**{name: None for name in pickled_cols}), preserve_index=False)
+    return table, {PICKLED_COLUMN_META_PREFIX + name.encode("utf-8"): data for name, data in pickled_cols.items()}
+
+
+def save_sheet(cache_key: typing.Optional[str], df: pd.DataFrame, merged_cells: list = None):
+    """缓存解析后的工作表，无法转换为 arrow 的列单独 pickle 保存（见 to_arrow_table）"""
+    if cache_key is None:
+        return
+    try:
+        table, pickled_cols = to_arrow_table(df)
+    except ARROW_ERRORS as e:
+        logger.warn(f"工作表无法缓存到磁盘（{cache_key}）：{e}\n")
+        return
+    if pickled_cols:
+        logger.info(f"工作表中 {len(pickled_cols)} 列无法转换为 arrow，按 pickle 缓存（{cache_key}）\n")
+    metadata = dict(table.schema.metadata or {})
+    metadata.update(pickled_cols)
+    metadata[COLUMNS_META_KEY] = pickle.dumps(list(df.columns))
+    if merged_cells is not None:
+        metadata[MERGED_CELLS_META_KEY] = pickle.dumps(list(merged_cells))
+    table = table.replace_schema_metadata(metadata)
+
+    os.makedirs(EXCEL_CACHE_PATH, exist_ok=True)
+    cache_file_path = get_cache_file_path(cache_key)
+    temp_file_path = f"{cache_file_path}.{uuid.uuid4().hex}.tmp"  # 先写临时文件再重命名，避免读到写了一半的文件
+    try:
+        with pa.OSFile(temp_file_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(temp_file_path, cache_file_path)
+    except OSError as e:
+        logger.warn(f"工作表无法缓存到磁盘（{cache_key}）：{e}\n")
+        remove_file(temp_file_path)
+        return
+    evict()
+
+
+def evict(max_bytes: int = EXCEL_CACHE_MAX_BYTES):
+    """缓存目录超过 max_bytes 时，按最近使用的时间淘汰"""
+    if not os.path.isdir(EXCEL_CACHE_PATH):
+        return
+    entries = []
+    for entry in os.scandir(EXCEL_CACHE_PATH):
+        if entry.is_file() and entry.name.endswith(EXCEL_CACHE_SUFFIX):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        remove_file(path)
+        total_bytes -= size
+
+
+def clear():
+    if os.path.isdir(EXCEL_CACHE_PATH):
+        for entry in os.scandir(EXCEL_CACHE_PATH):
+            remove_file(entry.path)
+
+
+def remove_file(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+
+from yrx_project.utils import excel_disk_cache
+
+
+def test_mixed_column_is_cached_per_column(tmp_path, monkeypatch):
+    """一列中同时有数字和文字时，只有这一列按 pickle 缓存，其他列照常是 arrow 列，读取的结果和原来的一致"""
+    monkeypatch.setattr(excel_disk_cache, "EXCEL_CACHE_PATH", str(tmp_path))
+    df = pd.DataFrame({
+        "编号": [1, 2, 3],
+        "混合": [1, "a", np.nan],
+        3: ["x", np.nan, "z"],
+    })
+    excel_disk_cache.save_sheet("mixed", df)
+    assert excel_disk_cache.has_sheet("mixed")
+
+    loaded, merged_cells = excel_disk_cache.load_sheet("mixed")
+    pd.testing.assert_frame_equal(loaded, df)
+    assert loaded["混合"].tolist()[:2] == [1, "a"]
+    assert merged_cells is None
+
+    projected, _ = excel_disk_cache.load_sheet("mixed", usecols=("混合", "3"))
+    pd.testing.assert_frame_equal(projected, df[["混合", 3]])
@@ -76,6 +76,12 @@ def get_file_detail(file_path: str) -> FileDetail:
     )
 
 
+def get_file_fingerprint(file_path: str) -> tuple:
+    """文件的指纹：绝对路径 + 大小 + 修改时间，文件被修改后指纹会变化，用作缓存的key"""
+    stat = os.stat(file_path)
+    return os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns
+
+
 def open_file_or_folder(file_or_folder_path):
     """模拟双击打开的操作
     win：File Explorer
@@ -0,0 +1,182 @@
+import atexit
+import collections
+import importlib
+import pickle
+import threading
+import typing
+from concurrent.futures import ProcessPoolExecutor, CancelledError, Future, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import cpu_count, shared_memory
+
+# 常驻的进程池：第一次使用时创建，之后复用，避免每次执行都重新启动进程（windows 下启动进程很慢）
+_pool = None
+_pool_lock = threading.Lock()
+
+CANCEL_CHECK_INTERVAL = 0.2  # 等待结果时，检查是否被取消的间隔（秒）
+
+# 子进程中已经加载过的共享对象：共享内存的名称 -> 对象，同一次执行的多个分块只需要反序列化一次
+_loaded_objects = collections.OrderedDict()
+MAX_LOADED_OBJECTS = 4
+
+
+def get_process_pool(max_workers: int = None) -> ProcessPoolExecutor:
+    """获取常驻的进程池，进程池损坏（如子进程被杀掉）时重新创建"""
+    global _pool
+    with _pool_lock:
+        if _pool is None or getattr(_pool, "_broken", False):
+            _pool = ProcessPoolExecutor(max_workers=max_workers or cpu_count())
+        return _pool
+
+
+def shutdown_process_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown_process_pool)
+
+
+def import_modules(module_names: typing.Iterable[str]):
+    for module_name in module_names:
+        importlib.import_module(module_name)
+
+
+def warm_up_process_pool(module_names: typing.Iterable[str] = ()):
+    """提前启动常驻的进程池，并在子进程中导入模块（windows 下每个子进程都要重新导入 pandas、openpyxl，很慢）
+    不等待完成，程序启动时调用，第一次读取或者匹配时进程已经准备好
+    """
+    pool = get_process_pool()
+    for _ in range(pool._max_workers):
+        pool.submit(import_modules, tuple(module_names))
+
+
+class CancelToken:
+    """一次执行的取消标记，由发起执行的一方创建，随参数传递给提交任务的函数（不依赖提交任务的线程）
+    取消后：进程池中还没有开始的任务不再执行，等待结果的线程抛出 CancelledError
+    已经开始执行的任务无法中断，执行完后结果被丢弃
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._futures = set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            self._event.set()
+            for future in self._futures:
+                future.cancel()
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise CancelledError()
+
+    def add_futures(self, futures: typing.Iterable[Future]):
+        with self._lock:
+            self._futures.update(futures)
+            if self._event.is_set():  # 取消之后才提交的任务
+                for future in futures:
+                    future.cancel()
+
+    def remove_futures(self, futures: typing.Iterable[Future]):
+        with self._lock:
+            self._futures.difference_update(futures)
+
+
+def is_picklable(obj) -> bool:
+    """自定义的函数（如 lambda）无法传递到子进程"""
+    try:
+        pickle.dumps(obj)
+        return True
+    except Exception:
+        return False
+
+
+class SharedObject:
+    """将对象序列化后放到共享内存中，所有的子进程按名称读取，而不是每个任务都序列化一次
+
+    with SharedObject(engine) as shared:
+        pool.submit(func, shared.name, shared.size, ...)
+    """
+    def __init__(self, obj):
+        data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        self.size = len(data)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(self.size, 1))
+        self.shm.buf[:self.size] = data
+        self.name = self.shm.name
+
+    def close(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def __enter__(self) -> 'SharedObject':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def load_shared_object(name: str, size: int):
+    """在子进程中读取共享内存中的对象，同一个对象只反序列化一次"""
+    if name in _loaded_objects:
+        _loaded_objects.move_to_end(name)
+        return _loaded_objects[name]
+    # 共享内存由主进程负责释放（unlink），子进程读取后只需要 close
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        obj = pickle.loads(shm.buf[:size])
+    finally:
+        shm.close()
+    _loaded_objects[name] = obj
+    while len(_loaded_objects) > MAX_LOADED_OBJECTS:
+        _loaded_objects.popitem(last=False)
+    return obj
+
+
+def run_in_process_pool(
+        func: typing.Callable, args_list: typing.List[tuple],
+        progress_callback: typing.Callable[[int, int], None] = None, cancel_token: CancelToken = None
+) -> list:
+    """在常驻进程池中执行多个任务，按提交的顺序返回结果
+
+    :param func: 模块级的函数（需要可以被子进程导入）
+    :param args_list: 每个任务的参数
+    :param progress_callback: 每完成一个任务回调一次 (已完成的个数, 总个数)
+    :param cancel_token: 取消标记，取消后抛出 CancelledError
+    """
+    if cancel_token is not None:
+        cancel_token.raise_if_cancelled()
+    pool = get_process_pool()
+    try:
+        futures = [pool.submit(func, *args) for args in args_list]
+    except BrokenProcessPool:
+        shutdown_process_pool()
+        pool = get_process_pool()
+        futures = [pool.submit(func, *args) for args in args_list]
+    if cancel_token is not None:
+        cancel_token.add_futures(futures)
+    results = [None] * len(futures)
+    future_index = {future: i for i, future in enumerate(futures)}
+    not_done, done_count = set(futures), 0
+    try:
+        while not_done:
+            done, not_done = wait(not_done, timeout=CANCEL_CHECK_INTERVAL, return_when=FIRST_COMPLETED)
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            for future in done:
+                results[future_index[future]] = future.result()
+                done_count += 1
+                if progress_callback:
+                    progress_callback(done_count, len(futures))
+    finally:
+        if cancel_token is not None:
+            cancel_token.remove_futures(futures)
+    return results
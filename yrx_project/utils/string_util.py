@@ -1,7 +1,9 @@
+import difflib
 import re
 import string
 import typing
 
+import numpy as np
 import pandas as pd
 
 
@@ -12,13 +14,22 @@ IGNORE_CHINESE_PAREN = "中文括号及其内容"
 IGNORE_ENGLISH_PAREN = "英文括号及其内容"
 
 
+# 预编译的正则和翻译表，避免每个单元格都重新构建
+CHINESE_PAREN_PATTERN = re.compile(r'（.*?）')
+ENGLISH_PAREN_PATTERN = re.compile(r'\(.*?\)')
+# 定义中文标点符号
+CHINESE_PUNCTUATION = '，。、；：？！《》（）【】『』「」“”‘’—…'
+# 创建一个翻译表，该表指定要删除的所有中英文标点符号和空格
+PUNCTUATION_AND_SPACES_TRANSLATOR = str.maketrans('', '', string.punctuation + CHINESE_PUNCTUATION + ' ')
+
+
 def remove_chinese_paren(text: str) -> str:
-    cleaned_text = re.sub(r'（.*?）', '', text)
+    cleaned_text = CHINESE_PAREN_PATTERN.sub('', text)
     return cleaned_text
 
 
 def remove_english_paren(text: str) -> str:
-    cleaned_text = re.sub(r'\(.*?\)', '', text)
+    cleaned_text = ENGLISH_PAREN_PATTERN.sub('', text)
     return cleaned_text
 
 
@@ -26,15 +37,8 @@ def remove_punctuation_and_spaces(text):
     if pd.isna(text):
         return ""
     text = str(text)
-
-    # 定义中文标点符号
-    chinese_punctuation = '，。、；：？！《》（）【】『』「」“”‘’—…'
-    # 合并英文和中文标点符号
-    all_punctuation = string.punctuation + chinese_punctuation
-    # 创建一个翻译表，该表指定要删除的所有标点符号和空格
-    translator = str.maketrans('', '', all_punctuation + ' ')
     # 使用翻译表删除标点符号和空格
-    cleaned_text = text.translate(translator)
+    cleaned_text = text.translate(PUNCTUATION_AND_SPACES_TRANSLATOR)
     return cleaned_text
 
 
@@ -50,5 +54,93 @@ def remove_by_ignore_policy(text: str, match_ignore_policy: typing.List[str]) ->
     return text
 
 
+def remove_by_ignore_policy_for_series(series: pd.Series, match_ignore_policy: typing.List[str]) -> pd.Series:
+    """整列处理，结果和逐个单元格调用 remove_by_ignore_policy 一致
+    先去重，只处理不重复的值，再映射回每一行（匹配列通常有大量的重复值）
+    """
+    if len(match_ignore_policy) == 0 or IGNORE_NOTHING in match_ignore_policy:
+        return series
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)  # 空值也作为一个值处理，和逐个单元格调用一致
+    cleaned_uniques = np.empty(len(uniques), dtype=object)
+    cleaned_uniques[:] = [remove_by_ignore_policy(i, match_ignore_policy) for i in uniques]
+    return pd.Series(cleaned_uniques[codes], index=series.index, name=series.name, dtype=object)
+
+
+def get_similarity(a: str, b: str) -> float:
+    """两个字符串的相似度（0~1）：2 * 匹配到的字符数 / 两个字符串的总长度"""
+    return difflib.SequenceMatcher(None, a, b).ratio()
+
+
+def get_char_tokens(text: str) -> typing.List[tuple]:
+    """将字符串拆成 (字符, 第几次出现)，两个字符串 token 的交集大小 = 共同的字符个数（按出现次数计）"""
+    char_count = {}
+    tokens = []
+    for char in text:
+        char_count[char] = char_count.get(char, 0) + 1
+        tokens.append((char, char_count[char]))
+    return tokens
+
+
+class AhoCorasickAutomaton:
+    """多模式串匹配自动机：一次扫描文本，找出文本中出现过的所有模式串
+
+    patterns 中的空字符串不会进入自动机（空字符串被任何文本包含，需要调用方单独处理）
+    """
+    def __init__(self, patterns: typing.List[str]):
+        self.goto = [{}]  # 每个节点的转移
+        self.fail = [0]  # 失配指针
+        self.output = [[]]  # 在该节点结束的模式串id
+        self.output_link = [0]  # 沿着失配指针，最近的一个有输出的节点（0表示没有）
+        for pattern_id, pattern in enumerate(patterns):
+            if pattern:
+                self.__insert(pattern, pattern_id)
+        self.__build_fail()
+
+    def __insert(self, pattern: str, pattern_id: int):
+        node = 0
+        for char in pattern:
+            next_node = self.goto[node].get(char)
+            if next_node is None:
+                next_node = len(self.goto)
+                self.goto[node][char] = next_node
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.output_link.append(0)
+            node = next_node
+        self.output[node].append(pattern_id)
+
+    def __build_fail(self):
+        queue = list(self.goto[0].values())  # 第一层的失配指针都指向根节点
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for char, next_node in self.goto[node].items():
+                queue.append(next_node)
+                fail = self.fail[node]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(char, 0)
+                self.fail[next_node] = fail
+                self.output_link[next_node] = fail if self.output[fail] else self.output_link[fail]
+
+    def search(self, text: str) -> typing.Set[int]:
+        found = set()
+        visited = set()  # 已经收集过输出的节点，其输出链不需要再走一遍
+        node = 0
+        goto, fail, output, output_link = self.goto, self.fail, self.output, self.output_link
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            out_node = node
+            while out_node and out_node not in visited:
+                visited.add(out_node)
+                found.update(output[out_node])
+                out_node = output_link[out_node]
+        return found
+
+
 if __name__ == '__main__':
-    print(remove_punctuation_and_spaces("你好，我是一    个机器人。   "))
\ No newline at end of file
+    print(remove_punctuation_and_spaces("你好，我是一    个机器人。   "))
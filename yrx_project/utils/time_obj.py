@@ -3,9 +3,47 @@ import math
 import re
 import typing
 
+import pandas as pd
+
 from yrx_project.const import FULL_TIME_FORMATTER, DATE_FORMATTER, TIME_FORMATTER, POSITIVE_NUM_CHAR_MAPPING, \
     DATE_NUM_FORMATTER
 
+# TimeObj.date_str 支持的字符串格式：2024-01-01（可以带时间）、20240101、2024年1月1日
+DATE_STR_PATTERNS = [
+    r"^(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})",
+    r"^(?P<year>\d{4})(?P<month>\d{2})(?P<day>\d{2})$",
+    r"^(?P<year>\d{4})年(?P<month>\d{1,2})月(?P<day>\d{1,2})日$",
+]
+
+
+def parse_date_series(series: pd.Series) -> pd.Series:
+    """整列解析日期，支持的格式和 TimeObj 一致（日期对象，以及 DATE_STR_PATTERNS 中的字符串）
+    和 TimeObj 一样只保留日期（按天比较），无法解析的为 NaT
+    先去重，只解析不重复的值（日期列通常有大量的重复值），字符串用正则整列提取年月日
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.dt.normalize()
+    codes, uniques = pd.factorize(series)
+    if len(uniques) == 0:  # 全部为空（或者是空列）
+        return pd.Series(pd.NaT, index=series.index, name=series.name, dtype="datetime64[ns]")
+    uniques = pd.Series(uniques, dtype=object)
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype="datetime64[ns]")
+
+    is_date = uniques.map(lambda v: isinstance(v, (datetime.date, datetime.datetime))).to_numpy(dtype=bool)
+    if is_date.any():
+        parsed[is_date] = pd.to_datetime(uniques[is_date], errors="coerce").dt.normalize()
+    is_str = uniques.map(lambda v: isinstance(v, str)).to_numpy(dtype=bool)
+    if is_str.any():
+        str_uniques = uniques[is_str].str.strip()
+        parts = pd.DataFrame(index=str_uniques.index, columns=["year", "month", "day"], dtype=object)
+        for pattern in DATE_STR_PATTERNS:
+            parts = parts.combine_first(str_uniques.str.extract(pattern))
+        parsed[is_str] = pd.to_datetime(parts.astype(float), errors="coerce")
+
+    result = parsed.to_numpy()[codes]
+    result[codes < 0] = None
+    return pd.Series(result, index=series.index, name=series.name, dtype="datetime64[ns]")
+
 
 class TimeObj:
     def __init__(self, raw_time=None, **kwargs):
@@ -0,0 +1,21 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from yrx_project.utils.time_obj import parse_date_series
+
+
+def test_parse_date_series():
+    series = pd.Series(["2024-01-02 10:00:00", "20240102", "2024年1月2日", datetime.date(2024, 1, 2), "x", np.nan], name="日期")
+    parsed = parse_date_series(series)
+    assert parsed.name == "日期"
+    assert parsed.iloc[:4].tolist() == [pd.Timestamp("2024-01-02")] * 4
+    assert parsed.iloc[4:].isna().all()
+
+
+def test_parse_date_series_all_null():
+    for series in [pd.Series([np.nan, None], dtype=object), pd.Series([], dtype=object)]:
+        parsed = parse_date_series(series)
+        assert parsed.dtype == "datetime64[ns]"
+        assert len(parsed) == len(series) and parsed.isna().all()